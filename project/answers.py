@@ -0,0 +1,103 @@
+from itertools import islice
+from typing import Hashable, Iterator, Sequence
+
+import numpy as np
+
+Block = tuple[np.ndarray, np.ndarray]
+
+CHUNK_SIZE = 1 << 16
+
+
+class Answers:
+    """
+    Lazily produced answers of a path query.
+
+    An engine hands over blocks of (source indices, target indices) as it
+    finds them, so iterating yields the first pairs before the query is
+    complete and the whole answer set never has to be held in memory.
+    Like any generator the answers can be consumed only once.
+    """
+
+    __slots__ = ("nodes", "_blocks", "_node_array")
+
+    def __init__(self, nodes: Sequence[Hashable] | np.ndarray, blocks: Iterator[Block]):
+        """
+        :param nodes: vertex values by index
+        :param blocks: index arrays of answer pairs, no pair may repeat
+        """
+        self.nodes = nodes.tolist() if isinstance(nodes, np.ndarray) else nodes
+        self._node_array = nodes if isinstance(nodes, np.ndarray) else None
+        self._blocks = blocks
+
+    def blocks(self) -> Iterator[Block]:
+        """
+        answers as vertex index arrays, see `nodes` for the vertex values
+        """
+        return self._blocks
+
+    def __iter__(self) -> Iterator[tuple[Hashable, Hashable]]:
+        nodes = self.nodes
+        for sources, targets in self._blocks:
+            for u, v in zip(sources.tolist(), targets.tolist()):
+                yield nodes[u], nodes[v]
+
+    def node_array(self) -> np.ndarray:
+        if self._node_array is None:
+            array = np.asarray(self.nodes)
+            if array.dtype.kind not in "iu" or array.ndim != 1:
+                array = np.empty(len(self.nodes), dtype=object)
+                array[:] = self.nodes
+            self._node_array = array
+        return self._node_array
+
+    def chunks(self, size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+        """
+        answers as arrays of shape (k, 2) with k <= size, holding vertex values
+        """
+        if size < 1:
+            raise ValueError(f"Chunk size must be positive, got {size}")
+        nodes = self.node_array()
+        pending: list[np.ndarray] = []
+        pending_rows = 0
+        for sources, targets in self._blocks:
+            block = np.stack([nodes[sources], nodes[targets]], axis=1)
+            while len(block):
+                taken = block[: size - pending_rows]
+                block = block[len(taken) :]
+                pending.append(taken)
+                pending_rows += len(taken)
+                if pending_rows == size:
+                    yield np.concatenate(pending)
+                    pending, pending_rows = [], 0
+        if pending_rows:
+            yield np.concatenate(pending)
+
+    def first(self, count: int) -> list[tuple[Hashable, Hashable]]:
+        """
+        at most count pairs, the engine stops as soon as they are found
+        """
+        return list(islice(self, count))
+
+    def to_set(self) -> set[tuple[Hashable, Hashable]]:
+        return set(self)
+
+
+def matrix_blocks(
+    matrix, starts: Sequence[int], finals: Sequence[int], batch_size: int = 1024
+) -> Iterator[Block]:
+    """
+    non-zeros of the start rows and final columns of a reachability matrix
+    :param matrix: sparse matrix over vertex indices
+    :param starts: row indices
+    :param finals: column indices
+    :param batch_size: number of rows read off at a time
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    finals = np.asarray(finals, dtype=np.int64)
+    if len(starts) == 0 or len(finals) == 0:
+        return
+    to_finals = matrix.tocsr()[:, finals]
+    for lo in range(0, len(starts), batch_size):
+        batch = starts[lo : lo + batch_size]
+        rows, cols = to_finals[batch].nonzero()
+        yield batch[rows], finals[cols]
@@ -0,0 +1,179 @@
+import sys
+from typing import Hashable, Iterable, Literal
+
+import numpy as np
+from scipy import sparse
+
+SparseFormat = Literal["csr", "csc", "lil", "dok"]
+FORMATS: tuple[str, ...] = ("csr", "csc", "lil", "dok")
+
+
+def check_format(format: str) -> SparseFormat:
+    if format not in FORMATS:
+        raise ValueError(
+            f"Unknown sparse format {format!r}, expected one of {', '.join(FORMATS)}"
+        )
+    return format
+
+
+def matrix_nbytes(matrix: sparse.spmatrix) -> int:
+    """
+    estimate the memory occupied by a sparse matrix
+    :param matrix: matrix in one of the supported formats
+    :return: number of bytes, exact for compressed formats and approximate otherwise
+    """
+    if matrix.format in ("csr", "csc", "coo"):
+        arrays = (
+            (matrix.data, matrix.indices, matrix.indptr)
+            if matrix.format != "coo"
+            else (matrix.data, matrix.row, matrix.col)
+        )
+        return sum(array.nbytes for array in arrays)
+    if matrix.format == "lil":
+        return (
+            matrix.rows.nbytes
+            + matrix.data.nbytes
+            + sum(sys.getsizeof(row) for row in matrix.rows)
+            + sum(sys.getsizeof(row) for row in matrix.data)
+        )
+    if matrix.format == "dok":
+        # hash table slot (hash, key, value) plus the boxed (row, col) key
+        entry_size = 3 * 8 + sys.getsizeof((0, 0)) + 2 * sys.getsizeof(0)
+        return sys.getsizeof({}) + matrix.nnz * entry_size
+    return matrix.data.nbytes
+
+
+class BoolDecomposition:
+    """
+    Boolean decomposition of an adjacency matrix: one sparse matrix per label.
+
+    Every matrix is kept in the format it was built in and converted on demand.
+    A conversion is done at most once per label and format, the result is cached
+    next to the original, so mixing formats between operations is cheap after
+    the first request.
+    """
+
+    def __init__(self, size: int, format: SparseFormat = "csr"):
+        self.size = size
+        self.format = check_format(format)
+        self._matrices: dict[Hashable, dict[str, sparse.spmatrix]] = {}
+
+    @classmethod
+    def from_edges(
+        cls,
+        size: int,
+        edges: dict[Hashable, tuple[Iterable[int], Iterable[int]]],
+        format: SparseFormat = "csr",
+    ) -> "BoolDecomposition":
+        """
+        build the decomposition from per-label coordinate lists
+        :param size: number of vertices (states)
+        :param edges: label -> (sources, targets)
+        :param format: format the matrices are stored in
+        :return: decomposition with a single copy of each matrix
+        """
+        decomposition = cls(size, format)
+        for label, (rows, cols) in edges.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            cols = np.asarray(cols, dtype=np.int64)
+            matrix = sparse.coo_matrix(
+                (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+                shape=(size, size),
+            )
+            decomposition[label] = matrix
+        return decomposition
+
+    def with_format(self, format: SparseFormat) -> "BoolDecomposition":
+        """
+        view of the same matrices with another default format, conversions
+        made through either of them are cached for both
+        """
+        view = BoolDecomposition(self.size, self.format)
+        view._matrices = self._matrices
+        view.format = check_format(format)
+        return view
+
+    def __contains__(self, label: Hashable) -> bool:
+        return label in self._matrices
+
+    def __iter__(self):
+        return iter(self._matrices)
+
+    def __len__(self) -> int:
+        return len(self._matrices)
+
+    def __getitem__(self, label: Hashable) -> sparse.spmatrix:
+        return self.get(label)
+
+    def __setitem__(self, label: Hashable, matrix: sparse.spmatrix) -> None:
+        """
+        replace the matrix of a label, dropping all of its cached conversions
+        """
+        if matrix.shape != (self.size, self.size):
+            raise ValueError(
+                f"Matrix of shape {matrix.shape} does not fit "
+                f"decomposition of size {self.size}"
+            )
+        self._matrices[label] = {
+            self.format: matrix.asformat(self.format).astype(np.bool_, copy=False)
+        }
+
+    def labels(self) -> set[Hashable]:
+        return set(self._matrices)
+
+    def items(self, format: SparseFormat | None = None):
+        for label in self._matrices:
+            yield label, self.get(label, format)
+
+    def get(self, label: Hashable, format: SparseFormat | None = None):
+        """
+        matrix of a label in the requested format
+        :param label: edge label
+        :param format: sparse format, the storage format by default
+        :return: cached matrix, converted on the first request
+        """
+        format = check_format(format or self.format)
+        copies = self._matrices[label]
+        if format not in copies:
+            # csr <-> csc is the cheapest conversion, prefer it as a source
+            source = copies.get("csr" if format == "csc" else "csc")
+            if source is None:
+                source = copies[self.format]
+            copies[format] = source.asformat(format)
+        return copies[format]
+
+    def backward(self, label: Hashable) -> sparse.csr_matrix:
+        """
+        transposed matrix of a label for backward steps
+        :param label: edge label
+        :return: row-major view of the transpose backed by the column-major copy
+        """
+        return self.get(label, "csc").transpose()
+
+    def union(self, format: SparseFormat | None = None) -> sparse.spmatrix:
+        """
+        adjacency matrix of all labels together
+        :param format: sparse format of the result
+        :return: Boolean sum of the per-label matrices
+        """
+        result = sparse.csr_matrix((self.size, self.size), dtype=np.bool_)
+        for label in self._matrices:
+            result = result + self.get(label, "csr")
+        return result.asformat(check_format(format or self.format))
+
+    def nnz(self) -> int:
+        return sum(self.get(label).nnz for label in self._matrices)
+
+    def memory_usage(self) -> dict[str, int]:
+        """
+        memory footprint of the stored matrices
+        :return: bytes per format, including the cached conversions
+        """
+        usage: dict[str, int] = {}
+        for copies in self._matrices.values():
+            for format, matrix in copies.items():
+                usage[format] = usage.get(format, 0) + matrix_nbytes(matrix)
+        return usage
+
+    def nbytes(self) -> int:
+        return sum(self.memory_usage().values())
@@ -0,0 +1,283 @@
+from collections import defaultdict
+from typing import Callable, Hashable, Iterable, Literal, NamedTuple
+
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG, Epsilon
+from pyformlang.finite_automaton import EpsilonNFA, State, Symbol
+from pyformlang.rsa import Box, RecursiveAutomaton
+
+from project.cfpq_pruning import rsm_footprint
+from project.cost_model import fit_costs, label_counts, load_cost_model
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_cache import pinned_graph_versions
+from project.query_stats import QueryStats, stats_or_disabled
+from project.rsm_optimizer import rsm_size
+from project.task6 import hellings_based_cfpq
+from project.task7 import matrix_based_cfpq
+from project.task8 import tensor_based_cfpq
+from project.task9 import gll_based_cfpq
+
+CfpqEngine = Literal["hellings", "matrix", "tensor", "gll"]
+CFPQ_ENGINES: tuple[str, ...] = ("hellings", "matrix", "tensor", "gll")
+
+
+class CfpqFeatures(NamedTuple):
+    """
+    Sizes of a context-free path query the engine costs are estimated from.
+
+    `edges` counts the graph edges whose labels the grammar can read.
+    `productions` is the number of binary productions of the weak normal
+    form, estimated from the body lengths without converting the grammar,
+    zero for a query given as an RSM. `sources` and `targets` are the
+    sizes of the start and final sets, the number of vertices for an
+    empty set.
+    """
+
+    vertices: int
+    edges: int
+    productions: int
+    rsm_states: int
+    rsm_transitions: int
+    sources: int
+    targets: int
+
+
+class CfpqCostModel(NamedTuple):
+    """
+    Seconds per unit of work of the CFPQ engines.
+
+    Hellings walks the edges once per vertex and binary production in
+    Python. The matrix engine multiplies a matrix per binary production,
+    the tensor engine closes the product of the graph and the RSM, both
+    for all pairs of vertices. GLL walks the edges once per RSM state and
+    start vertex. scripts/calibrate_cost_model.py fits the coefficients on
+    the local machine.
+    """
+
+    hellings_fixed: float = 1e-4
+    hellings_closure: float = 5e-7
+    matrix_fixed: float = 1e-3
+    matrix_edges: float = 1e-7
+    matrix_closure: float = 2e-9
+    tensor_fixed: float = 2e-3
+    tensor_edges: float = 1e-7
+    tensor_closure: float = 1e-9
+    gll_fixed: float = 1e-4
+    gll_edges: float = 1e-6
+    gll_sources: float = 5e-7
+
+
+class CfpqPlan(NamedTuple):
+    """
+    Engine cfpq runs a query with and the estimated seconds of every
+    engine it could run it with.
+    """
+
+    engine: CfpqEngine
+    costs: dict[str, float]
+
+
+def _hellings_work(features: CfpqFeatures) -> tuple[float, ...]:
+    return 1.0, features.productions * features.vertices * features.edges
+
+
+def _matrix_work(features: CfpqFeatures) -> tuple[float, ...]:
+    work = features.productions * features.edges
+    return 1.0, work, work * features.vertices
+
+
+def _tensor_work(features: CfpqFeatures) -> tuple[float, ...]:
+    work = features.rsm_transitions * features.edges
+    return 1.0, work, work * features.rsm_states * features.vertices
+
+
+def _gll_work(features: CfpqFeatures) -> tuple[float, ...]:
+    return (
+        1.0,
+        features.edges,
+        features.sources * features.rsm_states * features.edges,
+    )
+
+
+# engine -> offset of its coefficients in CfpqCostModel, work estimates
+_WORK: dict[str, tuple[int, Callable[[CfpqFeatures], tuple[float, ...]]]] = {
+    "hellings": (0, _hellings_work),
+    "matrix": (2, _matrix_work),
+    "tensor": (5, _tensor_work),
+    "gll": (8, _gll_work),
+}
+
+
+def cfg_to_boxes(cfg: CFG) -> RecursiveAutomaton:
+    """
+    recursive automaton with a minimal box per variable, built from the
+    productions without the text form, so any variable and terminal
+    values are kept
+    """
+    bodies: dict[Hashable, list[list[Hashable]]] = defaultdict(list)
+    for production in cfg.productions:
+        bodies[production.head.value].append(
+            [
+                symbol.value
+                for symbol in production.body
+                if not isinstance(symbol, Epsilon)
+            ]
+        )
+    start = cfg.start_symbol.value
+    boxes = set()
+    for head in bodies.keys() | {start}:
+        nfa = EpsilonNFA()
+        nfa.add_start_state(State("start"))
+        nfa.add_final_state(State("final"))
+        for i, body in enumerate(bodies.get(head, [])):
+            if not body:
+                # Epsilon of a grammar is an ordinary symbol for the automaton
+                nfa.add_final_state(State("start"))
+                continue
+            states = (
+                [State("start")]
+                + [State((i, k)) for k in range(1, len(body))]
+                + [State("final")]
+            )
+            for k, symbol in enumerate(body):
+                nfa.add_transition(states[k], Symbol(symbol), states[k + 1])
+        boxes.add(Box(nfa.minimize(), Symbol(head)))
+    return RecursiveAutomaton(initial_label=Symbol(start), boxes=boxes)
+
+
+def cfpq_features(
+    cfg: CFG | None,
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] | None,
+    final_nodes: set[int] | None,
+) -> CfpqFeatures:
+    """
+    sizes of a query, the label counts are cached
+    :param cfg: query grammar, None if the query is given as an RSM only
+    :param rsm: query recursive automaton
+    """
+    counts = label_counts(graph)
+    labels = rsm_footprint(rsm).labels
+    size = rsm_size(rsm)
+    vertices = graph.number_of_nodes()
+    productions = (
+        sum(max(len(production.body) - 1, 0) for production in cfg.productions)
+        if cfg is not None
+        else 0
+    )
+    return CfpqFeatures(
+        vertices,
+        sum(counts.get(label, 0) for label in labels),
+        productions,
+        size.states,
+        size.transitions,
+        len(start_nodes or ()) or vertices,
+        len(final_nodes or ()) or vertices,
+    )
+
+
+def _cost(coefficients: Iterable[float], work: Iterable[float]) -> float:
+    return sum(c * w for c, w in zip(coefficients, work))
+
+
+def plan_cfpq(
+    features: CfpqFeatures,
+    model: CfpqCostModel | None = None,
+    engines: Iterable[str] = CFPQ_ENGINES,
+) -> CfpqPlan:
+    """
+    choose the engine of a query
+    :param features: see cfpq_features
+    :param model: coefficients, the calibrated or default ones if None
+    :param engines: engines to choose from
+    :return: the engine with the smallest estimated cost
+    """
+    model = model or load_cost_model("cfpq", CfpqCostModel())
+    costs = {}
+    for engine in engines:
+        if engine not in _WORK:
+            raise ValueError(
+                f"Unknown CFPQ engine {engine!r}, "
+                f"expected one of {', '.join(CFPQ_ENGINES)}"
+            )
+        offset, work = _WORK[engine]
+        costs[engine] = _cost(model[offset:], work(features))
+    if not costs:
+        raise ValueError("No CFPQ engine to choose from")
+    return CfpqPlan(min(costs, key=costs.get), costs)
+
+
+# the features and the engine hash an unstamped graph once between them
+@pinned_graph_versions()
+def cfpq(
+    query: CFG | RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    model: CfpqCostModel | None = None,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    context-free path query by the engine plan_cfpq chooses for it
+    :param query: grammar, or recursive automaton which only the tensor
+        and GLL engines can run
+    :param graph: labelled graph
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :param model: see plan_cfpq
+    :param stats: gets the planning time, a count of the chosen engine, the
+        plan with its features and the measurements of the engine
+    :return: pairs of vertices connected by a path whose word is derived
+        from the start symbol
+    """
+    stats = stats_or_disabled(stats)
+    with stats.phase("plan"):
+        if isinstance(query, CFG):
+            cfg, rsm, engines = query, cfg_to_boxes(query), CFPQ_ENGINES
+            # an RSM cannot tell a call of a box from a terminal of the same name
+            variables = {variable.value for variable in query.variables}
+            if not variables.isdisjoint(terminal.value for terminal in query.terminals):
+                engines = ("hellings", "matrix")
+        else:
+            cfg, rsm, engines = None, query, ("tensor", "gll")
+        features = cfpq_features(cfg, rsm, graph, start_nodes, final_nodes)
+        plan = plan_cfpq(features, model, engines)
+    stats.count(f"plan_{plan.engine}")
+    stats.decide("cfpq", {**plan._asdict(), "features": features._asdict()})
+    if plan.engine == "hellings":
+        return hellings_based_cfpq(cfg, graph, start_nodes, final_nodes, stats=stats)
+    if plan.engine == "matrix":
+        return matrix_based_cfpq(cfg, graph, start_nodes, final_nodes, stats=stats)
+    if plan.engine == "tensor":
+        return tensor_based_cfpq(rsm, graph, start_nodes, final_nodes, stats=stats)
+    return gll_based_cfpq(rsm, graph, start_nodes, final_nodes, stats=stats)
+
+
+def fit_cfpq_model(
+    measurements: Iterable[tuple[CfpqFeatures, CfpqEngine, float]],
+    defaults: CfpqCostModel | None = None,
+) -> CfpqCostModel:
+    """
+    coefficients fitted to measured run times
+    :param measurements: features, engine and seconds of every run
+    :param defaults: coefficients of an engine that has no measurements
+    :return: model whose estimates are closest to the measured times
+    """
+    work: dict[str, list[tuple[float, ...]]] = {engine: [] for engine in _WORK}
+    seconds: dict[str, list[float]] = {engine: [] for engine in _WORK}
+    for features, engine, time in measurements:
+        if engine not in _WORK:
+            raise ValueError(
+                f"Unknown CFPQ engine {engine!r}, "
+                f"expected one of {', '.join(CFPQ_ENGINES)}"
+            )
+        work[engine].append(_WORK[engine][1](features))
+        seconds[engine].append(time)
+    coefficients = list(defaults or CfpqCostModel())
+    for engine, (offset, _) in _WORK.items():
+        if seconds[engine]:
+            fitted = fit_costs(work[engine], seconds[engine])
+            coefficients[offset : offset + len(fitted)] = fitted
+    return CfpqCostModel(*coefficients)
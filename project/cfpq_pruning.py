@@ -0,0 +1,259 @@
+from collections import defaultdict
+from typing import Callable, Hashable, Iterable, NamedTuple
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton, State, Symbol
+from pyformlang.rsa import RecursiveAutomaton
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from project.bool_decomposition import BoolDecomposition
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_cache import LRUCache, graph_version
+
+
+class Footprint(NamedTuple):
+    """
+    What a query grammar can read: the labels of its useful terminals and
+    whether it derives the empty word.
+    """
+
+    labels: frozenset[Hashable]
+    nullable: bool
+
+
+def cfg_footprint(cfg: CFG) -> Footprint:
+    """
+    terminals of the productions that are reachable from the start symbol
+    and productive
+    """
+    useful = cfg.remove_useless_symbols()
+    return Footprint(
+        frozenset(terminal.value for terminal in useful.terminals),
+        cfg.generate_epsilon(),
+    )
+
+
+Moves = dict[State, list[tuple[Hashable, State]]]
+
+
+def _moves(dfa: DeterministicFiniteAutomaton, backward: bool = False) -> Moves:
+    """
+    (label, state) pairs of the transitions leaving, or entering, every state
+    """
+    moves: Moves = defaultdict(list)
+    for source, edges in dfa.to_dict().items():
+        for symbol, target in edges.items():
+            if backward:
+                moves[target].append((symbol.value, source))
+            else:
+                moves[source].append((symbol.value, target))
+    return moves
+
+
+def _reached(
+    moves: Moves, states: Iterable[State], allowed: Callable[[Hashable], bool]
+) -> set[State]:
+    """
+    states reached from the given ones by moves with allowed labels
+    """
+    seen = set(states)
+    pending = list(seen)
+    while pending:
+        for label, target in moves.get(pending.pop(), ()):
+            if target not in seen and allowed(label):
+                seen.add(target)
+                pending.append(target)
+    return seen
+
+
+def _accepting(
+    boxes: dict[Hashable, DeterministicFiniteAutomaton],
+    moves: dict[Hashable, Moves],
+    terminals: bool,
+) -> set[Hashable]:
+    """
+    boxes accepting some word, or the empty word if terminals are not allowed
+    """
+    found: set[Hashable] = set()
+    changed = True
+    while changed:
+        changed = False
+        for name in boxes.keys() - found:
+            reached = _reached(
+                moves[name],
+                boxes[name].start_states,
+                lambda label: label in found or (terminals and label not in boxes),
+            )
+            if not reached.isdisjoint(boxes[name].final_states):
+                found.add(name)
+                changed = True
+    return found
+
+
+def rsm_footprint(rsm: RecursiveAutomaton) -> Footprint:
+    """
+    terminals on the paths of the boxes that take part in a derivation from
+    the initial one
+    """
+    boxes = {label.value: box.dfa for label, box in rsm.boxes.items()}
+    moves = {name: _moves(dfa) for name, dfa in boxes.items()}
+    start = rsm.initial_label.value
+    productive = _accepting(boxes, moves, terminals=True)
+    if start not in productive:
+        return Footprint(frozenset(), False)
+
+    def useful(label: Hashable) -> bool:
+        return label in productive or label not in boxes
+
+    labels: set[Hashable] = set()
+    called, pending = {start}, [start]
+    while pending:
+        name = pending.pop()
+        dfa = boxes[name]
+        forward = _reached(moves[name], dfa.start_states, useful)
+        backward = _reached(_moves(dfa, backward=True), dfa.final_states, useful)
+        for source in forward & backward:
+            for label, target in moves[name].get(source, ()):
+                if target not in backward or not useful(label):
+                    continue
+                if label not in boxes:
+                    labels.add(label)
+                elif label not in called:
+                    called.add(label)
+                    pending.append(label)
+    nullable = _accepting(boxes, moves, terminals=False)
+    return Footprint(frozenset(labels), start in nullable)
+
+
+PRUNED_CACHE: LRUCache[EdgeListGraph | MatrixIndex] = LRUCache(max_entries=32)
+
+
+def prune_graph(
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    footprint: Footprint,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+) -> EdgeListGraph | MatrixIndex:
+    """
+    the part of a graph a context-free path query can use
+    :param graph: labelled graph
+    :param footprint: labels and nullability of the query grammar
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :return: subgraph with the same answers for these start and final
+        vertices, shared between callers with the same graph version,
+        the graph itself in compact form if nothing can be dropped
+    """
+    key = (
+        "pruned",
+        graph_version(graph),
+        footprint,
+        frozenset(start_nodes or ()),
+        frozenset(final_nodes or ()),
+    )
+    return PRUNED_CACHE.get_or_create(
+        key, lambda: _prune(graph, footprint, start_nodes, final_nodes)
+    )
+
+
+def _cone(adjacency: sparse.csr_matrix, sources: np.ndarray) -> np.ndarray:
+    """
+    mask of the vertices reachable from any of the sources
+    """
+    n = adjacency.shape[0]
+    # one breadth-first search from an extra vertex linked to every source
+    extended = sparse.vstack(
+        [
+            sparse.hstack([adjacency, sparse.csr_matrix((n, 1), dtype=np.bool_)]),
+            sparse.csr_matrix(
+                (
+                    np.ones(len(sources), dtype=np.bool_),
+                    (np.zeros_like(sources), sources),
+                ),
+                shape=(1, n + 1),
+            ),
+        ],
+        format="csr",
+    )
+    order = csgraph.breadth_first_order(
+        extended, n, directed=True, return_predecessors=False
+    )
+    reached = np.zeros(n + 1, dtype=np.bool_)
+    reached[order] = True
+    return reached[:n]
+
+
+def _mask(n: int, index: dict[Hashable, int], vertices: set | None) -> np.ndarray:
+    if not vertices:
+        return np.ones(n, dtype=np.bool_)
+    mask = np.zeros(n, dtype=np.bool_)
+    mask[[index[vertex] for vertex in vertices if vertex in index]] = True
+    return mask
+
+
+def _prune(
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    footprint: Footprint,
+    start_nodes: set[int] | None,
+    final_nodes: set[int] | None,
+) -> EdgeListGraph | MatrixIndex:
+    """
+    subgraph of the vertices and edges a derivation of an answer can use
+
+    Every vertex of a path between a start and a final vertex is reachable
+    from the start vertex and reaches the final one over edges the grammar
+    can read, so the other vertices and edges take part in no derivation.
+    Vertices without such edges are kept only for the empty path of a
+    nullable grammar.
+    """
+    if not isinstance(graph, (EdgeListGraph, MatrixIndex)):
+        graph = EdgeListGraph.from_networkx(graph)
+    nodes = (
+        graph.nodes.tolist() if isinstance(graph, EdgeListGraph) else list(graph.nodes)
+    )
+    n = len(nodes)
+    edges, dropped_labels = [], False
+    for label, sources, targets in graph.edges_by_label():
+        if label in footprint.labels:
+            edges.append((label, sources, targets))
+        elif len(sources):
+            dropped_labels = True
+
+    sources = np.concatenate([np.empty(0, np.int64)] + [s for _, s, _ in edges])
+    targets = np.concatenate([np.empty(0, np.int64)] + [t for _, _, t in edges])
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(sources), dtype=np.bool_), (sources, targets)), shape=(n, n)
+    )
+    index = (
+        {node: i for i, node in enumerate(nodes)} if start_nodes or final_nodes else {}
+    )
+    starts, finals = _mask(n, index, start_nodes), _mask(n, index, final_nodes)
+    keep = np.ones(n, dtype=np.bool_)
+    if start_nodes:
+        keep &= _cone(adjacency, np.flatnonzero(starts))
+    if final_nodes:
+        keep &= _cone(adjacency.T.tocsr(), np.flatnonzero(finals))
+
+    used = np.zeros(n, dtype=np.bool_)
+    inner = keep[sources] & keep[targets]
+    used[sources[inner]] = used[targets[inner]] = True
+    if footprint.nullable:
+        used |= starts & finals
+    keep &= used
+    if keep.all() and not dropped_labels:
+        return graph
+
+    positions = np.cumsum(keep) - 1
+    kept_edges = {}
+    for label, label_sources, label_targets in edges:
+        inside = keep[label_sources] & keep[label_targets]
+        kept_edges[Symbol(label)] = (
+            positions[label_sources[inside]],
+            positions[label_targets[inside]],
+        )
+    matrices = BoolDecomposition.from_edges(int(keep.sum()), kept_edges)
+    return MatrixIndex([nodes[i] for i in np.flatnonzero(keep).tolist()], matrices)
@@ -0,0 +1,113 @@
+import json
+import os
+import pathlib
+from collections import Counter
+from typing import Any, Hashable, NamedTuple, Sequence, TypeVar
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Symbol
+from scipy import optimize
+
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_cache import LRUCache, graph_version
+from project.task2 import LABEL
+
+M = TypeVar("M", bound=NamedTuple)
+
+COST_MODEL_PATH = (
+    pathlib.Path.home() / ".cache" / "formal-lang-course" / "cost_model.json"
+)
+
+_loaded: dict[pathlib.Path, dict[str, Any]] = {}
+
+
+def _path(path: str | pathlib.Path | None) -> pathlib.Path:
+    return pathlib.Path(path) if path is not None else COST_MODEL_PATH
+
+
+def load_cost_model(
+    section: str, defaults: M, path: str | pathlib.Path | None = None
+) -> M:
+    """
+    coefficients of a query planner stored by save_cost_model
+    :param section: name of the planner in the file, e.g. "rpq"
+    :param defaults: model whose fields are used where the file has none
+    :param path: JSON file, COST_MODEL_PATH if None
+    :return: the defaults if the file or the section is missing, the file is
+        read once per process
+    """
+    path = _path(path)
+    if path not in _loaded:
+        _loaded[path] = json.loads(path.read_text()) if path.exists() else {}
+    stored = _loaded[path].get(section, {})
+    return defaults._replace(
+        **{name: stored[name] for name in defaults._fields if name in stored}
+    )
+
+
+def save_cost_model(
+    section: str, model: NamedTuple, path: str | pathlib.Path | None = None
+) -> pathlib.Path:
+    """
+    store the coefficients of a planner, the other sections of the file are kept
+    :return: path of the file
+    """
+    path = _path(path)
+    models = json.loads(path.read_text()) if path.exists() else {}
+    models[section] = model._asdict()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(models, indent=2))
+    os.replace(temporary, path)
+    _loaded.pop(path, None)
+    return path
+
+
+def fit_costs(
+    features: Sequence[Sequence[float]], seconds: Sequence[float]
+) -> list[float]:
+    """
+    non-negative coefficients c with features @ c close to the measured times
+    :param features: a row of work estimates per measurement
+    :param seconds: measured times
+    :return: coefficient per feature column fitted by least squares on the
+        relative error, so short runs weigh as much as long ones
+    """
+    rows = np.asarray(features, dtype=np.float64)
+    times = np.asarray(seconds, dtype=np.float64)
+    if rows.ndim != 2 or len(rows) != len(times) or len(times) == 0:
+        raise ValueError(
+            f"Expected a row of features per measurement, got {rows.shape} "
+            f"features for {len(times)} measurements"
+        )
+    weights = 1 / np.maximum(times, 1e-9)
+    coefficients, _ = optimize.nnls(rows * weights[:, None], times * weights)
+    return coefficients.tolist()
+
+
+LABEL_COUNTS_CACHE: LRUCache[dict[Hashable, int]] = LRUCache(max_entries=256)
+
+
+def label_counts(
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+) -> dict[Hashable, int]:
+    """
+    number of edges of every label, cached by the graph version stamp
+    :param graph: labelled graph, see query_cache.touch_graph for mutable graphs
+    :return: label value -> edge count, the dict must not be modified
+    """
+
+    def count() -> dict[Hashable, int]:
+        if isinstance(graph, MatrixIndex):
+            return {
+                label.value if isinstance(label, Symbol) else label: matrix.nnz
+                for label, matrix in graph.matrices.items()
+            }
+        if isinstance(graph, EdgeListGraph):
+            counts = np.bincount(graph.label_ids, minlength=len(graph.labels))
+            return dict(zip(graph.labels, counts.tolist()))
+        return dict(Counter(label for _, _, label in graph.edges(data=LABEL)))
+
+    return LABEL_COUNTS_CACHE.get_or_create(("labels", graph_version(graph)), count)
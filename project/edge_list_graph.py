@@ -0,0 +1,242 @@
+import json
+import mmap
+import pathlib
+from typing import Any, Hashable, Iterator
+
+import cfpq_data
+import numpy as np
+from networkx import MultiDiGraph
+
+from project.query_cache import touch_graph
+
+LABEL = "label"
+
+
+class EdgeListGraph:
+    """
+    Immutable labelled graph stored as parallel NumPy arrays.
+
+    Edge i goes from vertex `nodes[src[i]]` to vertex `nodes[dst[i]]` and is
+    labelled `labels[label_ids[i]]`, so vertices are addressed by their index
+    in `nodes` and labels are interned. The arrays may be memory-mapped,
+    see save and open.
+    """
+
+    def __init__(
+        self,
+        src: np.ndarray,
+        dst: np.ndarray,
+        label_ids: np.ndarray,
+        labels: list[Hashable],
+        nodes: np.ndarray,
+    ):
+        if not len(src) == len(dst) == len(label_ids):
+            raise ValueError("Edge arrays must have the same length")
+        self.src = src
+        self.dst = dst
+        self.label_ids = label_ids
+        self.labels = labels
+        self.nodes = nodes
+        # networkx-like graph attributes, the version stamp never changes
+        self.graph: dict[str, Any] = {}
+        touch_graph(self)
+
+    @classmethod
+    def from_edges(
+        cls,
+        edges: Iterator[tuple[Hashable, Hashable, Hashable]],
+        nodes: list[Hashable] | None = None,
+    ) -> "EdgeListGraph":
+        """
+        build the graph from (source, target, label) triples
+        :param edges: labelled edges
+        :param nodes: all vertices including isolated ones, taken from the
+            edges if not given
+        """
+        label_index: dict[Hashable, int] = {}
+        sources, targets, label_ids = [], [], []
+        for u, v, label in edges:
+            sources.append(u)
+            targets.append(v)
+            label_ids.append(label_index.setdefault(label, len(label_index)))
+        return cls._compact(sources, targets, label_ids, list(label_index), nodes)
+
+    @classmethod
+    def _compact(cls, sources, targets, label_ids, labels, nodes=None):
+        endpoints = np.concatenate((np.asarray(sources), np.asarray(targets)))
+        if nodes is None:
+            nodes, inverse = np.unique(endpoints, return_inverse=True)
+        else:
+            nodes = np.asarray(list(nodes))
+            order = np.argsort(nodes)
+            found = np.searchsorted(nodes, endpoints, sorter=order)
+            if len(nodes):
+                inverse = order[np.minimum(found, len(nodes) - 1)]
+                unknown = nodes[inverse] != endpoints
+            else:
+                inverse, unknown = found, np.ones(len(endpoints), dtype=np.bool_)
+            if unknown.any():
+                missing = np.unique(endpoints[unknown]).tolist()
+                raise ValueError(
+                    f"Edge endpoints {missing[:10]} are not among the vertices"
+                    + (f" ({len(missing)} in total)" if len(missing) > 10 else "")
+                )
+        index_type = np.int32 if len(nodes) < 2**31 else np.int64
+        inverse = inverse.astype(index_type)
+        return cls(
+            inverse[: len(sources)],
+            inverse[len(sources) :],
+            np.asarray(label_ids, dtype=np.int32),
+            labels,
+            nodes,
+        )
+
+    @classmethod
+    def from_networkx(cls, graph: MultiDiGraph) -> "EdgeListGraph":
+        """
+        compact form of a graph loaded by task1.load_graph or generated by cfpq_data
+        """
+        return cls.from_edges(graph.edges(data=LABEL), list(graph.nodes))
+
+    @classmethod
+    def from_csv(cls, path: str | pathlib.Path, sep: str = " ") -> "EdgeListGraph":
+        """
+        read a "source target label" edge list, the format of CFPQ_Data
+
+        The memory-mapped file is split into fields and parsed by NumPy
+        without a Python loop over the lines. Lines with fewer than three
+        fields are skipped, fields after the third are ignored.
+        :param path: path to the file, vertices must be integers
+        :param sep: single-character field separator, whitespace around the
+            fields is ignored
+        """
+        separator = sep.encode()
+        if len(separator) != 1:
+            raise ValueError(f"Separator must be a single byte, got {sep!r}")
+        with open(path, "rb") as file:
+            if file.seek(0, 2) == 0:
+                return cls.from_edges(iter(()))
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                buffer = np.frombuffer(data, dtype=np.uint8)
+                sources, targets, labels = _split_edge_list(buffer, separator)
+                # no view of the map may outlive it
+                del buffer
+        labels, label_ids = np.unique(labels, return_inverse=True)
+        return cls._compact(
+            sources.astype(np.int64),
+            targets.astype(np.int64),
+            label_ids.astype(np.int32),
+            [label.decode() for label in labels.tolist()],
+        )
+
+    @classmethod
+    def from_dataset(cls, name: str) -> "EdgeListGraph":
+        """
+        load a CFPQ_Data graph straight from its edge list, see task1.load_graph
+        """
+        return cls.from_csv(cfpq_data.download(name))
+
+    def save(self, directory: str | pathlib.Path) -> None:
+        """
+        write the arrays as .npy files that open can memory-map
+        """
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ("src", "dst", "label_ids", "nodes"):
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        (directory / "labels.json").write_text(json.dumps(self.labels))
+
+    @classmethod
+    def open(cls, directory: str | pathlib.Path) -> "EdgeListGraph":
+        """
+        memory-map a graph written by save without reading the arrays
+        """
+        directory = pathlib.Path(directory)
+        arrays = {
+            name: np.load(directory / f"{name}.npy", mmap_mode="r")
+            for name in ("src", "dst", "label_ids", "nodes")
+        }
+        labels = json.loads((directory / "labels.json").read_text())
+        return cls(labels=labels, **arrays)
+
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    def number_of_edges(self) -> int:
+        return len(self.src)
+
+    def edges_by_label(self) -> Iterator[tuple[Hashable, np.ndarray, np.ndarray]]:
+        """
+        edges grouped by label
+        :return: (label, source indices, target indices) for every label
+        """
+        order = np.argsort(self.label_ids, kind="stable")
+        bounds = np.searchsorted(self.label_ids[order], np.arange(len(self.labels) + 1))
+        for label_id, label in enumerate(self.labels):
+            edges = order[bounds[label_id] : bounds[label_id + 1]]
+            yield label, self.src[edges], self.dst[edges]
+
+    def edges(self) -> Iterator[tuple[Hashable, Hashable, Hashable]]:
+        nodes = self.nodes.tolist()
+        for u, v, label_id in zip(
+            self.src.tolist(), self.dst.tolist(), self.label_ids.tolist()
+        ):
+            yield nodes[u], nodes[v], self.labels[label_id]
+
+    def to_networkx(self) -> MultiDiGraph:
+        graph = MultiDiGraph()
+        graph.add_nodes_from(self.nodes.tolist())
+        graph.add_edges_from((u, v, {LABEL: label}) for u, v, label in self.edges())
+        return graph
+
+
+# bytes that end a field besides the separator
+_WHITESPACE = b" \t\r\n\v\f"
+# fields gathered per step, bounds the index matrix of _gather
+_GATHER_CHUNK = 1 << 18
+
+
+def _split_edge_list(
+    buffer: np.ndarray, separator: bytes
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    first three fields of every line with at least three of them
+    :param buffer: bytes of the file
+    :param separator: field separator
+    :return: fixed-width bytes arrays of the sources, targets and labels
+    """
+    delimiters = np.zeros(256, dtype=np.bool_)
+    delimiters[list(_WHITESPACE + separator)] = True
+    inside = np.concatenate(([False], ~delimiters[buffer], [False]))
+    steps = np.diff(inside.view(np.int8))
+    del inside
+    starts = np.flatnonzero(steps == 1)
+    ends = np.flatnonzero(steps == -1)
+    del steps
+
+    # line of every field and the first field of every line
+    lines = np.searchsorted(np.flatnonzero(buffer == ord("\n")), starts)
+    firsts = np.flatnonzero(np.diff(lines, prepend=-1))
+    counts = np.diff(firsts, append=len(starts))
+    firsts = firsts[counts >= 3]
+    return tuple(
+        _gather(buffer, starts[firsts + k], ends[firsts + k]) for k in range(3)
+    )
+
+
+def _gather(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    the fields buffer[starts[i]:ends[i]] as a fixed-width bytes array
+    """
+    width = max(int((ends - starts).max(initial=0)), 1)
+    columns = np.arange(width)
+    fields = np.empty(len(starts), dtype=f"S{width}")
+    for lo in range(0, len(starts), _GATHER_CHUNK):
+        chunk = starts[lo : lo + _GATHER_CHUNK]
+        lengths = ends[lo : lo + _GATHER_CHUNK] - chunk
+        positions = np.minimum(chunk[:, None] + columns, len(buffer) - 1)
+        chars = np.where(columns < lengths[:, None], buffer[positions], 0)
+        fields[lo : lo + len(chunk)] = (
+            np.ascontiguousarray(chars, dtype=np.uint8).view(f"S{width}").ravel()
+        )
+    return fields
@@ -0,0 +1,429 @@
+from abc import ABC, abstractmethod
+from typing import Hashable
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from scipy import sparse
+
+from project.edge_list_graph import EdgeListGraph
+from project.spgemm import bool_matmul
+from project.task2 import LABEL
+from project.task3 import (
+    ClosureMethod,
+    reflexive_transitive_closure,
+    regex_to_matrix_fa,
+)
+from project.task6 import WeakNormalFormIndex
+from project.task7 import (
+    dependency_order,
+    propagate_delta,
+    saturate_component,
+)
+
+Edge = tuple[int, Hashable, int]
+
+
+def _single(size: int, rows: list[int], cols: list[int]) -> sparse.csr_matrix:
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.bool_), (rows, cols)), shape=(size, size)
+    )
+
+
+class IncrementalQuery(ABC):
+    """
+    Path query whose answer is kept current while its graph changes.
+
+    The index owns a copy of the graph as edge multiplicities, a parallel
+    edge only changes the query state when its first copy is added or its
+    last copy is removed. Subclasses maintain the query matrices through
+    _grow, _insert and _delete. Removed vertices keep their index and are
+    only left out of the answers, adding an edge at one brings it back.
+
+    Library API only: the interpreter evaluates the selects of a program
+    against a ProgramGraph snapshot and does not keep these indexes.
+    """
+
+    def __init__(
+        self,
+        graph: MultiDiGraph | EdgeListGraph,
+        start_nodes: set[int] = None,
+        final_nodes: set[int] = None,
+    ):
+        """
+        :param graph: labelled graph, it is copied and not watched for changes
+        :param start_nodes: path sources, all vertices if empty
+        :param final_nodes: path targets, all vertices if empty
+        """
+        self.start_nodes = set(start_nodes or ())
+        self.final_nodes = set(final_nodes or ())
+        self.nodes: list[Hashable] = []
+        self.node_index: dict[Hashable, int] = {}
+        self.removed: set[int] = set()
+        self.edge_counts: dict[Edge, int] = {}
+        self.incident: list[set[Edge]] = []
+
+        if isinstance(graph, EdgeListGraph):
+            nodes, edges = graph.nodes.tolist(), graph.edges()
+        else:
+            nodes, edges = list(graph.nodes), graph.edges(data=LABEL)
+        for node in nodes:
+            self._vertex(node)
+        for u, v, label in edges:
+            self._count(self.node_index[u], label, self.node_index[v], 1)
+
+    def _vertex(self, node: Hashable) -> int:
+        index = self.node_index.get(node)
+        if index is None:
+            index = self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.incident.append(set())
+        self.removed.discard(index)
+        return index
+
+    def _count(self, u: int, label: Hashable, v: int, change: int) -> int:
+        edge = (u, label, v)
+        count = self.edge_counts.get(edge, 0) + change
+        if count:
+            self.edge_counts[edge] = count
+            self.incident[u].add(edge)
+            self.incident[v].add(edge)
+        else:
+            del self.edge_counts[edge]
+            self.incident[u].discard(edge)
+            self.incident[v].discard(edge)
+        return count
+
+    def add_vertex(self, node: Hashable) -> None:
+        size = len(self.nodes)
+        self._vertex(node)
+        if len(self.nodes) > size:
+            self._grow(size)
+
+    def add_edge(self, u: Hashable, label: Hashable, v: Hashable) -> None:
+        self.add_vertex(u)
+        self.add_vertex(v)
+        u, v = self.node_index[u], self.node_index[v]
+        if self._count(u, label, v, 1) == 1:
+            self._insert(u, label, v)
+
+    def remove_edge(self, u: Hashable, label: Hashable, v: Hashable) -> None:
+        """
+        remove one copy of the edge, a missing edge is ignored
+        """
+        u, v = self.node_index.get(u), self.node_index.get(v)
+        if (u, label, v) not in self.edge_counts:
+            return
+        if self._count(u, label, v, -1) == 0:
+            self._delete([(u, label, v)])
+
+    def remove_vertex(self, node: Hashable) -> None:
+        """
+        remove all edges of the vertex and the vertex itself
+        """
+        index = self.node_index.get(node)
+        if index is None or index in self.removed:
+            return
+        edges = list(self.incident[index])
+        for edge in edges:
+            del self.edge_counts[edge]
+            u, _, v = edge
+            self.incident[u].discard(edge)
+            self.incident[v].discard(edge)
+        self.removed.add(index)
+        if edges:
+            self._delete(edges)
+
+    def _endpoints(self, nodes: set[Hashable]) -> list[int]:
+        if not nodes:
+            return [i for i in range(len(self.nodes)) if i not in self.removed]
+        indices = (self.node_index.get(node) for node in nodes)
+        return sorted(i for i in indices if i is not None and i not in self.removed)
+
+    def answers(self) -> set[tuple[Hashable, Hashable]]:
+        """
+        :return: the answer of the query on the current graph
+        """
+        starts = self._endpoints(self.start_nodes)
+        finals = self._endpoints(self.final_nodes)
+        if not starts or not finals:
+            return set()
+        sources, targets = self._pairs(
+            np.array(starts, dtype=np.int64), np.array(finals, dtype=np.int64)
+        )
+        nodes = self.nodes
+        return {
+            (nodes[u], nodes[v]) for u, v in zip(sources.tolist(), targets.tolist())
+        }
+
+    @abstractmethod
+    def _grow(self, first: int) -> None:
+        """
+        extend the query matrices to the vertices from first on
+        """
+
+    @abstractmethod
+    def _insert(self, u: int, label: Hashable, v: int) -> None:
+        """
+        update the query matrices for the first copy of an edge
+        """
+
+    @abstractmethod
+    def _delete(self, edges: list[Edge]) -> None:
+        """
+        update the query matrices for the edges whose last copy is removed
+        """
+
+    @abstractmethod
+    def _pairs(
+        self, starts: np.ndarray, finals: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        answer pairs of the indexed start and final vertices
+        """
+
+
+class IncrementalTensorRpq(IncrementalQuery):
+    """
+    Dynamic index of tensor_based_rpq.
+
+    The reflexive transitive closure of the intersection of the graph with
+    the query DFA is kept, state (vertex, DFA state) has index
+    vertex * dfa_states + dfa_state as in intersect_automata. A new
+    intersection edge (a, b) adds the pairs closure[:, a] x closure[b, :].
+    When an edge goes, only the rows of the sources that reached it are
+    dropped and searched again, every other row cannot have used it.
+    """
+
+    def __init__(
+        self,
+        regex: str,
+        graph: MultiDiGraph | EdgeListGraph,
+        start_nodes: set[int] = None,
+        final_nodes: set[int] = None,
+        closure: ClosureMethod = "semi-naive",
+    ):
+        """
+        :param regex: regular expression over edge labels
+        :param closure: method of the initial closure, see
+            reflexive_transitive_closure
+        """
+        regex_fa = regex_to_matrix_fa(regex)
+        self.dfa_states = regex_fa.states_count
+        self.dfa_starts = sorted(regex_fa.start_states)
+        self.dfa_finals = sorted(regex_fa.final_states)
+        self.transitions: dict[Hashable, list[tuple[int, int]]] = {}
+        for label, matrix in regex_fa.matrices.items("csr"):
+            rows, cols = matrix.nonzero()
+            self.transitions[label.value] = list(zip(rows.tolist(), cols.tolist()))
+        # number of (graph edge, DFA transition) pairs behind an edge of
+        # the intersection
+        self.edge_support: dict[tuple[int, int], int] = {}
+        super().__init__(graph, start_nodes, final_nodes)
+
+        for u, label, v in self.edge_counts:
+            self._support(u, label, v, 1)
+        self.closure = reflexive_transitive_closure(self._adjacency(), closure)
+
+    @property
+    def size(self) -> int:
+        return len(self.nodes) * self.dfa_states
+
+    def _support(
+        self, u: int, label: Hashable, v: int, change: int
+    ) -> list[tuple[int, int]]:
+        """
+        :return: the intersection edges that appeared or disappeared
+        """
+        n = self.dfa_states
+        changed = []
+        for p, q in self.transitions.get(label, ()):
+            edge = (u * n + p, v * n + q)
+            count = self.edge_support.get(edge, 0) + change
+            if count:
+                self.edge_support[edge] = count
+            else:
+                del self.edge_support[edge]
+            if count == (1 if change > 0 else 0):
+                changed.append(edge)
+        return changed
+
+    def _adjacency(self) -> sparse.csr_matrix:
+        rows = [a for a, _ in self.edge_support]
+        cols = [b for _, b in self.edge_support]
+        return _single(self.size, rows, cols)
+
+    def _grow(self, first: int) -> None:
+        self.closure.resize((self.size, self.size))
+        added = list(range(first * self.dfa_states, self.size))
+        self.closure = self.closure + _single(self.size, added, added)
+
+    def _insert(self, u: int, label: Hashable, v: int) -> None:
+        for a, b in self._support(u, label, v, 1):
+            if self.closure[a, b]:
+                continue
+            self.closure = self.closure + self.closure[:, [a]] @ self.closure[[b], :]
+
+    def _delete(self, edges: list[Edge]) -> None:
+        gone = [
+            edge for u, label, v in edges for edge in self._support(u, label, v, -1)
+        ]
+        if not gone:
+            return
+        affected = np.unique(self.closure[:, [a for a, _ in gone]].nonzero()[0])
+        adjacency = self._adjacency()
+
+        selector = sparse.csr_matrix(
+            (
+                np.ones(len(affected), dtype=np.bool_),
+                (np.arange(len(affected)), affected),
+            ),
+            shape=(len(affected), self.size),
+        )
+        reached = front = selector
+        while front.nnz:
+            front = bool_matmul(front, adjacency) > reached
+            reached = reached + front
+
+        kept = np.setdiff1d(np.arange(self.size), affected).tolist()
+        self.closure = _single(self.size, kept, kept) @ self.closure + (
+            selector.T @ reached
+        )
+
+    def _pairs(
+        self, starts: np.ndarray, finals: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        n = self.dfa_states
+        rows = (starts[:, None] * n + np.array(self.dfa_starts)).ravel()
+        cols = (finals[:, None] * n + np.array(self.dfa_finals)).ravel()
+        if len(rows) == 0 or len(cols) == 0:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        found_rows, found_cols = self.closure[rows][:, cols].nonzero()
+        pairs = np.unique(
+            rows[found_rows] // n * len(self.nodes) + cols[found_cols] // n
+        )
+        return np.divmod(pairs, len(self.nodes))
+
+
+class IncrementalMatrixCfpq(IncrementalQuery):
+    """
+    Dynamic index of matrix_based_cfpq.
+
+    The matrix of every variable of the weak normal form is kept. A new
+    edge is a delta of the variables deriving its label and is propagated
+    with the semi-naive rounds of the static algorithm. A removed edge
+    invalidates the variables that depend on its label; their matrices are
+    reset to the terminal and empty productions and derived again, DRed
+    style, with the matrices of all other variables left as they are.
+    """
+
+    def __init__(
+        self,
+        cfg: CFG,
+        graph: MultiDiGraph | EdgeListGraph,
+        start_nodes: set[int] = None,
+        final_nodes: set[int] = None,
+    ):
+        """
+        :param cfg: query grammar
+        """
+        self.grammar = WeakNormalFormIndex(cfg)
+        self.terminals: dict[Hashable, sparse.csr_matrix] = {}
+        self.matrices: list[sparse.csr_matrix] | None = None
+        super().__init__(graph, start_nodes, final_nodes)
+
+        size = len(self.nodes)
+        sources: dict[Hashable, tuple[list[int], list[int]]] = {}
+        for u, label, v in self.edge_counts:
+            rows, cols = sources.setdefault(label, ([], []))
+            rows.append(u)
+            cols.append(v)
+        self.terminals = {
+            label: _single(size, rows, cols) for label, (rows, cols) in sources.items()
+        }
+        self.matrices = [self._base(variable) for variable in range(self._variables)]
+        for component in dependency_order(self.grammar):
+            saturate_component(self.grammar, set(component), self.matrices)
+
+    @property
+    def _variables(self) -> int:
+        return len(self.grammar.variables)
+
+    def _base(self, variable: int) -> sparse.csr_matrix:
+        size = len(self.nodes)
+        matrix = sparse.csr_matrix((size, size), dtype=np.bool_)
+        for label, heads in self.grammar.by_terminal.items():
+            if variable in heads and label in self.terminals:
+                matrix = matrix + self.terminals[label]
+        if variable in self.grammar.nullable:
+            matrix = matrix + sparse.identity(size, dtype=np.bool_, format="csr")
+        return matrix
+
+    def _dependents(self, variables: set[int]) -> set[int]:
+        dependents = set(variables)
+        stack = list(variables)
+        while stack:
+            variable = stack.pop()
+            heads = [h for h, _ in self.grammar.by_left.get(variable, ())]
+            heads += [h for h, _ in self.grammar.by_right.get(variable, ())]
+            for head in heads:
+                if head not in dependents:
+                    dependents.add(head)
+                    stack.append(head)
+        return dependents
+
+    def _propagate(self, seeds: dict[int, sparse.csr_matrix]) -> None:
+        size = len(self.nodes)
+        delta = {}
+        for variable in range(self._variables):
+            new = seeds.get(variable)
+            if new is None:
+                new = sparse.csr_matrix((size, size), dtype=np.bool_)
+            new = new > self.matrices[variable]
+            self.matrices[variable] = self.matrices[variable] + new
+            delta[variable] = new
+        propagate_delta(self.grammar.binary, self.matrices, delta)
+
+    def _grow(self, first: int) -> None:
+        size = len(self.nodes)
+        for matrix in self.terminals.values():
+            matrix.resize((size, size))
+        if self.matrices is None:
+            return
+        for matrix in self.matrices:
+            matrix.resize((size, size))
+        added = list(range(first, size))
+        identity = _single(size, added, added)
+        self._propagate({head: identity for head in self.grammar.nullable})
+
+    def _insert(self, u: int, label: Hashable, v: int) -> None:
+        size = len(self.nodes)
+        edge = _single(size, [u], [v])
+        terminal = self.terminals.get(label)
+        self.terminals[label] = edge if terminal is None else terminal + edge
+        self._propagate(
+            {head: edge for head in self.grammar.by_terminal.get(label, ())}
+        )
+
+    def _delete(self, edges: list[Edge]) -> None:
+        size = len(self.nodes)
+        heads: set[int] = set()
+        for u, label, v in edges:
+            self.terminals[label] = self.terminals[label] > _single(size, [u], [v])
+            heads.update(self.grammar.by_terminal.get(label, ()))
+        if not heads:
+            return
+        affected = self._dependents(heads)
+        for variable in affected:
+            self.matrices[variable] = self._base(variable)
+        # the affected variables are closed upwards, so every component
+        # is either recomputed as a whole or kept
+        for component in dependency_order(self.grammar):
+            if component[0] in affected:
+                saturate_component(self.grammar, set(component), self.matrices)
+
+    def _pairs(
+        self, starts: np.ndarray, finals: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        rows, cols = self.matrices[self.grammar.start][starts][:, finals].nonzero()
+        return starts[rows], finals[cols]
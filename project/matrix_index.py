@@ -0,0 +1,178 @@
+import hashlib
+import json
+import pathlib
+from typing import Any, Hashable, Iterator
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Symbol
+from scipy import sparse
+
+from project.bool_decomposition import BoolDecomposition
+from project.edge_list_graph import EdgeListGraph
+from project.query_cache import touch_graph
+
+INDEX_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def graph_digest(graph: MultiDiGraph | EdgeListGraph) -> str:
+    """
+    content hash of a graph, independent of its version stamp
+    :param graph: labelled graph
+    :return: hex digest of the vertices and labelled edges, the same for a
+        networkx graph and its EdgeListGraph.from_networkx form
+    """
+    if not isinstance(graph, EdgeListGraph):
+        graph = EdgeListGraph.from_networkx(graph)
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (graph.nodes, graph.src, graph.dst, graph.label_ids):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(repr(graph.labels).encode())
+    return digest.hexdigest()
+
+
+class MatrixIndex:
+    """
+    Per-label adjacency matrices of a graph persisted on disk.
+
+    A directory holds manifest.json (format version, source graph digest,
+    vertex count and label dictionary), the vertex ids and three .npy files
+    (data, indices, indptr) of a CSR matrix per label. Opening an index
+    memory-maps the arrays, so its cost does not depend on the graph size
+    apart from the vertex id mapping.
+    """
+
+    def __init__(
+        self,
+        nodes: list[Hashable],
+        matrices: BoolDecomposition,
+        source_digest: str | None = None,
+    ):
+        """
+        :param nodes: vertex of every matrix row
+        :param matrices: per-label adjacency matrices
+        :param source_digest: graph_digest of the graph the matrices were
+            built from, None for matrices that were built in memory
+        """
+        self.nodes = nodes
+        self.matrices = matrices
+        self.source_digest = source_digest
+        # version stamp for the automata cache, an index is never modified
+        self.graph: dict[str, Any] = {}
+        touch_graph(self)
+
+    @classmethod
+    def build(
+        cls,
+        graph: MultiDiGraph | EdgeListGraph,
+        directory: str | pathlib.Path,
+    ) -> "MatrixIndex":
+        """
+        decompose a graph and write the index
+        :param graph: labelled graph
+        :param directory: index directory, created if missing
+        :return: the index that was written
+        """
+        compact = (
+            graph
+            if isinstance(graph, EdgeListGraph)
+            else EdgeListGraph.from_networkx(graph)
+        )
+        matrices = BoolDecomposition.from_edges(
+            compact.number_of_nodes(),
+            {Symbol(label): (src, dst) for label, src, dst in compact.edges_by_label()},
+        )
+        index = cls(compact.nodes.tolist(), matrices, graph_digest(compact))
+        index.save(directory)
+        return index
+
+    def save(self, directory: str | pathlib.Path) -> None:
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        labels = []
+        for i, (label, matrix) in enumerate(self.matrices.items("csr")):
+            matrix.sort_indices()
+            for name in ("data", "indices", "indptr"):
+                np.save(directory / f"{i}.{name}.npy", getattr(matrix, name))
+            value = label.value if isinstance(label, Symbol) else label
+            labels.append({"label": value, "file": str(i), "nnz": int(matrix.nnz)})
+
+        nodes = np.asarray(self.nodes)
+        numeric_nodes = nodes.dtype.kind in "iu"
+        if numeric_nodes:
+            np.save(directory / "nodes.npy", nodes)
+        else:
+            (directory / "nodes.json").write_text(json.dumps(list(self.nodes)))
+
+        manifest = {
+            "version": INDEX_VERSION,
+            "source": self.source_digest,
+            "size": len(self.nodes),
+            "numeric_nodes": bool(numeric_nodes),
+            "labels": labels,
+        }
+        (directory / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    @classmethod
+    def open(
+        cls,
+        directory: str | pathlib.Path,
+        source: MultiDiGraph | EdgeListGraph | str | None = None,
+    ) -> "MatrixIndex":
+        """
+        memory-map an index
+        :param directory: index directory
+        :param source: the graph the index must have been built from or its
+            graph_digest, not checked if None
+        :return: index with read-only memory-mapped matrices
+        """
+        directory = pathlib.Path(directory)
+        manifest = json.loads((directory / MANIFEST).read_text())
+        if manifest.get("version") != INDEX_VERSION:
+            raise ValueError(
+                f"Index {directory} has format version {manifest.get('version')}, "
+                f"expected {INDEX_VERSION}"
+            )
+        if source is not None:
+            expected = source if isinstance(source, str) else graph_digest(source)
+            if manifest["source"] != expected:
+                raise ValueError(
+                    f"Index {directory} was built from a different graph "
+                    f"({manifest['source']} != {expected})"
+                )
+
+        if manifest["numeric_nodes"]:
+            nodes = np.load(directory / "nodes.npy", mmap_mode="r").tolist()
+        else:
+            nodes = json.loads((directory / "nodes.json").read_text())
+
+        size = manifest["size"]
+        matrices = BoolDecomposition(size, "csr")
+        for entry in manifest["labels"]:
+            data, indices, indptr = (
+                np.load(directory / f"{entry['file']}.{name}.npy", mmap_mode="r")
+                for name in ("data", "indices", "indptr")
+            )
+            matrix = sparse.csr_matrix(
+                (data, indices, indptr), shape=(size, size), copy=False
+            )
+            matrix.has_sorted_indices = True
+            matrices[Symbol(entry["label"])] = matrix
+        return cls(nodes, matrices, manifest["source"])
+
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    def number_of_edges(self) -> int:
+        return self.matrices.nnz()
+
+    def edges_by_label(self) -> Iterator[tuple[Hashable, np.ndarray, np.ndarray]]:
+        """
+        edges grouped by label, as EdgeListGraph.edges_by_label
+        :return: (label, source indices, target indices) for every label
+        """
+        for label, matrix in self.matrices.items("csr"):
+            sources, targets = matrix.nonzero()
+            yield label.value if isinstance(label, Symbol) else label, sources, targets
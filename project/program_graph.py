@@ -0,0 +1,159 @@
+from typing import Hashable, Iterable, NamedTuple
+
+import numpy as np
+from pyformlang.finite_automaton import Symbol
+from scipy import sparse
+
+from project.bool_decomposition import BoolDecomposition
+from project.matrix_index import MatrixIndex
+
+
+class EdgeBatch(NamedTuple):
+    """
+    Vertices and edges of a run of add statements, grouped for ProgramGraph.
+
+    Edges are given by positions in `vertices`, which lists every vertex of
+    the run once, isolated vertices included.
+    """
+
+    vertices: list[Hashable]
+    edges: dict[Hashable, tuple[np.ndarray, np.ndarray]]
+
+
+def edge_batch(
+    vertices: Iterable[Hashable],
+    edges: Iterable[tuple[Hashable, Hashable, Hashable]],
+) -> EdgeBatch:
+    """
+    :param vertices: added vertices
+    :param edges: added (source, label, target) edges, parallel ones included
+    :return: the batch adding all of them
+    """
+    positions: dict[Hashable, int] = {}
+    for vertex in vertices:
+        positions.setdefault(vertex, len(positions))
+    grouped: dict[Hashable, tuple[list[int], list[int]]] = {}
+    for u, label, v in edges:
+        sources, targets = grouped.setdefault(label, ([], []))
+        sources.append(positions.setdefault(u, len(positions)))
+        targets.append(positions.setdefault(v, len(positions)))
+    return EdgeBatch(
+        list(positions),
+        {
+            label: (np.asarray(sources, np.int64), np.asarray(targets, np.int64))
+            for label, (sources, targets) in grouped.items()
+        },
+    )
+
+
+class ProgramGraph:
+    """
+    Mutable labelled multigraph of the query language interpreter.
+
+    Edges are stored as one sparse matrix of edge multiplicities per label,
+    so a run of add statements is merged with a single sparse sum per label
+    and removing one of parallel edges only decrements a count. Vertices
+    are indexed in the order they were added, removing one compacts the
+    matrices. The engines read the graph through snapshot.
+    """
+
+    def __init__(self):
+        self.nodes: list[Hashable] = []
+        self.index: dict[Hashable, int] = {}
+        self.counts: dict[Hashable, sparse.csr_matrix] = {}
+        self._snapshot: MatrixIndex | None = None
+
+    def __contains__(self, vertex: Hashable) -> bool:
+        return vertex in self.index
+
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    def number_of_edges(self) -> int:
+        return sum(int(matrix.sum()) for matrix in self.counts.values())
+
+    def add(self, batch: EdgeBatch) -> None:
+        """
+        add the vertices and edges of a batch, existing vertices are kept
+        """
+        indices = np.empty(len(batch.vertices), dtype=np.int64)
+        for position, vertex in enumerate(batch.vertices):
+            index = self.index.get(vertex)
+            if index is None:
+                index = self.index[vertex] = len(self.nodes)
+                self.nodes.append(vertex)
+            indices[position] = index
+
+        size = len(self.nodes)
+        for label, (sources, targets) in batch.edges.items():
+            added = sparse.csr_matrix(
+                (
+                    np.ones(len(sources), dtype=np.int32),
+                    (indices[sources], indices[targets]),
+                ),
+                shape=(size, size),
+            )
+            matrix = self.counts.get(label)
+            if matrix is not None:
+                matrix.resize((size, size))
+                added = added + matrix
+            self.counts[label] = added
+        self._snapshot = None
+
+    def remove_edge(self, u: Hashable, label: Hashable, v: Hashable) -> None:
+        """
+        remove one of the u -> v edges with the label if there is any
+        """
+        matrix = self.counts.get(label)
+        i, j = self.index.get(u), self.index.get(v)
+        if matrix is None or i is None or j is None:
+            return
+        if i >= matrix.shape[0] or j >= matrix.shape[1] or matrix[i, j] == 0:
+            return
+        matrix[i, j] -= 1
+        matrix.eliminate_zeros()
+        self._snapshot = None
+
+    def remove_vertices(self, vertices: Iterable[Hashable]) -> None:
+        """
+        remove the vertices and their edges, absent vertices are ignored
+        """
+        removed = {self.index[vertex] for vertex in vertices if vertex in self.index}
+        if not removed:
+            return
+        keep = np.array(
+            [i for i in range(len(self.nodes)) if i not in removed], dtype=np.int64
+        )
+        size = len(self.nodes)
+        for label, matrix in self.counts.items():
+            matrix.resize((size, size))
+            self.counts[label] = matrix[keep][:, keep].tocsr()
+        self.nodes = [self.nodes[i] for i in keep]
+        self.index = {vertex: i for i, vertex in enumerate(self.nodes)}
+        self._snapshot = None
+
+    def snapshot(self, vertices: Iterable[Hashable] = ()) -> MatrixIndex:
+        """
+        boolean per-label matrices of the current graph, built once per
+        modification
+        :param vertices: vertices a query starts or ends at, those missing
+            from the graph are added as isolated ones as a networkx graph
+            query does
+        :return: index the engines accept as a graph, it must not be modified
+        """
+        missing = [vertex for vertex in vertices if vertex not in self.index]
+        if missing:
+            return self._matrix_index(self.nodes + list(dict.fromkeys(missing)))
+        if self._snapshot is None:
+            self._snapshot = self._matrix_index(self.nodes)
+        return self._snapshot
+
+    def _matrix_index(self, nodes: list[Hashable]) -> MatrixIndex:
+        size = len(nodes)
+        matrices = BoolDecomposition(size)
+        for label, matrix in self.counts.items():
+            if matrix.nnz:
+                matrix = matrix.copy()
+                matrix.resize((size, size))
+                matrices[Symbol(label)] = matrix
+        return MatrixIndex(list(nodes), matrices)
@@ -0,0 +1,667 @@
+import functools
+import hashlib
+from typing import Any, Callable, Hashable, NamedTuple
+
+from antlr4 import ParserRuleContext
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import EpsilonNFA
+
+from project.cfpq_planner import cfpq
+from project.graph_query.GraphQueryParser import GraphQueryParser
+from project.graph_query.GraphQueryVisitor import GraphQueryVisitor
+from project.program_graph import ProgramGraph, edge_batch
+from project.program_types import FA, RSM, TypeChecker
+from project.program_values import (
+    Grammar,
+    binding_variable,
+    combine,
+    fa_grammar,
+    intersect_grammar,
+    repeat_fa,
+    repeat_grammar,
+    resolve,
+    symbol_fa,
+)
+from project.query_cache import LRUCache
+from project.query_stats import NO_STATS, QueryStats
+from project.task3 import AdjacencyMatrixFA, tensor_based_rpq
+from project.task11 import ProgramSyntaxError, parse_program
+
+
+class Node(NamedTuple):
+    """
+    Operation of a plan writing the value slot with the node's index.
+
+    `args` are the slots it reads, `data` its constant operands. A pure
+    node neither reads nor changes a graph. `statement` is the index of
+    the program statement a graph node comes from.
+    """
+
+    op: str
+    args: tuple[int, ...]
+    data: Any
+    pure: bool
+    statement: int = -1
+
+
+GRAPH_OPS = frozenset(
+    {
+        "graph",
+        "add",
+        "remove_vertex",
+        "remove_edge",
+        "remove_vertices",
+        "select",
+    }
+)
+
+# operations changing the graph in their first slot
+MUTATIONS = GRAPH_OPS - {"graph", "select"}
+
+
+class SelectRequest(NamedTuple):
+    """
+    Select waiting for evaluation, a filter of None accepts every vertex.
+    """
+
+    slot: int
+    starts: set[int] | None
+    finals: set[int] | None
+    returned: tuple[str, ...]
+
+
+class Plan:
+    """
+    Compiled program: a DAG of automaton and graph operations over slots.
+
+    Nodes come in program order, so running the graph nodes in that order
+    replays the program. Pure nodes are evaluated on first use and their
+    values are kept for all later runs, a program run again with the same
+    text builds none of its automata and grammars again.
+
+    Selects are deferred: selects of one query over one graph are evaluated
+    together, from the union of their start sets, as late as possible,
+    that is when their graph is about to change, when a node reads one of
+    them or at the end of the run.
+    """
+
+    def __init__(
+        self,
+        nodes: list[Node],
+        bindings: list[int],
+        results: dict[str, int],
+    ):
+        """
+        :param nodes: operations, node i writes slot i
+        :param bindings: slot of the value of every binding by binding id,
+            the nonterminal of a binding refers to it
+        :param results: slot of every name bound to a select
+        """
+        self.nodes = nodes
+        self.bindings = bindings
+        self.results = results
+        self._constants: dict[int, Any] = {}
+        self._queries: dict[int, AdjacencyMatrixFA | CFG] = {}
+        self._evaluating: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def constant(self, slot: int) -> Any:
+        """
+        value of a pure node, computed once per plan
+        """
+        if slot in self._constants:
+            return self._constants[slot]
+        if slot in self._evaluating:
+            raise ValueError(
+                "A grammar is intersected before all the nonterminals it "
+                "depends on are defined"
+            )
+        node = self.nodes[slot]
+        self._evaluating.add(slot)
+        try:
+            args = [self.constant(arg) for arg in node.args]
+            value = _OPS[node.op](self, slot, args, node.data)
+        finally:
+            self._evaluating.discard(slot)
+        self._constants[slot] = value
+        return value
+
+    def run(self, stats: dict[int, QueryStats] | None = None) -> dict[str, set]:
+        """
+        execute the graph operations in program order
+        :param stats: gets the measurements of every statement by its index
+            in the program, the engine call of selects evaluated together
+            is counted in the first of them
+        :return: values of the names bound to selects
+        """
+        values: list[Any] = [None] * len(self.nodes)
+        pending: dict[tuple[int, int], list[SelectRequest]] = {}
+        waiting: dict[int, tuple[int, int]] = {}
+
+        def statement_stats(slot: int) -> QueryStats:
+            if stats is None:
+                return NO_STATS
+            statement = self.nodes[slot].statement
+            if statement not in stats:
+                stats[statement] = QueryStats()
+            return stats[statement]
+
+        def flush(key: tuple[int, int]) -> None:
+            graph, query = key
+            requests = pending.pop(key)
+            measured = statement_stats(requests[0].slot)
+            for request in requests:
+                statement_stats(request.slot).count("selects")
+            with measured.phase("select"):
+                answers = _select_group(self, values[graph], query, requests, measured)
+            for request, value in zip(requests, answers):
+                values[request.slot] = value
+                del waiting[request.slot]
+
+        for slot, node in enumerate(self.nodes):
+            if node.pure:
+                continue
+            for key in {waiting[arg] for arg in node.args if arg in waiting}:
+                flush(key)
+            if node.op in MUTATIONS:
+                for key in [key for key in pending if key[0] == node.args[0]]:
+                    flush(key)
+            args = [
+                self.constant(arg) if self.nodes[arg].pure else values[arg]
+                for arg in node.args
+            ]
+            if node.op == "select":
+                request = _select_request(slot, args, node.data)
+                if request is None:
+                    values[slot] = set()
+                else:
+                    key = node.args[:2]
+                    pending.setdefault(key, []).append(request)
+                    waiting[slot] = key
+                continue
+            with statement_stats(slot).phase(node.op):
+                values[slot] = _OPS[node.op](self, slot, args, node.data)
+        for key in list(pending):
+            flush(key)
+        return {name: values[slot] for name, slot in self.results.items()}
+
+    def grammar(self, value: Any, slot: int) -> Grammar:
+        if isinstance(value, Grammar):
+            return value
+        if isinstance(value, str):
+            value = symbol_fa(value)
+        return fa_grammar(value, f"F{slot}")
+
+    def binding_grammar(self, binding: int) -> Grammar:
+        slot = self.bindings[binding]
+        return self.grammar(self.constant(slot), slot)
+
+    def query(self, slot: int) -> AdjacencyMatrixFA | CFG:
+        """
+        automaton or complete grammar of a select query, kept across runs
+        """
+        query = self._queries.get(slot)
+        if query is None:
+            value = self.constant(slot)
+            if isinstance(value, Grammar):
+                query = resolve(value, self.binding_grammar)
+            else:
+                query = AdjacencyMatrixFA(_fa(value))
+            self._queries[slot] = query
+        return query
+
+
+def _fa(value: str | EpsilonNFA) -> EpsilonNFA:
+    return symbol_fa(value) if isinstance(value, str) else value
+
+
+def _constant(plan, slot, args, data):
+    return data
+
+
+def _set(plan, slot, args, data):
+    return set(args)
+
+
+def _edge(plan, slot, args, data):
+    return tuple(args)
+
+
+def _nonterminal(plan, slot, args, data):
+    return Grammar(binding_variable(data), frozenset(), frozenset({data}))
+
+
+def _union(plan, slot, args, data):
+    if data == FA:
+        fas = [_fa(value) for value in args]
+        return functools.reduce(lambda left, right: left.union(right).minimize(), fas)
+    grammars = [
+        plan.grammar(value, arg) for value, arg in zip(args, plan.nodes[slot].args)
+    ]
+    return combine(grammars, f"N{slot}", [[i] for i in range(len(grammars))])
+
+
+def _concat(plan, slot, args, data):
+    if data == FA:
+        fas = [_fa(value) for value in args]
+        return functools.reduce(
+            lambda left, right: left.concatenate(right).minimize(), fas
+        )
+    grammars = [
+        plan.grammar(value, arg) for value, arg in zip(args, plan.nodes[slot].args)
+    ]
+    return combine(grammars, f"N{slot}", [list(range(len(grammars)))])
+
+
+def _intersect(plan, slot, args, data):
+    left, right = args
+    if data == FA:
+        return _fa(left).get_intersection(_fa(right)).minimize()
+    grammar, fa = (left, right) if isinstance(left, Grammar) else (right, left)
+    cfg = resolve(grammar, plan.binding_grammar)
+    return intersect_grammar(cfg, _fa(fa), f"N{slot}")
+
+
+def _repeat(plan, slot, args, data):
+    low, high, type = data
+    (operand,) = args
+    if type == FA:
+        return repeat_fa(_fa(operand), low, high)
+    grammar = plan.grammar(operand, plan.nodes[slot].args[0])
+    return repeat_grammar(grammar, low, high, f"N{slot}")
+
+
+def _batch(plan, slot, args, data):
+    vertices = [arg for arg, kind in zip(args, data) if kind == "vertex"]
+    edges = [arg for arg, kind in zip(args, data) if kind == "edge"]
+    return edge_batch(vertices, edges)
+
+
+def _add(plan, slot, args, data):
+    graph, batch = args
+    graph.add(batch)
+
+
+def _remove_vertex(plan, slot, args, data):
+    graph, vertex = args
+    graph.remove_vertices([vertex])
+
+
+def _remove_vertices(plan, slot, args, data):
+    graph, vertices = args
+    graph.remove_vertices(vertices)
+
+
+def _remove_edge(plan, slot, args, data):
+    graph, (u, label, v) = args
+    graph.remove_edge(u, label, v)
+
+
+def _select_request(slot, args, data) -> SelectRequest | None:
+    """
+    :return: request of a select, None if a filter is empty
+    """
+    _, _, *filters = args
+    source_filter, target_filter, returned = data
+    starts = set(filters[source_filter]) if source_filter is not None else None
+    finals = set(filters[target_filter]) if target_filter is not None else None
+    if starts == set() or finals == set():
+        return None
+    return SelectRequest(slot, starts, finals, returned)
+
+
+def _merge_filters(filters: list[set[int] | None]) -> set[int] | None:
+    if any(vertices is None for vertices in filters):
+        return None
+    return set().union(*filters)
+
+
+def _select_group(
+    plan: Plan,
+    graph: ProgramGraph,
+    slot: int,
+    requests: list[SelectRequest],
+    stats: QueryStats,
+) -> list[set]:
+    """
+    evaluate selects of the same query and graph with one engine call
+    :param slot: slot of the query
+    :param stats: measurements of the engine call are added to it
+    :return: value of every select
+    """
+    starts = _merge_filters([request.starts for request in requests])
+    finals = _merge_filters([request.finals for request in requests])
+    with stats.phase("snapshot"):
+        snapshot = graph.snapshot((starts or set()) | (finals or set()))
+    with stats.phase("compile"):
+        query = plan.query(slot)
+    engine = cfpq if isinstance(query, CFG) else tensor_based_rpq
+    pairs = engine(query, snapshot, starts or set(), finals or set(), stats=stats)
+
+    values = []
+    for request in requests:
+        selected = pairs
+        if len(requests) > 1:
+            selected = {
+                (u, v)
+                for u, v in pairs
+                if (request.starts is None or u in request.starts)
+                and (request.finals is None or v in request.finals)
+            }
+        if len(request.returned) == 2:
+            values.append(selected)
+        else:
+            position = 0 if request.returned[0] == "source" else 1
+            values.append({pair[position] for pair in selected})
+    return values
+
+
+_OPS: dict[str, Callable[[Plan, int, list, Any], Any]] = {
+    "constant": _constant,
+    "set": _set,
+    "edge": _edge,
+    "symbol": lambda plan, slot, args, data: symbol_fa(data),
+    "nonterminal": _nonterminal,
+    "union": _union,
+    "concat": _concat,
+    "intersect": _intersect,
+    "repeat": _repeat,
+    "batch": _batch,
+    "graph": lambda plan, slot, args, data: ProgramGraph(),
+    "add": _add,
+    "remove_vertex": _remove_vertex,
+    "remove_vertices": _remove_vertices,
+    "remove_edge": _remove_edge,
+}
+
+
+class PlanCompiler(GraphQueryVisitor):
+    """
+    Turns a well-typed parse tree into a plan.
+
+    Every name resolves to the slot of its current value at compile time.
+    A nonterminal, a variable in a regular expression that is not bound
+    yet or is bound by the enclosing binding, resolves to the id of the
+    binding that defines it. Pure nodes are hash-consed, a subexpression
+    repeated anywhere in the program is compiled and evaluated once. A run
+    of consecutive add statements on one graph becomes a single add of a
+    pure batch node, the batch is grouped by label once per plan and
+    merged into the graph in one step.
+    """
+
+    def __init__(self, types: dict[ParserRuleContext, str]):
+        self.types = types
+        self.nodes: list[Node] = []
+        self.env: dict[str, int] = {}
+        self.bindings: list[int] = []
+        self.results: dict[str, int] = {}
+        self._binds: list[tuple[int, str]] = []
+        self._statement = 0
+        self._binding: tuple[str, int] | None = None
+        self._shared: dict[tuple[str, tuple[int, ...], Any], int] = {}
+        # graph slot, operand slots and kinds of the pending add statements
+        # and the index of the first of them
+        self._adds: tuple[int, list[int], list[str], int] | None = None
+
+    def compile(self, tree: GraphQueryParser.ProgContext) -> Plan:
+        statements = tree.stmt()
+        for i, stmt in enumerate(statements):
+            if stmt.bind() is not None:
+                self._binds.append((i, stmt.bind().VAR().getText()))
+        self.bindings = [-1] * len(self._binds)
+        for i, stmt in enumerate(statements):
+            self._statement = i
+            if stmt.add() is None:
+                self._flush_adds()
+            self.visit(stmt)
+        self._flush_adds()
+        return Plan(self.nodes, self.bindings, self.results)
+
+    def _emit(
+        self,
+        op: str,
+        args: tuple[int, ...] = (),
+        data: Any = None,
+        statement: int | None = None,
+    ) -> int:
+        pure = op not in GRAPH_OPS and all(self.nodes[arg].pure for arg in args)
+        if pure:
+            key = (op, args, data)
+            if key in self._shared:
+                return self._shared[key]
+            self._shared[key] = len(self.nodes)
+            statement = -1
+        elif statement is None:
+            statement = self._statement
+        self.nodes.append(Node(op, args, data, pure, statement))
+        return len(self.nodes) - 1
+
+    def _next_binding(self, name: str) -> int:
+        return next(
+            binding
+            for binding, (statement, bound) in enumerate(self._binds)
+            if bound == name and statement >= self._statement
+        )
+
+    def visitDeclare(self, ctx: GraphQueryParser.DeclareContext):
+        self.env[ctx.VAR().getText()] = self._emit("graph")
+
+    def visitBind(self, ctx: GraphQueryParser.BindContext):
+        name = ctx.VAR().getText()
+        binding = self._next_binding(name)
+        self._binding = (name, binding)
+        try:
+            slot = self.visit(ctx.expr())
+        finally:
+            self._binding = None
+        self.env[name] = self.bindings[binding] = slot
+        if ctx.expr().select() is not None:
+            self.results[name] = slot
+        else:
+            self.results.pop(name, None)
+
+    def _flush_adds(self) -> None:
+        if self._adds is not None:
+            graph, operands, kinds, statement = self._adds
+            batch = self._emit("batch", tuple(operands), tuple(kinds))
+            self._emit("add", (graph, batch), statement=statement)
+            self._adds = None
+
+    def visitAdd(self, ctx: GraphQueryParser.AddContext):
+        graph = self.env[ctx.VAR().getText()]
+        if self._adds is not None and self._adds[0] != graph:
+            self._flush_adds()
+        if self._adds is None:
+            self._adds = (graph, [], [], self._statement)
+        self._adds[1].append(self.visit(ctx.expr()))
+        self._adds[2].append(ctx.getChild(1).getText())
+
+    def visitRemove(self, ctx: GraphQueryParser.RemoveContext):
+        op = f"remove_{ctx.getChild(1).getText()}"
+        self._emit(op, (self.env[ctx.VAR().getText()], self.visit(ctx.expr())))
+
+    def visitExpr(self, ctx: GraphQueryParser.ExprContext):
+        if ctx.NUM() is not None:
+            return self._emit("constant", data=int(ctx.NUM().getText()))
+        if ctx.CHAR() is not None:
+            return self._emit("constant", data=ctx.CHAR().getText()[1:-1])
+        if ctx.VAR() is not None:
+            return self.env[ctx.VAR().getText()]
+        return self.visit(ctx.getChild(0))
+
+    def visitSet_expr(self, ctx: GraphQueryParser.Set_exprContext):
+        return self._emit("set", tuple(self.visit(element) for element in ctx.expr()))
+
+    def visitEdge_expr(self, ctx: GraphQueryParser.Edge_exprContext):
+        return self._emit("edge", tuple(self.visit(element) for element in ctx.expr()))
+
+    def visitRegexp(self, ctx: GraphQueryParser.RegexpContext):
+        if ctx.CHAR() is not None:
+            return self._emit("symbol", data=ctx.CHAR().getText()[1:-1])
+        if ctx.VAR() is not None:
+            name = ctx.VAR().getText()
+            if self._binding is not None and name == self._binding[0]:
+                return self._emit("nonterminal", data=self._binding[1])
+            if name in self.env:
+                return self.env[name]
+            return self._emit("nonterminal", data=self._next_binding(name))
+
+        range_ = ctx.range_()
+        if range_ is not None:
+            bounds = [int(num.getText()) for num in range_.NUM()]
+            if len(bounds) == 2 or range_.getChildCount() == 3:
+                high = bounds[-1]
+            else:
+                high = None
+            return self._repeat(self.visit(ctx.regexp(0)), bounds[0], high)
+        if ctx.getChildCount() == 3 and ctx.getChild(0).getText() == "(":
+            return self.visit(ctx.regexp(0))
+        op = ctx.getChild(1).getText()
+        if op == "&":
+            left, right = (self.visit(operand) for operand in ctx.regexp())
+            return self._intersect(left, right)
+        slots = [self.visit(operand) for operand in self._flatten(ctx, op)]
+        return self._union(slots) if op == "|" else self._concat(slots)
+
+    def _flatten(self, ctx: GraphQueryParser.RegexpContext, op: str) -> list:
+        """
+        operands of a chain of one associative operator, through parentheses
+        """
+        if ctx.range_() is None and ctx.getChildCount() == 3:
+            if ctx.getChild(0).getText() == "(":
+                return self._flatten(ctx.regexp(0), op)
+            if ctx.getChild(1).getText() == op:
+                return [
+                    operand
+                    for child in ctx.regexp()
+                    for operand in self._flatten(child, op)
+                ]
+        return [ctx]
+
+    def _type(self, slot: int) -> str:
+        node = self.nodes[slot]
+        if node.op in ("union", "concat", "intersect"):
+            return node.data
+        if node.op == "repeat":
+            return node.data[2]
+        return RSM if node.op == "nonterminal" else FA
+
+    def _operands(self, slots: list[int], op: str) -> list[int]:
+        return [
+            operand
+            for slot in slots
+            for operand in (
+                self.nodes[slot].args if self.nodes[slot].op == op else (slot,)
+            )
+        ]
+
+    def _union(self, slots: list[int]) -> int:
+        """
+        one union of all regular operands, its automaton is minimized once,
+        and one of it and the grammars, duplicates are dropped and the
+        operands sorted so that equal unions share a node
+        """
+        slots = sorted(set(self._operands(slots, "union")))
+        fas = [slot for slot in slots if self._type(slot) == FA]
+        grammars = [slot for slot in slots if self._type(slot) == RSM]
+        if len(fas) > 1:
+            fas = [self._emit("union", tuple(fas), FA)]
+        operands = fas + grammars
+        if len(operands) == 1:
+            return operands[0]
+        return self._emit("union", tuple(operands), RSM)
+
+    def _concat(self, slots: list[int]) -> int:
+        """
+        concatenation with every run of adjacent regular operands as one
+        automaton
+        """
+        operands: list[int] = []
+        run: list[int] = []
+        for slot in [*self._operands(slots, "concat"), None]:
+            if slot is not None and self._type(slot) == FA:
+                run.append(slot)
+                continue
+            if len(run) > 1:
+                operands.append(self._emit("concat", tuple(run), FA))
+            else:
+                operands.extend(run)
+            run = []
+            if slot is not None:
+                operands.append(slot)
+        if len(operands) == 1:
+            return operands[0]
+        return self._emit("concat", tuple(operands), RSM)
+
+    def _intersect(self, left: int, right: int) -> int:
+        """
+        intersection, distributed over the unions of a grammar operand so
+        that its regular alternatives are intersected as automata
+        """
+        if self._type(left) == FA and self._type(right) == FA:
+            return self._emit("intersect", tuple(sorted((left, right))), FA)
+        grammar, fa = (left, right) if self._type(left) == RSM else (right, left)
+        if self.nodes[grammar].op == "union":
+            return self._union(
+                [self._intersect(operand, fa) for operand in self.nodes[grammar].args]
+            )
+        return self._emit("intersect", (grammar, fa), RSM)
+
+    def _repeat(self, operand: int, low: int, high: int | None) -> int:
+        if (low, high) == (1, 1):
+            return operand
+        node = self.nodes[operand]
+        if node.op == "repeat" and node.data[0] <= 1 and node.data[1] is None:
+            # X^[0..] repeated is X^[0..], X^[1..] repeated at least low
+            # times is X^[low..]
+            if high != 0:
+                inner = low if node.data[0] == 1 else 0
+                return self._repeat(node.args[0], inner, None)
+        type = self._type(operand)
+        return self._emit("repeat", (operand,), (low, high, type))
+
+    def visitSelect(self, ctx: GraphQueryParser.SelectContext):
+        names = [var.getText() for var in ctx.VAR()]
+        returned, (_, source, graph) = names[:-3], names[-3:]
+        args = [self.env[graph], self.visit(ctx.expr())]
+        source_filter = target_filter = None
+        for i, v_filter in enumerate(ctx.v_filter()):
+            args.append(self.visit(v_filter.expr()))
+            if v_filter.VAR().getText() == source:
+                source_filter = i
+            else:
+                target_filter = i
+        roles = tuple("source" if name == source else "target" for name in returned)
+        return self._emit("select", tuple(args), (source_filter, target_filter, roles))
+
+
+def compile_program(program: str) -> Plan:
+    """
+    parse, type and compile a program
+    :raise ProgramSyntaxError: if the program does not parse
+    :raise ProgramTypeError: if the program is ill-typed
+    """
+    tree, errors = parse_program(program)
+    if errors:
+        raise ProgramSyntaxError(errors)
+    checker = TypeChecker()
+    checker.check(tree)
+    return PlanCompiler(checker.types).compile(tree)
+
+
+PLAN_CACHE: LRUCache[Plan] = LRUCache(max_entries=128)
+
+
+def program_key(program: str) -> Hashable:
+    return hashlib.blake2b(program.encode(), digest_size=16).hexdigest()
+
+
+def cached_plan(program: str) -> Plan:
+    """
+    plan of a program, compiled once for every program text
+    """
+    return PLAN_CACHE.get_or_create(
+        program_key(program), lambda: compile_program(program)
+    )
@@ -0,0 +1,174 @@
+from antlr4 import ParserRuleContext
+
+from project.graph_query.GraphQueryParser import GraphQueryParser
+from project.graph_query.GraphQueryVisitor import GraphQueryVisitor
+
+INT = "int"
+CHAR = "char"
+EDGE = "int * char * int"
+SET_INT = "Set<int>"
+SET_PAIR = "Set<int * int>"
+FA = "FA"
+RSM = "RSM"
+GRAPH = "graph"
+
+AUTOMATA = (CHAR, FA, RSM)
+
+
+class ProgramTypeError(ValueError):
+    """
+    Program that cannot be typed, the message points at the offending line.
+    """
+
+    def __init__(self, ctx: ParserRuleContext, message: str):
+        super().__init__(f"line {ctx.start.line}:{ctx.start.column} {message}")
+
+
+class TypeChecker(GraphQueryVisitor):
+    """
+    Type inference of a parse tree.
+
+    Bindings are processed in program order and a binding overrides the
+    type of its name. A variable used in a regular expression before it is
+    bound, or inside its own binding, is a nonterminal, so the expression is
+    typed RSM and the variable must eventually be bound to an automaton.
+    """
+
+    def __init__(self):
+        self.env: dict[str, str] = {}
+        # types of all expression nodes, the interpreter compiles by them
+        self.types: dict[ParserRuleContext, str] = {}
+        self._binding: str | None = None
+        self._forward: dict[str, ParserRuleContext] = {}
+
+    def check(self, tree: GraphQueryParser.ProgContext) -> dict[str, str]:
+        """
+        :return: types of the variables after the last statement
+        :raise ProgramTypeError: if the program is ill-typed
+        """
+        self.visit(tree)
+        for name, ctx in self._forward.items():
+            if self.env.get(name) not in AUTOMATA:
+                raise ProgramTypeError(
+                    ctx, f"{name} is used as a nonterminal but never bound to one"
+                )
+        return dict(self.env)
+
+    def _typed(self, ctx: ParserRuleContext, type: str) -> str:
+        self.types[ctx] = type
+        return type
+
+    def _expect(self, ctx: ParserRuleContext, type: str, *expected: str) -> None:
+        if type not in expected:
+            raise ProgramTypeError(
+                ctx,
+                f"expected {' or '.join(expected)}, got {type} in {ctx.getText()!r}",
+            )
+
+    def _variable(self, ctx: ParserRuleContext, name: str) -> str:
+        type = self.env.get(name)
+        if type is None:
+            raise ProgramTypeError(ctx, f"{name} is not bound")
+        return type
+
+    def visitProg(self, ctx: GraphQueryParser.ProgContext):
+        for stmt in ctx.stmt():
+            self.visit(stmt)
+
+    def visitDeclare(self, ctx: GraphQueryParser.DeclareContext):
+        self.env[ctx.VAR().getText()] = GRAPH
+
+    def visitBind(self, ctx: GraphQueryParser.BindContext):
+        name = ctx.VAR().getText()
+        self._binding = name
+        try:
+            self.env[name] = self.visit(ctx.expr())
+        finally:
+            self._binding = None
+
+    def visitAdd(self, ctx: GraphQueryParser.AddContext):
+        kind = ctx.getChild(1).getText()
+        self._expect(
+            ctx.expr(), self.visit(ctx.expr()), INT if kind == "vertex" else EDGE
+        )
+        self._expect(ctx, self._variable(ctx, ctx.VAR().getText()), GRAPH)
+
+    def visitRemove(self, ctx: GraphQueryParser.RemoveContext):
+        kind = ctx.getChild(1).getText()
+        expected = {"vertex": INT, "edge": EDGE, "vertices": SET_INT}[kind]
+        self._expect(ctx.expr(), self.visit(ctx.expr()), expected)
+        self._expect(ctx, self._variable(ctx, ctx.VAR().getText()), GRAPH)
+
+    def visitExpr(self, ctx: GraphQueryParser.ExprContext):
+        if ctx.NUM() is not None:
+            return self._typed(ctx, INT)
+        if ctx.CHAR() is not None:
+            return self._typed(ctx, CHAR)
+        if ctx.VAR() is not None:
+            return self._typed(ctx, self._variable(ctx, ctx.VAR().getText()))
+        return self._typed(ctx, self.visit(ctx.getChild(0)))
+
+    def visitSet_expr(self, ctx: GraphQueryParser.Set_exprContext):
+        for element in ctx.expr():
+            self._expect(element, self.visit(element), INT)
+        return self._typed(ctx, SET_INT)
+
+    def visitEdge_expr(self, ctx: GraphQueryParser.Edge_exprContext):
+        for element, expected in zip(ctx.expr(), (INT, CHAR, INT)):
+            self._expect(element, self.visit(element), expected)
+        return self._typed(ctx, EDGE)
+
+    def visitRegexp(self, ctx: GraphQueryParser.RegexpContext):
+        if ctx.CHAR() is not None:
+            return self._typed(ctx, FA)
+        if ctx.VAR() is not None:
+            name = ctx.VAR().getText()
+            if name == self._binding or name not in self.env:
+                self._forward.setdefault(name, ctx)
+                return self._typed(ctx, RSM)
+            type = self.env[name]
+            self._expect(ctx, type, *AUTOMATA)
+            return self._typed(ctx, FA if type == CHAR else type)
+
+        operands = [self.visit(operand) for operand in ctx.regexp()]
+        if len(operands) == 1:
+            if ctx.range_() is not None:
+                self.visit(ctx.range_())
+            return self._typed(ctx, operands[0])
+        if ctx.getChild(1).getText() == "&" and operands == [RSM, RSM]:
+            raise ProgramTypeError(
+                ctx, f"intersection of two grammars in {ctx.getText()!r}"
+            )
+        return self._typed(ctx, RSM if RSM in operands else FA)
+
+    def visitRange(self, ctx: GraphQueryParser.RangeContext):
+        bounds = [int(num.getText()) for num in ctx.NUM()]
+        if len(bounds) == 2 and bounds[0] > bounds[1]:
+            raise ProgramTypeError(ctx, f"empty repetition range {ctx.getText()!r}")
+
+    def visitSelect(self, ctx: GraphQueryParser.SelectContext):
+        names = [var.getText() for var in ctx.VAR()]
+        returned, (target, source, graph) = names[:-3], names[-3:]
+        self._expect(ctx, self._variable(ctx, graph), GRAPH)
+        self._expect(ctx.expr(), self.visit(ctx.expr()), *AUTOMATA)
+
+        filtered = set()
+        for v_filter in ctx.v_filter():
+            name = v_filter.VAR().getText()
+            if name not in (target, source):
+                raise ProgramTypeError(
+                    v_filter, f"{name} is neither {target} nor {source}"
+                )
+            if name in filtered:
+                raise ProgramTypeError(v_filter, f"{name} is filtered twice")
+            filtered.add(name)
+            self._expect(v_filter.expr(), self.visit(v_filter.expr()), SET_INT)
+
+        for name in returned:
+            if name not in (target, source):
+                raise ProgramTypeError(
+                    ctx, f"returned {name} is neither {target} nor {source}"
+                )
+        if len(returned) == 2 and returned[0] == returned[1] and target != source:
+            raise ProgramTypeError(ctx, f"{returned[0]} is returned twice")
+        return self._typed(ctx, SET_INT if len(returned) == 1 else SET_PAIR)
@@ -0,0 +1,293 @@
+import itertools
+from typing import Callable, Iterable, NamedTuple
+
+from pyformlang.cfg import CFG, Epsilon, Production, Terminal, Variable
+from pyformlang.finite_automaton import (
+    DeterministicFiniteAutomaton,
+    EpsilonNFA,
+    NondeterministicFiniteAutomaton,
+    State,
+    Symbol,
+)
+
+
+class Grammar(NamedTuple):
+    """
+    Context-free language value of the query language.
+
+    The productions may use the nonterminals `binding_variable(i)` of other
+    bindings without defining them, `references` lists those bindings.
+    Variables of a value are prefixed with the id of the plan node that
+    made it, so values of different nodes never share a variable.
+    """
+
+    start: Variable
+    productions: frozenset[Production]
+    references: frozenset[int]
+
+
+def binding_variable(binding: int) -> Variable:
+    return Variable(f"B{binding}")
+
+
+def symbol_fa(label: str) -> DeterministicFiniteAutomaton:
+    fa = DeterministicFiniteAutomaton()
+    fa.add_transition(State(0), Symbol(label), State(1))
+    fa.add_start_state(State(0))
+    fa.add_final_state(State(1))
+    return fa
+
+
+def epsilon_fa() -> DeterministicFiniteAutomaton:
+    fa = DeterministicFiniteAutomaton()
+    fa.add_start_state(State(0))
+    fa.add_final_state(State(0))
+    return fa
+
+
+def repeat_fa(
+    fa: EpsilonNFA, low: int, high: int | None
+) -> DeterministicFiniteAutomaton:
+    """
+    minimal automaton of fa^[low..high], high None is unbounded
+
+    The repetition is built as one automaton instead of concatenating
+    copies: state (q, i) is state q of the minimal automaton of fa after i
+    complete words, a final q may also continue as the start of word i + 1.
+    Only the levels up to high are built, or up to low when unbounded, the
+    last of which then loops back to itself.
+    """
+    dfa = fa.minimize()
+    levels = max(low, 1) if high is None else high
+    if levels == 0 or not dfa.start_states:
+        return epsilon_fa() if low == 0 else DeterministicFiniteAutomaton()
+    (start,) = dfa.start_states
+    transitions = dfa.to_dict()
+    nullable = start in dfa.final_states
+
+    nfa = NondeterministicFiniteAutomaton()
+    initial = State("start")
+    nfa.add_start_state(initial)
+    if low == 0 or nullable:
+        nfa.add_final_state(initial)
+    for symbol, target in transitions.get(start, {}).items():
+        nfa.add_transition(initial, symbol, State((target, 0)))
+    for level in range(levels):
+        following = level + 1 if level + 1 < levels else None
+        if high is None and following is None:
+            following = level
+        for source in dfa.states:
+            state = State((source, level))
+            final = source in dfa.final_states
+            if final and (level + 1 >= low or nullable):
+                nfa.add_final_state(state)
+            for symbol, target in transitions.get(source, {}).items():
+                nfa.add_transition(state, symbol, State((target, level)))
+            if final and following is not None:
+                for symbol, target in transitions.get(start, {}).items():
+                    nfa.add_transition(state, symbol, State((target, following)))
+    return nfa.minimize()
+
+
+class GrammarBuilder:
+    """
+    Makes the productions of one grammar value with fresh variables.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.productions: set[Production] = set()
+        self.references: set[int] = set()
+        self._fresh = itertools.count()
+
+    def variable(self) -> Variable:
+        return Variable(f"{self.prefix}_{next(self._fresh)}")
+
+    def add(self, head: Variable, body: Iterable[Variable | Terminal]) -> None:
+        self.productions.add(Production(head, list(body)))
+
+    def include(self, grammar: Grammar) -> Variable:
+        self.productions.update(grammar.productions)
+        self.references.update(grammar.references)
+        return grammar.start
+
+    def build(self, start: Variable) -> Grammar:
+        return Grammar(start, frozenset(self.productions), frozenset(self.references))
+
+
+def fa_grammar(fa: EpsilonNFA, prefix: str) -> Grammar:
+    """
+    right-linear grammar of an automaton, a variable per state
+    """
+    dfa = fa if isinstance(fa, DeterministicFiniteAutomaton) else fa.minimize()
+    builder = GrammarBuilder(prefix)
+    start = builder.variable()
+    states = {state: builder.variable() for state in dfa.states}
+    for state in dfa.start_states:
+        builder.add(start, [states[state]])
+    for state in dfa.final_states:
+        builder.add(states[state], [])
+    for source, transitions in dfa.to_dict().items():
+        for symbol, target in transitions.items():
+            builder.add(states[source], [Terminal(symbol.value), states[target]])
+    return builder.build(start)
+
+
+def combine(grammars: list[Grammar], prefix: str, bodies: list[list[int]]) -> Grammar:
+    """
+    grammar of a new start variable with one body per list of operand indices
+    """
+    builder = GrammarBuilder(prefix)
+    starts = [builder.include(grammar) for grammar in grammars]
+    start = builder.variable()
+    for body in bodies:
+        builder.add(start, [starts[i] for i in body])
+    return builder.build(start)
+
+
+def _power(builder: GrammarBuilder, symbol: Variable, count: int) -> list[Variable]:
+    """
+    body deriving symbol^count through O(log count) squaring variables
+    """
+    body = []
+    while count:
+        if count & 1:
+            body.append(symbol)
+        count >>= 1
+        if count:
+            square = builder.variable()
+            builder.add(square, [symbol, symbol])
+            symbol = square
+    return body
+
+
+def repeat_grammar(
+    grammar: Grammar, low: int, high: int | None, prefix: str
+) -> Grammar:
+    builder = GrammarBuilder(prefix)
+    operand = builder.include(grammar)
+    start = builder.variable()
+    tail = builder.variable()
+    if high is None:
+        builder.add(tail, [operand, tail])
+        builder.add(tail, [])
+        tails = [tail]
+    else:
+        builder.add(tail, [operand])
+        builder.add(tail, [])
+        tails = _power(builder, tail, high - low)
+    builder.add(start, _power(builder, operand, low) + tails)
+    return builder.build(start)
+
+
+def resolve(grammar: Grammar, binding_grammar: Callable[[int], Grammar]) -> CFG:
+    """
+    complete grammar of a value with the productions of every binding it
+    refers to, directly or through other bindings
+    :param binding_grammar: grammar value of a binding by its id
+    """
+    productions = set(grammar.productions)
+    pending, seen = list(grammar.references), set(grammar.references)
+    while pending:
+        binding = pending.pop()
+        value = binding_grammar(binding)
+        productions.update(value.productions)
+        productions.add(Production(binding_variable(binding), [value.start]))
+        for reference in value.references - seen:
+            seen.add(reference)
+            pending.append(reference)
+    return CFG(start_symbol=grammar.start, productions=productions)
+
+
+def intersect_grammar(cfg: CFG, fa: EpsilonNFA, prefix: str) -> Grammar:
+    """
+    grammar of the intersection of a complete grammar with a regular language
+
+    A variable (X, p, q) derives the words of X that lead the minimal
+    automaton of fa from p to q. Only the triples that derive some word are
+    made: the pairs of states every variable connects are computed first,
+    as a path query of the grammar over the automaton, and the productions
+    are then built top-down from the start triples, so the result has no
+    useless variables.
+    """
+    dfa = fa.minimize()
+    transitions = {
+        source: {symbol.value: target for symbol, target in edges.items()}
+        for source, edges in dfa.to_dict().items()
+    }
+    by_head: dict[Variable, list[tuple]] = {}
+    for production in cfg.productions:
+        body = tuple(
+            symbol for symbol in production.body if not isinstance(symbol, Epsilon)
+        )
+        by_head.setdefault(production.head, []).append(body)
+
+    def steps(symbol, source, reach):
+        if isinstance(symbol, Variable):
+            return reach.get((symbol, source), ())
+        target = transitions.get(source, {}).get(symbol.value)
+        return () if target is None else (target,)
+
+    def ends(body, source, reach):
+        states = {source}
+        for symbol in body:
+            states = {
+                target for state in states for target in steps(symbol, state, reach)
+            }
+        return states
+
+    # states reachable from every state by a word of every variable
+    reach: dict[tuple[Variable, State], set[State]] = {}
+    changed = True
+    while changed:
+        changed = False
+        for head, bodies in by_head.items():
+            for source in dfa.states:
+                known = reach.setdefault((head, source), set())
+                for body in bodies:
+                    new = ends(body, source, reach) - known
+                    if new:
+                        known |= new
+                        changed = True
+
+    builder = GrammarBuilder(prefix)
+    names: dict[tuple[Variable, State, State], Variable] = {}
+    pending: list[tuple[Variable, State, State]] = []
+
+    def name(head, source, target):
+        key = (head, source, target)
+        if key not in names:
+            names[key] = builder.variable()
+            pending.append(key)
+        return names[key]
+
+    suffixes: dict[tuple[tuple, State], set[State]] = {}
+
+    def paths(body, source, target):
+        if not body:
+            if source == target:
+                yield []
+            return
+        symbol, rest = body[0], body[1:]
+        for middle in steps(symbol, source, reach):
+            if (rest, middle) not in suffixes:
+                suffixes[rest, middle] = ends(rest, middle, reach)
+            if target not in suffixes[rest, middle]:
+                continue
+            step = symbol
+            if isinstance(symbol, Variable):
+                step = name(symbol, source, middle)
+            for tail in paths(rest, middle, target):
+                yield [step, *tail]
+
+    start = builder.variable()
+    for initial in dfa.start_states:
+        for final in reach.get((cfg.start_symbol, initial), set()):
+            if final in dfa.final_states:
+                builder.add(start, [name(cfg.start_symbol, initial, final)])
+    while pending:
+        head, source, target = pending.pop()
+        for body in by_head.get(head, []):
+            for derived in paths(body, source, target):
+                builder.add(names[head, source, target], derived)
+    return builder.build(start)
@@ -0,0 +1,218 @@
+import functools
+import hashlib
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Generic, Hashable, Iterator, TypeVar
+
+from networkx import MultiDiGraph
+from pyformlang.regular_expression import Regex
+from pyformlang.regular_expression import regex_objects
+
+V = TypeVar("V")
+
+GRAPH_VERSION = "version"
+_versions = itertools.count(1)
+# id -> (graph, digest) of the unstamped graphs of a pinned_graph_versions block
+_pinned: ContextVar[dict[int, tuple[MultiDiGraph, Hashable]] | None] = ContextVar(
+    "pinned_graph_versions", default=None
+)
+
+
+class LRUCache(Generic[V]):
+    """
+    Least-recently-used cache bounded by the number of entries and their total size.
+
+    The size of an entry is given by `sizeof` (bytes by convention), entries are
+    evicted from the least recently used end until both bounds hold again.
+    A bound of None disables it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = 256,
+        max_bytes: int | None = None,
+        sizeof: Callable[[V], int] = lambda _: 0,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[V, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: V | None = None) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: V) -> None:
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        size = self.sizeof(value)
+        self._entries[key] = (value, size)
+        self.bytes += size
+        self._evict()
+
+    def get_or_create(self, key: Hashable, create: Callable[[], V]) -> V:
+        """
+        cached value of a key, computed by `create` on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        value = create()
+        self.put(key, value)
+        return value
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_entries: int | None, max_bytes: int | None = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _normalize(regex: Regex) -> tuple:
+    head = regex.head
+    if isinstance(head, regex_objects.Empty):
+        return ("empty",)
+    if isinstance(head, regex_objects.Epsilon):
+        return ("eps",)
+    if isinstance(head, regex_objects.Symbol):
+        return ("sym", head.value)
+
+    sons = [_normalize(son) for son in regex.sons]
+    if isinstance(head, regex_objects.KleeneStar):
+        (son,) = sons
+        if son[0] in ("star", "eps"):
+            return son
+        if son[0] == "empty":
+            return ("eps",)
+        return ("star", son)
+
+    if isinstance(head, regex_objects.Concatenation):
+        parts = []
+        for son in sons:
+            if son[0] == "empty":
+                return son
+            if son[0] == "cat":
+                parts.extend(son[1])
+            elif son[0] != "eps":
+                parts.append(son)
+        if not parts:
+            return ("eps",)
+        return parts[0] if len(parts) == 1 else ("cat", tuple(parts))
+
+    alternatives = set()
+    for son in sons:
+        if son[0] == "alt":
+            alternatives.update(son[1])
+        elif son[0] != "empty":
+            alternatives.add(son)
+    if not alternatives:
+        return ("empty",)
+    if len(alternatives) == 1:
+        return alternatives.pop()
+    return ("alt", tuple(sorted(alternatives, key=repr)))
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_regex(regex: str) -> tuple:
+    """
+    canonical form of a regular expression used as a cache key
+    :param regex: regular expression in pyformlang syntax
+    :return: hashable AST with flattened and sorted unions, flattened
+        concatenations and simplified epsilons and stars
+    """
+    return _normalize(Regex(regex))
+
+
+def touch_graph(graph: MultiDiGraph) -> int:
+    """
+    give a graph a fresh version stamp, must be called after every mutation
+    of a graph that was stamped before (graph.copy() copies the stamp too)
+    :param graph: graph to stamp
+    :return: the new stamp
+    """
+    version = next(_versions)
+    graph.graph[GRAPH_VERSION] = version
+    return version
+
+
+@contextmanager
+def pinned_graph_versions() -> Iterator[None]:
+    """
+    hash every unstamped graph at most once within the block or the
+    decorated function, for a query whose steps each look up the same
+    graph; the graphs must not change inside it
+    """
+    if _pinned.get() is not None:
+        yield
+        return
+    token = _pinned.set({})
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def graph_version(graph: MultiDiGraph) -> Hashable:
+    """
+    version stamp of a graph
+    :param graph: graph with edge labels in the "label" attribute
+    :return: the stamp set by touch_graph or, for graphs that were never
+        stamped, a digest of the vertices and labelled edges, see also
+        pinned_graph_versions
+    """
+    version = graph.graph.get(GRAPH_VERSION)
+    if version is not None:
+        return ("stamp", version)
+    pinned = _pinned.get()
+    if pinned is not None and id(graph) in pinned:
+        return pinned[id(graph)][1]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(graph.nodes)).encode())
+    digest.update(repr(list(graph.edges(data="label"))).encode())
+    version = ("digest", digest.hexdigest())
+    if pinned is not None:
+        # the graph is kept so that its id is not reused within the block
+        pinned[id(graph)] = (graph, version)
+    return version
@@ -0,0 +1,154 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class QueryStats:
+    """
+    Measurements of query engine runs, phase by phase.
+
+    An engine given a stats object adds the wall time of each of its phases
+    (building the automata, the intersection, the closure, ...) to
+    `seconds`, its totals such as iteration or descriptor counts to
+    `counts` and values taken once per iteration, such as the non-zeros of
+    a front or a delta, to `series`. Query planners add the engine they
+    chose and why to `decisions`. With `memory` the peak memory allocated
+    by Python during the outermost phases is traced as well. Several runs
+    can share one object, their measurements add up.
+    """
+
+    enabled = True
+
+    def __init__(self, memory: bool = False):
+        """
+        :param memory: trace the peak memory with tracemalloc, which slows
+            down allocations while a phase runs
+        """
+        self.memory = memory
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.series: dict[str, list[int]] = {}
+        self.decisions: list[dict[str, Any]] = []
+        self.peak_memory = 0
+        self._depth = 0
+        self._tracing = False
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        add the wall time of the block to the phase, nested phases are
+        counted in the enclosing ones as well
+        """
+        if self.memory and self._depth == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = (
+                self.seconds.get(name, 0.0) + time.perf_counter() - start
+            )
+            self._depth -= 1
+            if self._tracing and self._depth == 0:
+                self.peak_memory = max(
+                    self.peak_memory, tracemalloc.get_traced_memory()[1]
+                )
+                tracemalloc.stop()
+                self._tracing = False
+
+    def timed(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        the items, the time spent producing each of them is added to the
+        phase, the time the consumer spends is not
+        """
+        items = iter(items)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def record(self, name: str, value: int) -> None:
+        """
+        append a value to a per-iteration series
+        """
+        self.series.setdefault(name, []).append(value)
+
+    def decide(self, planner: str, decision: dict[str, Any]) -> None:
+        """
+        record the choice of a query planner with the estimates it is based on
+        """
+        self.decisions.append({"planner": planner, **decision})
+
+    def add(self, other: "QueryStats") -> None:
+        """
+        add the measurements of another object to these
+        """
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        for name, value in other.counts.items():
+            self.count(name, value)
+        for name, values in other.series.items():
+            self.series.setdefault(name, []).extend(values)
+        self.decisions.extend(other.decisions)
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "seconds": dict(self.seconds),
+            "counts": dict(self.counts),
+            "series": {name: list(values) for name, values in self.series.items()},
+            "decisions": [dict(decision) for decision in self.decisions],
+            "peak_memory": self.peak_memory,
+        }
+
+    def __repr__(self) -> str:
+        phases = ", ".join(
+            f"{name}={value:.4f}s" for name, value in self.seconds.items()
+        )
+        counts = ", ".join(f"{name}={value}" for name, value in self.counts.items())
+        return f"QueryStats({', '.join(part for part in (phases, counts) if part)})"
+
+
+class _Disabled(QueryStats):
+    """
+    Stats that record nothing, what the engines use when given none.
+    """
+
+    enabled = False
+
+    def phase(self, name: str) -> ContextManager[None]:
+        return _NO_PHASE
+
+    def timed(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        return iter(items)
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def record(self, name: str, value: int) -> None:
+        pass
+
+    def decide(self, planner: str, decision: dict[str, Any]) -> None:
+        pass
+
+    def add(self, other: QueryStats) -> None:
+        pass
+
+
+_NO_PHASE = nullcontext()
+NO_STATS: QueryStats = _Disabled()
+
+
+def stats_or_disabled(stats: QueryStats | None) -> QueryStats:
+    return NO_STATS if stats is None else stats
@@ -0,0 +1,204 @@
+from typing import Iterable, Literal, NamedTuple
+
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Symbol
+
+from project.bool_decomposition import SparseFormat
+from project.cost_model import fit_costs, label_counts, load_cost_model
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_cache import pinned_graph_versions
+from project.query_stats import QueryStats, stats_or_disabled
+from project.task3 import AdjacencyMatrixFA, regex_to_matrix_fa, tensor_based_rpq
+from project.task4 import Direction, ms_bfs_based_rpq
+
+RpqEngine = Literal["tensor", "ms_bfs"]
+RPQ_ENGINES: tuple[str, ...] = ("tensor", "ms_bfs")
+
+
+class RpqFeatures(NamedTuple):
+    """
+    Sizes of a regular path query the engine costs are estimated from.
+
+    `edges` is the number of edges of the product of the graph and the
+    query DFA: the edges of every label times its DFA transitions, so
+    labels the query does not read and rare labels weigh little.
+    `sources` and `targets` are the sizes of the start and final sets,
+    the number of vertices for an empty set.
+    """
+
+    vertices: int
+    states: int
+    edges: int
+    sources: int
+    targets: int
+
+
+class RpqCostModel(NamedTuple):
+    """
+    Seconds per unit of work of the RPQ engines.
+
+    tensor_based_rpq costs a fixed overhead, the building of the product
+    and its closure, which may walk the product edges once per product
+    state. ms_bfs_based_rpq costs a fixed overhead, the graph matrices and
+    a walk over the product edges per source. The defaults favour ms-bfs
+    up to a few sources per thousand product states, scripts/calibrate_cost_model.py
+    fits the coefficients on the local machine.
+    """
+
+    tensor_fixed: float = 1e-3
+    tensor_edges: float = 2e-7
+    tensor_closure: float = 2e-10
+    ms_bfs_fixed: float = 1e-3
+    ms_bfs_edges: float = 1e-7
+    ms_bfs_sources: float = 5e-8
+
+
+class RpqPlan(NamedTuple):
+    """
+    How rpq evaluates a query, with the estimated seconds of both engines.
+    """
+
+    engine: RpqEngine
+    format: SparseFormat
+    direction: Direction
+    tensor_cost: float
+    ms_bfs_cost: float
+
+
+def rpq_features(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+) -> RpqFeatures:
+    """
+    sizes of a query, the label counts and the DFA are cached
+    """
+    regex_fa = regex_to_matrix_fa(regex)
+    counts = label_counts(graph)
+    edges = sum(
+        counts.get(label.value if isinstance(label, Symbol) else label, 0) * matrix.nnz
+        for label, matrix in regex_fa.matrices.items()
+    )
+    vertices = graph.number_of_nodes()
+    return RpqFeatures(
+        vertices,
+        regex_fa.states_count,
+        edges,
+        len(start_nodes) or vertices,
+        len(final_nodes) or vertices,
+    )
+
+
+def _tensor_work(features: RpqFeatures) -> tuple[float, float, float]:
+    product_states = features.vertices * features.states
+    return 1.0, features.edges, product_states * features.edges
+
+
+def _ms_bfs_work(
+    features: RpqFeatures, direction: Direction
+) -> tuple[float, float, float]:
+    sources = features.sources if direction == "forward" else features.targets
+    return 1.0, features.edges, sources * features.edges
+
+
+def _cost(coefficients: Iterable[float], work: Iterable[float]) -> float:
+    return sum(c * w for c, w in zip(coefficients, work))
+
+
+def plan_rpq(features: RpqFeatures, model: RpqCostModel | None = None) -> RpqPlan:
+    """
+    choose the engine, the sparse format and the search direction of a query
+    :param features: see rpq_features
+    :param model: coefficients, the calibrated or default ones if None
+    :return: ms-bfs searches from the smaller of the start and final sets,
+        backward over the column-major copies of the graph matrices, the
+        engine with the smaller estimated cost is chosen
+    """
+    model = model or load_cost_model("rpq", RpqCostModel())
+    direction: Direction = (
+        "backward" if features.targets < features.sources else "forward"
+    )
+    tensor_cost = _cost(model[0:3], _tensor_work(features))
+    ms_bfs_cost = _cost(model[3:6], _ms_bfs_work(features, direction))
+    if tensor_cost < ms_bfs_cost:
+        return RpqPlan("tensor", "csr", "forward", tensor_cost, ms_bfs_cost)
+    format: SparseFormat = "csr" if direction == "forward" else "csc"
+    return RpqPlan("ms_bfs", format, direction, tensor_cost, ms_bfs_cost)
+
+
+# the features and the engine hash an unstamped graph once between them
+@pinned_graph_versions()
+def rpq(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    model: RpqCostModel | None = None,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    regular path query by the engine plan_rpq chooses for it
+    :param regex: regular expression over edge labels or the query automaton
+    :param graph: labelled graph
+    :param start_nodes: start vertices, all vertices if empty
+    :param final_nodes: final vertices, all vertices if empty
+    :param model: see plan_rpq
+    :param stats: gets the planning time, a count of the chosen engine and
+        direction, the plan with its features and the measurements of
+        the engine
+    :return: pairs (u, v) connected by a path whose word matches the regex
+    """
+    stats = stats_or_disabled(stats)
+    with stats.phase("plan"):
+        features = rpq_features(regex, graph, start_nodes, final_nodes)
+        plan = plan_rpq(features, model)
+    stats.count(f"plan_{plan.engine}")
+    stats.decide("rpq", {**plan._asdict(), "features": features._asdict()})
+    if plan.engine == "tensor":
+        return tensor_based_rpq(
+            regex, graph, start_nodes, final_nodes, plan.format, stats=stats
+        )
+    stats.count(f"plan_{plan.direction}")
+    return ms_bfs_based_rpq(
+        regex,
+        graph,
+        start_nodes,
+        final_nodes,
+        plan.format,
+        direction=plan.direction,
+        stats=stats,
+    )
+
+
+def fit_rpq_model(
+    measurements: Iterable[tuple[RpqFeatures, RpqEngine, Direction, float]],
+    defaults: RpqCostModel | None = None,
+) -> RpqCostModel:
+    """
+    coefficients fitted to measured run times
+    :param measurements: features, engine, direction and seconds of every run
+    :param defaults: coefficients of an engine that has no measurements
+    :return: model whose estimates are closest to the measured times
+    """
+    model = defaults or RpqCostModel()
+    work: dict[str, list[tuple[float, ...]]] = {engine: [] for engine in RPQ_ENGINES}
+    seconds: dict[str, list[float]] = {engine: [] for engine in RPQ_ENGINES}
+    for features, engine, direction, time in measurements:
+        if engine not in RPQ_ENGINES:
+            raise ValueError(
+                f"Unknown RPQ engine {engine!r}, "
+                f"expected one of {', '.join(RPQ_ENGINES)}"
+            )
+        work[engine].append(
+            _tensor_work(features)
+            if engine == "tensor"
+            else _ms_bfs_work(features, direction)
+        )
+        seconds[engine].append(time)
+    coefficients = list(model)
+    for offset, engine in ((0, "tensor"), (3, "ms_bfs")):
+        if seconds[engine]:
+            coefficients[offset : offset + 3] = fit_costs(work[engine], seconds[engine])
+    return RpqCostModel(*coefficients)
@@ -0,0 +1,263 @@
+from typing import Hashable, NamedTuple
+
+from pyformlang.finite_automaton import (
+    DeterministicFiniteAutomaton,
+    Epsilon,
+    EpsilonNFA,
+    State,
+    Symbol,
+)
+from pyformlang.rsa import Box, RecursiveAutomaton
+
+
+class RsmSize(NamedTuple):
+    """
+    Size of a recursive automaton: boxes, states and transitions of all boxes.
+    """
+
+    boxes: int
+    states: int
+    transitions: int
+
+
+def rsm_size(rsm: RecursiveAutomaton) -> RsmSize:
+    dfas = [box.dfa for box in rsm.boxes.values()]
+    return RsmSize(
+        len(dfas),
+        sum(len(dfa.states) for dfa in dfas),
+        sum(len(edges) for dfa in dfas for edges in dfa.to_dict().values()),
+    )
+
+
+def _calls(dfa: EpsilonNFA, names: set[Hashable]) -> set[Hashable]:
+    return {
+        symbol.value
+        for edges in dfa.to_dict().values()
+        for symbol in edges
+        if symbol.value in names
+    }
+
+
+def _reachable(boxes: dict[Hashable, EpsilonNFA], start: Hashable) -> set[Hashable]:
+    seen, pending = {start}, [start]
+    while pending:
+        for callee in _calls(boxes[pending.pop()], set(boxes)) - seen:
+            seen.add(callee)
+            pending.append(callee)
+    return seen
+
+
+def _relabel(
+    dfa: EpsilonNFA, names: dict[Hashable, Hashable]
+) -> DeterministicFiniteAutomaton:
+    """
+    minimal automaton of a box with the call labels renamed
+    """
+    nfa = EpsilonNFA()
+    for state in dfa.start_states:
+        nfa.add_start_state(state)
+    for state in dfa.final_states:
+        nfa.add_final_state(state)
+    for source, edges in dfa.to_dict().items():
+        for symbol, targets in edges.items():
+            label = Symbol(names.get(symbol.value, symbol.value))
+            for target in targets if isinstance(targets, set) else {targets}:
+                nfa.add_transition(source, label, target)
+    return nfa.minimize()
+
+
+def _without_self_calls(
+    name: Hashable, dfa: DeterministicFiniteAutomaton
+) -> DeterministicFiniteAutomaton:
+    """
+    box with its regular self calls turned into loops
+
+    A call of the box itself into a final state without transitions
+    (N -> B N | A, so N = B* A) becomes an epsilon move back to the start,
+    and calls from a start state without incoming transitions
+    (N -> N C | A, so N = A C*) become epsilon moves from the final states.
+    Other self calls are kept.
+    """
+    transitions = dfa.to_dict()
+    targets = {target for edges in transitions.values() for target in edges.values()}
+    starts = set(dfa.start_states)
+
+    def tail(source, target):
+        return target in dfa.final_states and not transitions.get(target)
+
+    def head(source, target):
+        return source in starts and source not in targets
+
+    calls = [
+        (source, target)
+        for source, edges in transitions.items()
+        for symbol, target in edges.items()
+        if symbol.value == name
+    ]
+    if not calls or not all(tail(*call) or head(*call) for call in calls):
+        return dfa
+
+    nfa = EpsilonNFA()
+    for state in starts:
+        nfa.add_start_state(state)
+    for state in dfa.final_states:
+        nfa.add_final_state(state)
+    for source, edges in transitions.items():
+        for symbol, target in edges.items():
+            if symbol.value != name:
+                nfa.add_transition(source, symbol, target)
+            elif tail(source, target):
+                for state in starts:
+                    nfa.add_transition(source, Epsilon(), state)
+            else:
+                for state in dfa.final_states:
+                    nfa.add_transition(state, Epsilon(), target)
+    return nfa.minimize()
+
+
+def _inline(
+    boxes: dict[Hashable, EpsilonNFA], start: Hashable
+) -> dict[Hashable, DeterministicFiniteAutomaton]:
+    """
+    boxes with every call of a non-recursive box but the initial one
+    replaced by a copy of the callee
+    """
+    names = set(boxes)
+    calls = {name: _calls(dfa, names) for name, dfa in boxes.items()}
+    recursive = {name for name in names if name in _closure(calls, name)}
+    inlined = names - recursive - {start}
+    expanded: dict[Hashable, DeterministicFiniteAutomaton] = {}
+
+    def expand(name: Hashable) -> DeterministicFiniteAutomaton:
+        if name in expanded:
+            return expanded[name]
+        dfa = boxes[name]
+        nfa = EpsilonNFA()
+        for state in dfa.start_states:
+            nfa.add_start_state(State(("", state.value)))
+        for state in dfa.final_states:
+            nfa.add_final_state(State(("", state.value)))
+        for copy, (source, edges) in enumerate(dfa.to_dict().items()):
+            for symbol, target in edges.items():
+                u, v = State(("", source.value)), State(("", target.value))
+                if symbol.value not in inlined:
+                    nfa.add_transition(u, symbol, v)
+                    continue
+                callee = expand(symbol.value)
+                tag = (copy, symbol.value, target.value)
+                for state in callee.start_states:
+                    nfa.add_transition(u, Epsilon(), State((tag, state.value)))
+                for state in callee.final_states:
+                    nfa.add_transition(State((tag, state.value)), Epsilon(), v)
+                for inner, inner_edges in callee.to_dict().items():
+                    for label, target_state in inner_edges.items():
+                        nfa.add_transition(
+                            State((tag, inner.value)),
+                            label,
+                            State((tag, target_state.value)),
+                        )
+        expanded[name] = nfa.minimize()
+        return expanded[name]
+
+    return {name: expand(name) for name in names - inlined}
+
+
+def _closure(calls: dict[Hashable, set[Hashable]], name: Hashable) -> set[Hashable]:
+    """
+    boxes reachable from the callees of a box
+    """
+    seen: set[Hashable] = set()
+    pending = list(calls[name])
+    while pending:
+        callee = pending.pop()
+        if callee not in seen:
+            seen.add(callee)
+            pending.extend(calls[callee])
+    return seen
+
+
+def _signature(dfa: DeterministicFiniteAutomaton) -> tuple:
+    """
+    canonical form of a minimal automaton, equal for isomorphic ones
+    """
+    if not dfa.start_states:
+        return ()
+    (start,) = dfa.start_states
+    transitions = dfa.to_dict()
+    numbers = {start: 0}
+    order = [start]
+    for state in order:
+        for symbol in sorted(transitions.get(state, {}), key=repr):
+            target = transitions[state][symbol]
+            if target not in numbers:
+                numbers[target] = len(numbers)
+                order.append(target)
+    return tuple(
+        (
+            state in dfa.final_states,
+            tuple(
+                (repr(symbol.value), numbers[target])
+                for symbol, target in sorted(
+                    transitions.get(state, {}).items(), key=lambda item: repr(item[0])
+                )
+            ),
+        )
+        for state in order
+    )
+
+
+def _merge(
+    boxes: dict[Hashable, DeterministicFiniteAutomaton], start: Hashable
+) -> dict[Hashable, DeterministicFiniteAutomaton]:
+    """
+    boxes with the equivalent ones merged
+
+    Boxes are equivalent when their automata are equal once the calls of
+    equivalent boxes are given the same label, the coarsest such partition
+    is found by refining the partition with all boxes in one class.
+    """
+    classes = {name: 0 for name in boxes}
+    while True:
+        labels = {name: ("box", number) for name, number in classes.items()}
+        signatures = {
+            name: (classes[name], _signature(_relabel(dfa, labels)))
+            for name, dfa in boxes.items()
+        }
+        numbering: dict[tuple, int] = {}
+        refined = {
+            name: numbering.setdefault(signature, len(numbering))
+            for name, signature in signatures.items()
+        }
+        if len(numbering) == len(set(classes.values())):
+            break
+        classes = refined
+
+    representative: dict[int, Hashable] = {classes[start]: start}
+    for name in sorted(boxes, key=repr):
+        representative.setdefault(classes[name], name)
+    names = {name: representative[number] for name, number in classes.items()}
+    return {name: _relabel(boxes[name], names) for name in set(representative.values())}
+
+
+def optimize_rsm(rsm: RecursiveAutomaton) -> RecursiveAutomaton:
+    """
+    equivalent recursive automaton with fewer boxes and states
+
+    Boxes unreachable from the initial one are dropped, regular self
+    calls become loops, every call of a box that is not recursive is
+    replaced by the box itself, the remaining boxes are minimized and
+    equivalent boxes merged.
+    :param rsm: recursive automaton
+    :return: automaton accepting the same language with the same initial label
+    """
+    start = rsm.initial_label.value
+    boxes = {label.value: box.dfa for label, box in rsm.boxes.items()}
+    boxes = {
+        name: _without_self_calls(name, boxes[name])
+        for name in _reachable(boxes, start)
+    }
+    boxes = _merge(_inline(boxes, start), start)
+    return RecursiveAutomaton(
+        initial_label=Symbol(start),
+        boxes={Box(dfa, Symbol(name)) for name, dfa in boxes.items()},
+    )
@@ -0,0 +1,109 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple
+
+import numpy as np
+from scipy import sparse
+
+
+class SharedCSR(NamedTuple):
+    """
+    Picklable handle of a Boolean CSR matrix in a shared memory segment.
+
+    The segment holds indptr, indices and data one after another, so a
+    process that attaches to it builds the matrix without copying.
+    """
+
+    name: str
+    shape: tuple[int, int]
+    nnz: int
+    index_dtype: str
+
+
+def _layout(handle: SharedCSR) -> tuple[np.dtype, int, int]:
+    index_dtype = np.dtype(handle.index_dtype)
+    indptr_bytes = (handle.shape[0] + 1) * index_dtype.itemsize
+    indices_bytes = handle.nnz * index_dtype.itemsize
+    return index_dtype, indptr_bytes, indices_bytes
+
+
+def _segment_size(handle: SharedCSR) -> int:
+    _, indptr_bytes, indices_bytes = _layout(handle)
+    # a segment may not be empty
+    return max(1, indptr_bytes + indices_bytes + handle.nnz)
+
+
+def _arrays(
+    segment: SharedMemory, handle: SharedCSR
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    index_dtype, indptr_bytes, indices_bytes = _layout(handle)
+    indptr = np.ndarray(handle.shape[0] + 1, index_dtype, segment.buf, 0)
+    indices = np.ndarray(handle.nnz, index_dtype, segment.buf, indptr_bytes)
+    data = np.ndarray(handle.nnz, np.bool_, segment.buf, indptr_bytes + indices_bytes)
+    return indptr, indices, data
+
+
+def view_csr(segment: SharedMemory, handle: SharedCSR) -> sparse.csr_matrix:
+    """
+    matrix backed by the segment, the segment must stay open while it is used
+    """
+    indptr, indices, data = _arrays(segment, handle)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=handle.shape, copy=False)
+    matrix.has_sorted_indices = True
+    return matrix
+
+
+def _fill(segment: SharedMemory, handle: SharedCSR, matrix: sparse.csr_matrix):
+    indptr, indices, data = _arrays(segment, handle)
+    indptr[:] = matrix.indptr
+    indices[:] = matrix.indices
+    data[:] = matrix.data
+
+
+def share_csr(matrix: sparse.spmatrix) -> tuple[SharedMemory, SharedCSR]:
+    """
+    copy a matrix into a new shared memory segment
+    :param matrix: Boolean sparse matrix
+    :return: the open segment, to be closed and unlinked by the caller or
+        handed over with take_csr, and the handle to send to other processes
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.bool_)
+    matrix.sort_indices()
+    handle = SharedCSR("", matrix.shape, int(matrix.nnz), matrix.indices.dtype.str)
+    segment = SharedMemory(create=True, size=_segment_size(handle))
+    handle = handle._replace(name=segment.name)
+    try:
+        _fill(segment, handle, matrix)
+    except BaseException:
+        release(segment)
+        raise
+    return segment, handle
+
+
+def publish_csr(matrix: sparse.spmatrix) -> SharedCSR:
+    """
+    share a matrix whose segment is taken over by the receiving process
+    :return: handle to pass to take_csr exactly once
+    """
+    segment, handle = share_csr(matrix)
+    segment.close()
+    return handle
+
+
+def take_csr(handle: SharedCSR) -> sparse.csr_matrix:
+    """
+    copy a matrix out of a segment made by publish_csr and free the segment
+    """
+    segment = SharedMemory(handle.name)
+    try:
+        return view_csr(segment, handle).copy()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def release(segment: SharedMemory) -> None:
+    """
+    close and free a segment made by share_csr
+    """
+    segment.close()
+    segment.unlink()
@@ -0,0 +1,189 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Literal
+
+import numpy as np
+from scipy import sparse
+
+SpGEMMBackend = Literal["scipy", "threads"]
+BACKENDS: tuple[str, ...] = ("scipy", "threads")
+
+# products with fewer row merges than this are not split between threads
+MIN_PARALLEL_WORK = 1 << 16
+# row merges of one block, bounds the memory of the merge arrays
+MAX_BLOCK_WORK = 1 << 22
+
+_backend: str = "scipy"
+_workers: int | None = None
+_pools: dict[int, ThreadPoolExecutor] = {}
+
+
+def check_backend(backend: str) -> SpGEMMBackend:
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown matrix product backend {backend!r}, "
+            f"expected one of {', '.join(BACKENDS)}"
+        )
+    return backend
+
+
+def set_backend(backend: SpGEMMBackend, workers: int | None = None) -> None:
+    """
+    choose how bool_matmul multiplies, for every engine at once
+    :param backend: "scipy" uses the sparse matmul of scipy, "threads" uses
+        threaded_bool_matmul
+    :param workers: number of threads, the number of CPUs if None
+    """
+    global _backend, _workers
+    if workers is not None and workers < 1:
+        raise ValueError(f"Number of workers must be positive, got {workers}")
+    _backend, _workers = check_backend(backend), workers
+
+
+def get_backend() -> tuple[SpGEMMBackend, int | None]:
+    return _backend, _workers
+
+
+@contextmanager
+def use_backend(backend: SpGEMMBackend, workers: int | None = None) -> Iterator[None]:
+    """
+    set_backend for the duration of the block
+    """
+    previous = get_backend()
+    set_backend(backend, workers)
+    try:
+        yield
+    finally:
+        set_backend(*previous)
+
+
+def bool_matmul(a: sparse.spmatrix, b: sparse.spmatrix) -> sparse.spmatrix:
+    """
+    Boolean product of two sparse matrices by the current backend
+    """
+    if _backend == "threads":
+        return threaded_bool_matmul(a, b, _workers)
+    return a @ b
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    concatenation of arange(start, start + count) for every pair
+    """
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - (ends - counts), counts)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def _multiply_block(
+    a: sparse.csr_matrix,
+    b: sparse.csr_matrix,
+    b_lengths: np.ndarray,
+    lo: int,
+    hi: int,
+) -> np.ndarray:
+    """
+    non-zeros of rows lo to hi of the product
+    :return: sorted keys row * columns + column, rows counted from lo
+    """
+    columns = b.shape[1]
+    row_start = a.indptr[lo:hi].astype(np.int64)
+    row_end = a.indptr[lo + 1 : hi + 1].astype(np.int64)
+    active = np.nonzero(row_end > row_start)[0]
+    keys = np.empty(0, dtype=np.int64)
+    # every pass merges the next `step` rows of b into each output row, the
+    # step doubles, so rows with a short product leave after a pass or two
+    offset, step = 0, 1
+    while len(active):
+        starts = row_start[active] + offset
+        counts = np.minimum(starts + step, row_end[active]) - starts
+        inner = a.indices[_ranges(starts, counts)]
+        lengths = b_lengths[inner]
+        cols = b.indices[_ranges(b.indptr[inner].astype(np.int64), lengths)]
+        owners = np.repeat(np.repeat(active, counts), lengths)
+        keys = np.union1d(keys, owners * columns + cols)
+        offset += step
+        step *= 2
+        # a row that holds every column cannot grow, its other rows of b
+        # are not merged
+        found = np.searchsorted(keys, (active + 1) * columns) - np.searchsorted(
+            keys, active * columns
+        )
+        left = row_end[active] > row_start[active] + offset
+        active = active[left & (found < columns)]
+    return keys
+
+
+def _row_blocks(work: np.ndarray, count: int) -> list[tuple[int, int]]:
+    # split the rows into ranges with about the same number of row merges
+    total = work[-1]
+    targets = np.linspace(0, total, count + 1)[1:-1]
+    cuts = np.searchsorted(work, targets).tolist()
+    bounds = [0, *cuts, len(work) - 1]
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+
+def _pool(workers: int) -> ThreadPoolExecutor:
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = ThreadPoolExecutor(
+            workers, thread_name_prefix="spgemm"
+        )
+    return pool
+
+
+def threaded_bool_matmul(
+    a: sparse.spmatrix, b: sparse.spmatrix, workers: int | None = None
+) -> sparse.csr_matrix:
+    """
+    Boolean product of sparse matrices computed by row blocks on a thread pool
+
+    A row of the product is the union of the rows of b selected by a row of
+    a. The unions of a block are merged with NumPy sorts, which release the
+    GIL, so the blocks run in parallel. A row stops merging once it holds
+    every column.
+    :param a: left matrix, converted to CSR if it is not
+    :param b: right matrix, converted to CSR if it is not
+    :param workers: number of threads, the number of CPUs if None
+    :return: Boolean CSR matrix with sorted indices
+    """
+    if a.shape[1] != b.shape[0]:
+        raise ValueError(f"Matrices of shapes {a.shape} and {b.shape} do not multiply")
+    a, b = sparse.csr_matrix(a), sparse.csr_matrix(b)
+    rows, columns = a.shape[0], b.shape[1]
+    b_lengths = np.diff(b.indptr).astype(np.int64)
+    # row merges up to every row of a
+    merges = np.concatenate(([0], np.cumsum(b_lengths[a.indices], dtype=np.int64)))
+    work = merges[a.indptr]
+
+    workers = workers or os.cpu_count() or 1
+    count = 1
+    if columns and work[-1] >= MIN_PARALLEL_WORK:
+        count = max(workers, -(-int(work[-1]) // MAX_BLOCK_WORK))
+    blocks = _row_blocks(work, count) if work[-1] else []
+    if len(blocks) > 1:
+        results = list(
+            _pool(workers).map(
+                lambda block: _multiply_block(a, b, b_lengths, *block), blocks
+            )
+        )
+    else:
+        results = [_multiply_block(a, b, b_lengths, lo, hi) for lo, hi in blocks]
+
+    counts = np.zeros(rows, dtype=np.int64)
+    indices = []
+    for (lo, hi), keys in zip(blocks, results):
+        counts[lo:hi] = np.bincount(keys // columns, minlength=hi - lo)
+        indices.append(keys % columns)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    product = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.bool_), indices, indptr),
+        shape=(rows, columns),
+    )
+    product.has_sorted_indices = True
+    return product
@@ -0,0 +1,58 @@
+import pathlib
+from typing import Any, NamedTuple
+
+import cfpq_data
+import networkx as nx
+from networkx import MultiDiGraph
+
+LABEL = "label"
+
+
+class GraphInfo(NamedTuple):
+    """
+    number of vertices and edges of a graph and the labels of its edges
+    """
+
+    nodes: int
+    edges: int
+    labels: set[Any]
+
+
+def load_graph(name: str) -> MultiDiGraph:
+    """
+    load a graph from the CFPQ_Data collection
+    :param name: graph name, e.g. "skos" or "go"
+    :return: graph with edge labels in the "label" attribute
+    """
+    return cfpq_data.graph_from_csv(cfpq_data.download(name))
+
+
+def graph_info(graph: MultiDiGraph) -> GraphInfo:
+    return GraphInfo(
+        graph.number_of_nodes(),
+        graph.number_of_edges(),
+        {label for _, _, label in graph.edges(data=LABEL)},
+    )
+
+
+def get_graph_info(name: str) -> GraphInfo:
+    """
+    number of vertices, edges and the edge labels of a CFPQ_Data graph
+    :param name: graph name
+    :return: graph summary
+    """
+    return graph_info(load_graph(name))
+
+
+def save_two_cycles_graph(
+    n: int, m: int, labels: tuple[str, str], path: str | pathlib.Path
+) -> None:
+    """
+    build a graph of two cycles sharing a vertex and save it in DOT format
+    :param n: number of vertices in the first cycle
+    :param m: number of vertices in the second cycle
+    :param labels: labels of the first and the second cycle
+    :param path: output file
+    """
+    graph = cfpq_data.labeled_two_cycles_graph(n, m, labels=labels)
+    nx.drawing.nx_pydot.write_dot(graph, path)
@@ -0,0 +1,152 @@
+import threading
+
+from antlr4 import CommonTokenStream, InputStream, ParserRuleContext, ParseTreeWalker
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ErrorListener
+from antlr4.error.Errors import ParseCancellationException
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.tree.Tree import TerminalNode
+
+from project.graph_query.GraphQueryLexer import GraphQueryLexer
+from project.graph_query.GraphQueryListener import GraphQueryListener
+from project.graph_query.GraphQueryParser import GraphQueryParser
+
+
+class ProgramSyntaxError(ValueError):
+    """
+    Program that does not parse, carries all syntax errors found.
+    """
+
+    def __init__(self, errors: list[str]):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+class SyntaxErrors(ErrorListener):
+    """
+    Collects the syntax errors of the lexer and the parser instead of
+    printing them.
+    """
+
+    def __init__(self):
+        self.errors: list[str] = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append(f"line {line}:{column} {msg}")
+
+
+class ProgramParser:
+    """
+    Reusable lexer and parser of the query language.
+
+    A program is parsed first with SLL prediction and the bail error
+    strategy, which is enough for every correct program of this grammar and
+    avoids the full-context lookahead of LL. Only when SLL fails the tokens
+    are rewound and parsed again in LL mode with error recovery, so the
+    reported errors are the same as of a plain LL parse. The lexer and the
+    parser are reset between programs instead of being rebuilt, the DFA
+    caches of the prediction are shared by all instances. Lexer errors do not
+    stop the SLL pass, they are reported once either way. An instance parses
+    one program at a time.
+    """
+
+    def __init__(self, sll_first: bool = True):
+        self.sll_first = sll_first
+        self._errors = SyntaxErrors()
+        self._lexer = GraphQueryLexer(InputStream(""))
+        self._lexer.removeErrorListeners()
+        self._lexer.addErrorListener(self._errors)
+        self._tokens = CommonTokenStream(self._lexer)
+        self._parser = GraphQueryParser(self._tokens)
+        # the number of programs that needed the LL pass
+        self.fallbacks = 0
+
+    def parse(self, program: str) -> tuple[GraphQueryParser.ProgContext, list[str]]:
+        """
+        :param program: program text
+        :return: parse tree and the syntax errors met while building it
+        """
+        self._errors.errors = []
+        self._lexer.inputStream = InputStream(program)
+        self._tokens.setTokenSource(self._lexer)
+        if self.sll_first:
+            try:
+                tree = self._parse(PredictionMode.SLL, BailErrorStrategy(), False)
+                return tree, self._errors.errors
+            except ParseCancellationException:
+                self.fallbacks += 1
+                self._tokens.seek(0)
+        tree = self._parse(PredictionMode.LL, DefaultErrorStrategy(), True)
+        return tree, self._errors.errors
+
+    def _parse(self, mode, strategy, report: bool) -> GraphQueryParser.ProgContext:
+        parser = self._parser
+        parser.setTokenStream(self._tokens)
+        parser.removeErrorListeners()
+        if report:
+            parser.addErrorListener(self._errors)
+        parser._interp.predictionMode = mode
+        parser._errHandler = strategy
+        return parser.prog()
+
+
+_parsers = threading.local()
+
+
+def parse_program(program: str) -> tuple[GraphQueryParser.ProgContext, list[str]]:
+    """
+    parse with the program parser of the current thread
+    :param program: program text
+    :return: parse tree and the syntax errors met while building it
+    """
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = _parsers.parser = ProgramParser()
+    return parser.parse(program)
+
+
+def program_to_tree(program: str) -> tuple[ParserRuleContext, bool]:
+    """
+    :param program: program text
+    :return: parse tree and whether the program is syntactically correct
+    """
+    tree, errors = parse_program(program)
+    return tree, not errors
+
+
+class _NodeCounter(GraphQueryListener):
+    def __init__(self):
+        self.count = 0
+
+    def enterEveryRule(self, ctx: ParserRuleContext):
+        self.count += 1
+
+    def visitTerminal(self, node: TerminalNode):
+        self.count += 1
+
+
+def nodes_count(tree: ParserRuleContext) -> int:
+    """
+    :return: number of rule and token nodes of a parse tree
+    """
+    counter = _NodeCounter()
+    ParseTreeWalker.DEFAULT.walk(counter, tree)
+    return counter.count
+
+
+class _TokenCollector(GraphQueryListener):
+    def __init__(self):
+        self.tokens: list[str] = []
+
+    def visitTerminal(self, node: TerminalNode):
+        if node.getSymbol().type != GraphQueryParser.EOF:
+            self.tokens.append(node.getText())
+
+
+def tree_to_program(tree: ParserRuleContext) -> str:
+    """
+    :return: program text of a parse tree, tokens separated by single spaces
+    """
+    collector = _TokenCollector()
+    ParseTreeWalker.DEFAULT.walk(collector, tree)
+    return " ".join(collector.tokens)
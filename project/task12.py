@@ -0,0 +1,59 @@
+from antlr4 import ParserRuleContext
+
+from project.program_plan import PLAN_CACHE, Plan, cached_plan, compile_program
+from project.program_types import ProgramTypeError, TypeChecker
+from project.query_stats import QueryStats
+from project.task11 import ProgramSyntaxError
+
+__all__ = [
+    "PLAN_CACHE",
+    "Plan",
+    "ProgramSyntaxError",
+    "ProgramTypeError",
+    "QueryStats",
+    "compile_program",
+    "exec_program",
+    "infer_types",
+    "plan_cache_stats",
+    "typing_program",
+]
+
+
+def infer_types(tree: ParserRuleContext) -> dict[str, str]:
+    """
+    :param tree: parse tree of a program
+    :return: type of every bound name after the last statement
+    :raise ProgramTypeError: if the program is ill-typed
+    """
+    return TypeChecker().check(tree)
+
+
+def typing_program(program: str) -> bool:
+    """
+    :return: whether the program parses and is well-typed, a well-typed
+        program is compiled and its plan cached for exec_program
+    """
+    try:
+        cached_plan(program)
+    except (ProgramSyntaxError, ProgramTypeError):
+        return False
+    return True
+
+
+def exec_program(
+    program: str, stats: dict[int, QueryStats] | None = None
+) -> dict[str, set[tuple]]:
+    """
+    run a program, parsing, typing and compiling it only on the first run
+    of its text
+    :param stats: gets the measurements of every statement by its index in
+        the program, see Plan.run
+    :return: for every name bound to a select the value of the select
+    :raise ProgramSyntaxError: if the program does not parse
+    :raise ProgramTypeError: if the program is ill-typed
+    """
+    return cached_plan(program).run(stats)
+
+
+def plan_cache_stats() -> dict[str, int]:
+    return PLAN_CACHE.stats()
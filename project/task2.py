@@ -0,0 +1,90 @@
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import (
+    DeterministicFiniteAutomaton,
+    NondeterministicFiniteAutomaton,
+    State,
+    Symbol,
+)
+from pyformlang.regular_expression import Regex
+
+from project.edge_list_graph import EdgeListGraph
+from project.query_cache import LRUCache, graph_version, normalize_regex
+
+LABEL = "label"
+
+# a DFA transition costs roughly a dict slot and two boxed states
+DFA_CACHE: LRUCache[DeterministicFiniteAutomaton] = LRUCache(
+    max_entries=512,
+    sizeof=lambda dfa: 200 * (dfa.get_number_transitions() + len(dfa.states)),
+)
+NFA_CACHE: LRUCache[NondeterministicFiniteAutomaton] = LRUCache(
+    max_entries=32,
+    max_bytes=1 << 30,
+    sizeof=lambda nfa: 200 * (nfa.get_number_transitions() + len(nfa.states)),
+)
+
+
+def regex_to_dfa(regex: str) -> DeterministicFiniteAutomaton:
+    """
+    build the minimal DFA for a regular expression
+    :param regex: regular expression in pyformlang syntax
+    :return: minimal deterministic finite automaton, a fresh copy of the one
+        cached for all regexes with the same normalized AST
+    """
+    dfa = DFA_CACHE.get_or_create(
+        normalize_regex(regex), lambda: Regex(regex).to_epsilon_nfa().minimize()
+    )
+    return dfa.copy()
+
+
+def graph_to_nfa(
+    graph: MultiDiGraph | EdgeListGraph,
+    start_states: set[int],
+    final_states: set[int],
+    copy: bool = True,
+) -> NondeterministicFiniteAutomaton:
+    """
+    view a labelled graph as a nondeterministic finite automaton
+    :param graph: graph with edge labels stored in the "label" attribute,
+        see query_cache.touch_graph for mutable graphs
+    :param start_states: start vertices, all vertices if empty
+    :param final_states: final vertices, all vertices if empty
+    :param copy: return a copy of the automaton cached for the graph
+        version and the start and final sets, False shares the cached one,
+        which must not be modified then
+    :return: automaton whose states are the graph vertices
+    """
+    key = (
+        "nfa",
+        graph_version(graph),
+        frozenset(start_states or ()),
+        frozenset(final_states or ()),
+    )
+    nfa = NFA_CACHE.get_or_create(
+        key, lambda: _build_nfa(graph, start_states, final_states)
+    )
+    return nfa.copy() if copy else nfa
+
+
+def _build_nfa(
+    graph: MultiDiGraph | EdgeListGraph,
+    start_states: set[int],
+    final_states: set[int],
+) -> NondeterministicFiniteAutomaton:
+    nfa = NondeterministicFiniteAutomaton()
+    if isinstance(graph, EdgeListGraph):
+        nodes = graph.nodes.tolist()
+        edges = graph.edges()
+    else:
+        nodes = list(graph.nodes)
+        edges = graph.edges(data=LABEL)
+
+    for u, v, label in edges:
+        nfa.add_transition(State(u), Symbol(label), State(v))
+
+    for node in start_states if start_states else nodes:
+        nfa.add_start_state(State(node))
+    for node in final_states if final_states else nodes:
+        nfa.add_final_state(State(node))
+
+    return nfa
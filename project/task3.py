@@ -0,0 +1,426 @@
+from typing import Hashable, Iterable, Iterator, Literal
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, Symbol
+from pyformlang.finite_automaton.finite_automaton import to_symbol
+from scipy import sparse
+
+from project.answers import Answers
+from project.bool_decomposition import BoolDecomposition, SparseFormat, check_format
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_cache import LRUCache, graph_version, normalize_regex
+from project.query_stats import QueryStats, stats_or_disabled
+from project.spgemm import bool_matmul
+from project.task2 import DFA_CACHE, NFA_CACHE, graph_to_nfa, regex_to_dfa
+
+ClosureMethod = Literal["naive", "semi-naive", "squaring"]
+CLOSURE_METHODS: tuple[str, ...] = ("naive", "semi-naive", "squaring")
+
+
+class AdjacencyMatrixFA:
+    """
+    Finite automaton stored as a Boolean decomposition of its adjacency matrix.
+
+    States are numbered from zero, `states[i]` is the value of the i-th state
+    of the source automaton (a graph vertex for automata built by graph_to_nfa).
+    """
+
+    def __init__(
+        self,
+        fa: NondeterministicFiniteAutomaton | None,
+        format: SparseFormat = "csr",
+    ):
+        self.format = check_format(format)
+        self.states: list[Hashable] = []
+        self.state_index: dict[Hashable, int] = {}
+        self.start_states: set[int] = set()
+        self.final_states: set[int] = set()
+        self.matrices = BoolDecomposition(0, self.format)
+
+        if fa is None:
+            return
+
+        for state in fa.states:
+            self.state_index[state.value] = len(self.states)
+            self.states.append(state.value)
+        self.start_states = {self.state_index[s.value] for s in fa.start_states}
+        self.final_states = {self.state_index[s.value] for s in fa.final_states}
+
+        edges: dict[Symbol, tuple[list[int], list[int]]] = {}
+        for u, transitions in fa.to_dict().items():
+            for symbol, targets in transitions.items():
+                rows, cols = edges.setdefault(symbol, ([], []))
+                if not isinstance(targets, set):
+                    targets = {targets}
+                for v in targets:
+                    rows.append(self.state_index[u.value])
+                    cols.append(self.state_index[v.value])
+        self.matrices = BoolDecomposition.from_edges(
+            self.states_count, edges, self.format
+        )
+
+    @classmethod
+    def from_matrices(
+        cls,
+        states: list[Hashable],
+        matrices: BoolDecomposition,
+        start_nodes: set[Hashable],
+        final_nodes: set[Hashable],
+    ) -> "AdjacencyMatrixFA":
+        """
+        automaton over an existing decomposition, the matrices are shared
+        :param states: state values by index
+        :param matrices: per-label matrices, their format is used for the automaton
+        :param start_nodes: start states, all states if empty
+        :param final_nodes: final states, all states if empty
+        """
+        fa = cls(None, matrices.format)
+        fa.states = states
+        fa.state_index = {node: i for i, node in enumerate(states)}
+        fa.start_states = (
+            {fa.state_index[node] for node in start_nodes if node in fa.state_index}
+            if start_nodes
+            else set(range(len(states)))
+        )
+        fa.final_states = (
+            {fa.state_index[node] for node in final_nodes if node in fa.state_index}
+            if final_nodes
+            else set(range(len(states)))
+        )
+        fa.matrices = matrices
+        return fa
+
+    @classmethod
+    def from_edge_list(
+        cls,
+        graph: EdgeListGraph,
+        start_nodes: set[int],
+        final_nodes: set[int],
+        format: SparseFormat = "csr",
+    ) -> "AdjacencyMatrixFA":
+        """
+        the automaton of graph_to_nfa built straight from the edge arrays
+        :param graph: compact graph
+        :param start_nodes: start vertices, all vertices if empty
+        :param final_nodes: final vertices, all vertices if empty
+        :param format: sparse format of the per-label matrices
+        """
+        matrices = BoolDecomposition.from_edges(
+            graph.number_of_nodes(),
+            {Symbol(label): (src, dst) for label, src, dst in graph.edges_by_label()},
+            format,
+        )
+        return cls.from_matrices(
+            graph.nodes.tolist(), matrices, start_nodes, final_nodes
+        )
+
+    @property
+    def states_count(self) -> int:
+        return len(self.states)
+
+    def accepts(self, word: Iterable[Symbol]) -> bool:
+        front = np.zeros(self.states_count, dtype=np.bool_)
+        front[list(self.start_states)] = True
+        for symbol in word:
+            symbol = to_symbol(symbol)
+            if symbol not in self.matrices:
+                return False
+            front = self.matrices.backward(symbol) @ front
+            if not front.any():
+                return False
+        return bool(front[list(self.final_states)].any())
+
+    def reversed(self) -> "AdjacencyMatrixFA":
+        """
+        automaton of the reversed language with the start and final states
+        swapped, its matrices are transposes backed by the column-major
+        copies of these
+        """
+        fa = AdjacencyMatrixFA(None, "csr")
+        fa.states, fa.state_index = self.states, self.state_index
+        fa.start_states, fa.final_states = self.final_states, self.start_states
+        fa.matrices = BoolDecomposition(self.states_count, "csr")
+        for label in self.matrices:
+            fa.matrices[label] = self.matrices.backward(label)
+        return fa
+
+    def transitive_closure(
+        self, method: ClosureMethod = "semi-naive", stats: QueryStats | None = None
+    ) -> sparse.csr_matrix:
+        """
+        reflexive transitive closure of the adjacency matrix
+        :param method: see reflexive_transitive_closure
+        :param stats: see reflexive_transitive_closure
+        :return: matrix with (i, j) set iff j is reachable from i
+        """
+        return reflexive_transitive_closure(self.matrices.union(), method, stats)
+
+    def is_empty(self) -> bool:
+        if not self.start_states or not self.final_states:
+            return True
+        closure = self.transitive_closure()
+        starts = sorted(self.start_states)
+        finals = sorted(self.final_states)
+        return closure[starts][:, finals].nnz == 0
+
+    def memory_usage(self) -> dict[str, int]:
+        """
+        memory footprint of the per-label matrices, see BoolDecomposition
+        """
+        return self.matrices.memory_usage()
+
+
+def reflexive_transitive_closure(
+    adjacency: sparse.spmatrix,
+    method: ClosureMethod = "semi-naive",
+    stats: QueryStats | None = None,
+) -> sparse.csr_matrix:
+    """
+    reflexive transitive closure of a Boolean adjacency matrix
+    :param adjacency: square matrix
+    :param method: "naive" extends the whole closure by one step per round,
+        "semi-naive" extends only the pairs found on the previous round,
+        "squaring" squares the closure, needing log(diameter) rounds
+    :param stats: gets the rounds and the non-zeros of the closure after
+        every round
+    :return: matrix with (i, j) set iff j is reachable from i, the
+        products are taken by the spgemm backend
+    """
+    if method not in CLOSURE_METHODS:
+        raise ValueError(
+            f"Unknown closure method {method!r}, "
+            f"expected one of {', '.join(CLOSURE_METHODS)}"
+        )
+    stats = stats_or_disabled(stats)
+    adjacency = sparse.csr_matrix(adjacency, dtype=np.bool_)
+    closure = sparse.identity(adjacency.shape[0], dtype=np.bool_, format="csr")
+
+    if method == "squaring":
+        closure = closure + adjacency
+        while True:
+            new_closure = bool_matmul(closure, closure)
+            stats.count("closure_rounds")
+            stats.record("closure_nnz", new_closure.nnz)
+            if new_closure.nnz == closure.nnz:
+                return closure
+            closure = new_closure
+
+    if method == "semi-naive":
+        delta = closure
+        while delta.nnz > 0:
+            delta = bool_matmul(delta, adjacency) > closure
+            closure = closure + delta
+            stats.count("closure_rounds")
+            stats.record("closure_nnz", closure.nnz)
+        return closure
+
+    while True:
+        new_closure = closure + bool_matmul(closure, adjacency)
+        stats.count("closure_rounds")
+        stats.record("closure_nnz", new_closure.nnz)
+        if new_closure.nnz == closure.nnz:
+            return closure
+        closure = new_closure
+
+
+MATRIX_FA_CACHE: LRUCache[AdjacencyMatrixFA] = LRUCache(
+    max_entries=256,
+    max_bytes=1 << 30,
+    sizeof=lambda fa: fa.matrices.nbytes(),
+)
+
+
+def regex_to_matrix_fa(
+    regex: str | AdjacencyMatrixFA, format: SparseFormat = "csr"
+) -> AdjacencyMatrixFA:
+    """
+    matrix form of the minimal DFA of a regular expression
+    :param regex: regular expression in pyformlang syntax, or an automaton
+        that is returned as it is apart from the format of its matrices
+    :param format: sparse format of the per-label matrices
+    :return: automaton shared between all callers with an equivalent regex,
+        it must not be modified
+    """
+    if isinstance(regex, AdjacencyMatrixFA):
+        if regex.format == check_format(format):
+            return regex
+        fa = AdjacencyMatrixFA(None, format)
+        fa.states, fa.state_index = regex.states, regex.state_index
+        fa.start_states, fa.final_states = regex.start_states, regex.final_states
+        fa.matrices = regex.matrices.with_format(format)
+        return fa
+    key = ("regex", normalize_regex(regex), check_format(format))
+    return MATRIX_FA_CACHE.get_or_create(
+        key, lambda: AdjacencyMatrixFA(regex_to_dfa(regex), format)
+    )
+
+
+def graph_to_matrix_fa(
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+) -> AdjacencyMatrixFA:
+    """
+    matrix form of graph_to_nfa, cached by the graph version stamp
+    :param graph: labelled graph, see query_cache.touch_graph for mutable graphs
+    :param start_nodes: start vertices, all vertices if empty
+    :param final_nodes: final vertices, all vertices if empty
+    :param format: sparse format of the per-label matrices
+    :return: automaton shared between callers with the same graph version and
+        start and final sets, it must not be modified
+    """
+    start_nodes, final_nodes = frozenset(start_nodes), frozenset(final_nodes)
+    if isinstance(graph, MatrixIndex):
+        # the matrices are already in memory, only the start and final sets differ
+        return AdjacencyMatrixFA.from_matrices(
+            graph.nodes, graph.matrices.with_format(format), start_nodes, final_nodes
+        )
+    key = (
+        "graph",
+        graph_version(graph),
+        start_nodes,
+        final_nodes,
+        check_format(format),
+    )
+    if isinstance(graph, EdgeListGraph):
+        return MATRIX_FA_CACHE.get_or_create(
+            key,
+            lambda: AdjacencyMatrixFA.from_edge_list(
+                graph, start_nodes, final_nodes, format
+            ),
+        )
+    return MATRIX_FA_CACHE.get_or_create(
+        key,
+        lambda: AdjacencyMatrixFA(
+            graph_to_nfa(graph, start_nodes, final_nodes, copy=False), format
+        ),
+    )
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """
+    hit, miss and eviction counters of the regex and automata caches
+    """
+    return {
+        "dfa": DFA_CACHE.stats(),
+        "nfa": NFA_CACHE.stats(),
+        "matrix_fa": MATRIX_FA_CACHE.stats(),
+    }
+
+
+def intersect_automata(
+    automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA
+) -> AdjacencyMatrixFA:
+    """
+    intersection of two automata via the Kronecker product of their matrices
+    :param automaton1: first automaton, its state i becomes block i of the result
+    :param automaton2: second automaton
+    :return: automaton whose state i * n2 + j is the pair (i, j)
+    """
+    n2 = automaton2.states_count
+    result = AdjacencyMatrixFA(None, automaton1.format)
+    result.states = [(s1, s2) for s1 in automaton1.states for s2 in automaton2.states]
+    result.state_index = {state: i for i, state in enumerate(result.states)}
+    result.start_states = {
+        s1 * n2 + s2 for s1 in automaton1.start_states for s2 in automaton2.start_states
+    }
+    result.final_states = {
+        f1 * n2 + f2 for f1 in automaton1.final_states for f2 in automaton2.final_states
+    }
+
+    result.matrices = BoolDecomposition(result.states_count, result.format)
+    for label in automaton1.matrices.labels() & automaton2.matrices.labels():
+        result.matrices[label] = sparse.kron(
+            automaton1.matrices.get(label, "csr"),
+            automaton2.matrices.get(label, "csr"),
+            format="coo",
+        )
+    return result
+
+
+def tensor_based_rpq(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+    closure: ClosureMethod = "semi-naive",
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    all-pairs regular path query through the intersection with the query DFA
+    :param regex: regular expression over edge labels or the query automaton
+    :param graph: labelled graph
+    :param start_nodes: start vertices, all vertices if empty
+    :param final_nodes: final vertices, all vertices if empty
+    :param format: sparse format of the per-label matrices
+    :param closure: transitive closure method, see AdjacencyMatrixFA.transitive_closure
+    :param stats: measurements of the run are added to it
+    :return: pairs (u, v) connected by a path whose word matches the regex
+    """
+    return tensor_based_rpq_stream(
+        regex, graph, start_nodes, final_nodes, format, closure, stats=stats
+    ).to_set()
+
+
+def tensor_based_rpq_stream(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+    closure: ClosureMethod = "semi-naive",
+    batch_size: int = 1024,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    tensor_based_rpq answers read off the closure batch_size start vertices
+    at a time instead of being collected into a set
+    """
+    stats = stats_or_disabled(stats)
+    with stats.phase("graph"):
+        graph_fa = graph_to_matrix_fa(graph, start_nodes, final_nodes, format)
+    with stats.phase("query"):
+        regex_fa = regex_to_matrix_fa(regex, format)
+    with stats.phase("intersection"):
+        intersection = intersect_automata(graph_fa, regex_fa)
+    stats.count("intersection_states", intersection.states_count)
+    with stats.phase("closure"):
+        reachable = intersection.transitive_closure(closure, stats)
+    return Answers(
+        graph_fa.states,
+        _closure_answers(
+            reachable,
+            intersection,
+            regex_fa.states_count,
+            graph_fa.states_count,
+            batch_size,
+            stats,
+        ),
+    )
+
+
+def _closure_answers(
+    reachable: sparse.csr_matrix,
+    intersection: AdjacencyMatrixFA,
+    n: int,
+    vertices: int,
+    batch_size: int,
+    stats: QueryStats,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    # the minimal DFA has a single start state, so a batch of start rows
+    # holds every row of its graph vertices
+    starts = np.array(sorted(intersection.start_states), dtype=np.int64)
+    finals = np.array(sorted(intersection.final_states), dtype=np.int64)
+    if len(starts) == 0 or len(finals) == 0:
+        return
+    to_finals = reachable[:, finals]
+    for lo in range(0, len(starts), batch_size):
+        with stats.phase("answers"):
+            batch = starts[lo : lo + batch_size]
+            rows, cols = to_finals[batch].nonzero()
+            pairs = np.unique((batch[rows] // n) * vertices + finals[cols] // n)
+        yield np.divmod(pairs, vertices)
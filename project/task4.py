@@ -0,0 +1,319 @@
+from typing import Iterator, Literal
+
+import numpy as np
+from networkx import MultiDiGraph
+from scipy import sparse
+
+from project.answers import Answers
+from project.bool_decomposition import SparseFormat, matrix_nbytes
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_stats import QueryStats, stats_or_disabled
+from project.spgemm import bool_matmul
+from project.task3 import AdjacencyMatrixFA, graph_to_matrix_fa, regex_to_matrix_fa
+
+FrontMode = Literal["auto", "sparse", "packed"]
+FRONT_MODES: tuple[str, ...] = ("auto", "sparse", "packed")
+Direction = Literal["forward", "backward"]
+DIRECTIONS: tuple[str, ...] = ("forward", "backward")
+
+WORD_BITS = 64
+
+
+def _popcount(packed: np.ndarray) -> int:
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(packed).sum())
+    return int(np.unpackbits(packed.view(np.uint8)).sum())
+
+
+def _pack(matrix: sparse.csr_matrix, n: int, sources: int) -> np.ndarray:
+    """
+    pack a sparse front into per-source bitsets
+    :param matrix: front with block i of n rows per source i
+    :param n: number of DFA states
+    :param sources: number of sources
+    :return: array of shape (n, vertices, words), bit i of [r, v] is set
+        iff row i * n + r of the front has column v
+    """
+    words = (sources + WORD_BITS - 1) // WORD_BITS
+    packed = np.zeros((n, matrix.shape[1], words), dtype=np.uint64)
+    rows, cols = matrix.nonzero()
+    sources_of, states = np.divmod(rows, n)
+    bits = np.left_shift(np.uint64(1), (sources_of % WORD_BITS).astype(np.uint64))
+    np.bitwise_or.at(packed, (states, cols, sources_of // WORD_BITS), bits)
+    return packed
+
+
+def _unpack_coords(packed: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    coordinates of the set bits of a packed front
+    :return: (sources, DFA states, vertices)
+    """
+    states, cols, words = np.nonzero(packed)
+    bits = np.unpackbits(
+        packed[states, cols, words]
+        .astype("<u8", copy=False)
+        .view(np.uint8)
+        .reshape(-1, 8),
+        axis=1,
+        bitorder="little",
+    )
+    entries, offsets = np.nonzero(bits)
+    sources = words[entries] * WORD_BITS + offsets
+    return sources, states[entries], cols[entries]
+
+
+def _unpack(packed: np.ndarray, n: int, sources: int) -> sparse.csr_matrix:
+    sources_of, states, cols = _unpack_coords(packed)
+    return sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.bool_), (sources_of * n + states, cols)),
+        shape=(sources * n, packed.shape[1]),
+    )
+
+
+def ms_bfs_based_rpq(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+    front: FrontMode = "auto",
+    direction: Direction = "forward",
+    limit: int | None = None,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    multiple-source regular path query by a BFS over the graph and the query DFA
+    :param regex: regular expression over edge labels or the query automaton
+    :param graph: labelled graph
+    :param start_nodes: start vertices, all vertices if empty
+    :param final_nodes: final vertices, all vertices if empty
+    :param format: sparse format of the per-label graph matrices
+    :param front: "sparse" keeps the front as a Boolean sparse matrix,
+        "packed" keeps 64 sources per uint64 word, "auto" switches between
+        them by whichever is smaller at the current front density
+    :param direction: "backward" searches from the final vertices over the
+        reversed graph and the reversed query automaton, which pays off
+        when there are fewer final vertices than start ones
+    :param limit: stop the BFS after the level on which this many pairs
+        have been found and return only that many
+    :param stats: measurements of the run are added to it
+    :return: pairs (u, v) connected by a path whose word matches the regex
+    """
+    answers = ms_bfs_based_rpq_stream(
+        regex,
+        graph,
+        start_nodes,
+        final_nodes,
+        format,
+        front,
+        direction,
+        batch_size=None,
+        stats=stats,
+    )
+    if limit is None:
+        return answers.to_set()
+    return set(answers.first(limit))
+
+
+def ms_bfs_based_rpq_exists(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+    front: FrontMode = "auto",
+    direction: Direction = "forward",
+    stats: QueryStats | None = None,
+) -> bool:
+    """
+    whether ms_bfs_based_rpq has any answer, the BFS stops on the first
+    level that reaches a final vertex in a final DFA state
+
+    Library API only: a select of the interpreter binds its whole answer,
+    the query language cannot test it for emptiness.
+    """
+    answers = ms_bfs_based_rpq_stream(
+        regex,
+        graph,
+        start_nodes,
+        final_nodes,
+        format,
+        front,
+        direction,
+        batch_size=None,
+        stats=stats,
+    )
+    return bool(answers.first(1))
+
+
+def ms_bfs_based_rpq_stream(
+    regex: str | AdjacencyMatrixFA,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int],
+    final_nodes: set[int],
+    format: SparseFormat = "csr",
+    front: FrontMode = "auto",
+    direction: Direction = "forward",
+    batch_size: int | None = 16 * WORD_BITS,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    ms_bfs_based_rpq run on batch_size start vertices at a time, the answers
+    of a batch are yielded before the next batch is searched
+    :param batch_size: number of sources of one BFS, all starts at once if None
+    """
+    if front not in FRONT_MODES:
+        raise ValueError(
+            f"Unknown front mode {front!r}, expected one of {', '.join(FRONT_MODES)}"
+        )
+    if direction not in DIRECTIONS:
+        raise ValueError(
+            f"Unknown search direction {direction!r}, "
+            f"expected one of {', '.join(DIRECTIONS)}"
+        )
+    stats = stats_or_disabled(stats)
+    with stats.phase("query"):
+        regex_fa = regex_to_matrix_fa(regex, format)
+    with stats.phase("graph"):
+        graph_fa = graph_to_matrix_fa(graph, start_nodes, final_nodes, format)
+    if direction == "forward":
+        return Answers(
+            graph_fa.states,
+            _ms_bfs_answers(regex_fa, graph_fa, front, batch_size, stats),
+        )
+    with stats.phase("reverse"):
+        regex_fa, graph_fa = regex_fa.reversed(), graph_fa.reversed()
+    return Answers(
+        graph_fa.states,
+        (
+            (targets, sources)
+            for sources, targets in _ms_bfs_answers(
+                regex_fa, graph_fa, front, batch_size, stats
+            )
+        ),
+    )
+
+
+def _ms_bfs_answers(
+    regex_fa: AdjacencyMatrixFA,
+    graph_fa: AdjacencyMatrixFA,
+    front: FrontMode,
+    batch_size: int | None,
+    stats: QueryStats,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    starts = np.array(sorted(graph_fa.start_states), dtype=np.int64)
+    if regex_fa.states_count == 0 or len(starts) == 0:
+        return
+    regex_finals = np.array(sorted(regex_fa.final_states), dtype=np.int64)
+    graph_finals = np.zeros(graph_fa.states_count, dtype=np.bool_)
+    graph_finals[sorted(graph_fa.final_states)] = True
+    batch_size = batch_size or len(starts)
+    vertices = graph_fa.states_count
+    for lo in range(0, len(starts), batch_size):
+        batch = starts[lo : lo + batch_size]
+        seen = np.empty(0, dtype=np.int64)
+        levels = _ms_bfs(regex_fa, graph_fa, batch.tolist(), front)
+        for sources, states, cols in stats.timed("bfs", levels):
+            stats.count("levels")
+            stats.record("front_nnz", len(cols))
+            found = np.isin(states, regex_finals) & graph_finals[cols]
+            pairs = np.unique(batch[sources[found]] * vertices + cols[found])
+            # a pair reaches a final DFA state once per state at most
+            pairs = np.setdiff1d(pairs, seen, assume_unique=True)
+            if len(pairs):
+                seen = np.union1d(seen, pairs)
+                yield np.divmod(pairs, vertices)
+
+
+def _front_coords(
+    front: sparse.csr_matrix | np.ndarray, n: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if isinstance(front, np.ndarray):
+        return _unpack_coords(front)
+    rows, cols = front.nonzero()
+    sources, states = np.divmod(rows, n)
+    return sources, states, cols
+
+
+def _ms_bfs(
+    regex_fa: AdjacencyMatrixFA,
+    graph_fa: AdjacencyMatrixFA,
+    starts: list[int],
+    front: FrontMode,
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    BFS from the given graph vertices at once, level by level
+    :return: for every level (index in starts, DFA state, graph vertex) of
+        the triples first visited on it, stopping the generator stops the BFS
+    """
+    # the front has one block of regex_fa.states_count rows per start vertex,
+    # row r of block i holds the graph vertices reachable from starts[i]
+    # by words leading the DFA to state r
+    n = regex_fa.states_count
+    height = len(starts) * n
+    rows = [i * n + r for i in range(len(starts)) for r in regex_fa.start_states]
+    cols = [s for s in starts for _ in regex_fa.start_states]
+    current = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+        shape=(height, graph_fa.states_count),
+    )
+    visited = current
+
+    labels = regex_fa.matrices.labels() & graph_fa.matrices.labels()
+    identity = sparse.identity(len(starts), dtype=np.bool_, format="csr")
+    regex_steps = {}
+    regex_transitions = {}
+    graph_edges = {}
+    packed_bytes = (
+        n * graph_fa.states_count * ((len(starts) + WORD_BITS - 1) // WORD_BITS) * 8
+    )
+    is_packed = front == "packed"
+    if is_packed:
+        current, visited = (
+            _pack(current, n, len(starts)),
+            _pack(visited, n, len(starts)),
+        )
+
+    while current.any() if is_packed else current.nnz > 0:
+        yield _front_coords(current, n)
+        if front == "auto":
+            if is_packed:
+                # a Boolean csr entry costs a byte of data and an index
+                sparse_bytes = (_popcount(visited) + _popcount(current)) * 9
+                if 2 * sparse_bytes < packed_bytes:
+                    current = _unpack(current, n, len(starts))
+                    visited = _unpack(visited, n, len(starts))
+                    is_packed = False
+            elif matrix_nbytes(visited) + matrix_nbytes(current) > packed_bytes:
+                current = _pack(current, n, len(starts))
+                visited = _pack(visited, n, len(starts))
+                is_packed = True
+
+        if is_packed:
+            new_front = np.zeros_like(current)
+            for label in labels:
+                if label not in graph_edges:
+                    graph_edges[label] = graph_fa.matrices.get(label, "csr").nonzero()
+                    regex_transitions[label] = list(
+                        zip(*regex_fa.matrices.get(label, "csr").nonzero())
+                    )
+                sources, targets = graph_edges[label]
+                for r, r_next in regex_transitions[label]:
+                    moved = current[r, sources]
+                    active = moved.any(axis=1)
+                    np.bitwise_or.at(new_front[r_next], targets[active], moved[active])
+            current = new_front & ~visited
+            visited |= current
+        else:
+            new_front = sparse.csr_matrix(current.shape, dtype=np.bool_)
+            for label in labels:
+                if label not in regex_steps:
+                    regex_steps[label] = sparse.kron(
+                        identity, regex_fa.matrices.backward(label), format="csr"
+                    )
+                new_front += bool_matmul(
+                    regex_steps[label], bool_matmul(current, graph_fa.matrices[label])
+                )
+            current = new_front > visited
+            visited = visited + current
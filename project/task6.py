@@ -0,0 +1,232 @@
+from collections import defaultdict
+from typing import Hashable, Iterable, Iterator
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG, Epsilon, Production, Terminal, Variable
+
+from project.answers import Answers
+from project.cfpq_pruning import Footprint, prune_graph
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_stats import QueryStats, stats_or_disabled
+
+
+def cfg_to_weak_normal_form(cfg: CFG) -> CFG:
+    """
+    Chomsky normal form that keeps epsilon productions of nullable variables
+    :param cfg: grammar
+    :return: grammar whose productions are A -> B C, A -> a or A -> $
+    """
+    normal_form = cfg.to_normal_form()
+    productions = set(normal_form.productions)
+    for variable in cfg.get_nullable_symbols():
+        productions.add(Production(Variable(variable.value), [Epsilon()]))
+    return CFG(start_symbol=cfg.start_symbol, productions=productions)
+
+
+def compact_graph(
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+) -> EdgeListGraph | MatrixIndex:
+    """
+    graph with integer-indexed vertices and label-grouped edges
+    :param graph: labelled graph
+    :return: the graph itself unless it is a networkx graph
+    """
+    if isinstance(graph, (EdgeListGraph, MatrixIndex)):
+        return graph
+    return EdgeListGraph.from_networkx(graph)
+
+
+class WeakNormalFormIndex:
+    """
+    Productions of a wCNF grammar with integer-numbered variables.
+
+    Binary productions are indexed by both body symbols, so a derived
+    triple (B, u, v) finds the productions A -> B C and A -> D B it can
+    take part in without scanning the grammar.
+    """
+
+    def __init__(self, cfg: CFG):
+        wcnf = cfg_to_weak_normal_form(cfg)
+        self.variables: list[Variable] = []
+        self.variable_index: dict[Variable, int] = {}
+        self.by_terminal: dict[Hashable, list[int]] = defaultdict(list)
+        self.nullable: list[int] = []
+        # (head, left, right) of every binary production
+        self.binary: list[tuple[int, int, int]] = []
+        # body symbol -> (head, the other body symbol)
+        self.by_left: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        self.by_right: dict[int, list[tuple[int, int]]] = defaultdict(list)
+
+        for production in wcnf.productions:
+            head = self.number(production.head)
+            body = production.body
+            if len(body) == 0:
+                self.nullable.append(head)
+            elif len(body) == 1 and isinstance(body[0], Terminal):
+                self.by_terminal[body[0].value].append(head)
+            elif len(body) == 2:
+                left, right = self.number(body[0]), self.number(body[1])
+                self.binary.append((head, left, right))
+                self.by_left[left].append((head, right))
+                self.by_right[right].append((head, left))
+        self.start = self.number(Variable(wcnf.start_symbol.value))
+
+    def number(self, variable: Variable) -> int:
+        index = self.variable_index.get(variable)
+        if index is None:
+            index = self.variable_index[variable] = len(self.variables)
+            self.variables.append(variable)
+        return index
+
+    def footprint(self) -> Footprint:
+        return Footprint(frozenset(self.by_terminal), self.start in self.nullable)
+
+
+def vertex_indices(
+    nodes: list[Hashable], vertices: Iterable[Hashable] | None
+) -> set[int] | None:
+    """
+    indices of the given vertices in a node list
+    :return: None, meaning every vertex, if no vertices are given
+    """
+    if not vertices:
+        return None
+    vertices = set(vertices)
+    return {i for i, node in enumerate(nodes) if node in vertices}
+
+
+def hellings_based_cfpq(
+    cfg: CFG,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    context-free path query by the Hellings algorithm
+    :param cfg: query grammar
+    :param graph: labelled graph
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :param prune: run on the part of the graph the query can use,
+        see cfpq_pruning.prune_graph
+    :param stats: measurements of the run are added to it
+    :return: pairs of vertices connected by a path whose word is derived
+        from the start symbol
+    """
+    return hellings_based_cfpq_stream(
+        cfg, graph, start_nodes, final_nodes, prune, stats
+    ).to_set()
+
+
+def hellings_based_cfpq_stream(
+    cfg: CFG,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    hellings_based_cfpq answers yielded as the worklist derives them
+    """
+    stats = stats_or_disabled(stats)
+    with stats.phase("grammar"):
+        grammar = WeakNormalFormIndex(cfg)
+    with stats.phase("graph"):
+        graph = (
+            prune_graph(graph, grammar.footprint(), start_nodes, final_nodes)
+            if prune
+            else compact_graph(graph)
+        )
+    nodes = (
+        graph.nodes.tolist() if isinstance(graph, EdgeListGraph) else list(graph.nodes)
+    )
+    stats.count("vertices", len(nodes))
+    starts = vertex_indices(nodes, start_nodes)
+    finals = vertex_indices(nodes, final_nodes)
+    answers = _hellings_answers(grammar, graph, len(nodes), starts, finals, stats)
+    return Answers(nodes, stats.timed("worklist", answers))
+
+
+def _flags(n: int, vertices: set[int] | None) -> bytearray:
+    flags = bytearray([vertices is None]) * n
+    for vertex in vertices or ():
+        flags[vertex] = True
+    return flags
+
+
+def _hellings_answers(
+    grammar: WeakNormalFormIndex,
+    graph: EdgeListGraph | MatrixIndex,
+    n: int,
+    starts: set[int] | None,
+    finals: set[int] | None,
+    stats: QueryStats,
+    flush: int = 256,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    is_start, is_final = _flags(n, starts), _flags(n, finals)
+    answers: list[int] = []
+
+    # a triple (A, u, v) is the integer (A * n + u) * n + v
+    derived: set[int] = set()
+    worklist: list[int] = []
+    # outgoing[u][A] holds every v with (A, u, v) derived, incoming[v][A] every u
+    outgoing: list[dict[int, set[int]] | None] = [None] * n
+    incoming: list[dict[int, set[int]] | None] = [None] * n
+
+    def add(variable: int, u: int, v: int) -> None:
+        key = (variable * n + u) * n + v
+        if key in derived:
+            return
+        derived.add(key)
+        worklist.append(key)
+        if outgoing[u] is None:
+            outgoing[u] = {}
+        outgoing[u].setdefault(variable, set()).add(v)
+        if incoming[v] is None:
+            incoming[v] = {}
+        incoming[v].setdefault(variable, set()).add(u)
+        if variable == grammar.start and is_start[u] and is_final[v]:
+            answers.append(u * n + v)
+
+    def pending() -> tuple[np.ndarray, np.ndarray]:
+        block = np.divmod(np.array(answers, dtype=np.int64), n)
+        answers.clear()
+        return block
+
+    for label, sources, targets in graph.edges_by_label():
+        heads = grammar.by_terminal.get(label)
+        if not heads:
+            continue
+        for u, v in zip(sources.tolist(), targets.tolist()):
+            for head in heads:
+                add(head, u, v)
+    for head in grammar.nullable:
+        for v in range(n):
+            add(head, v, v)
+
+    while worklist:
+        if len(answers) >= flush:
+            yield pending()
+        variable, rest = divmod(worklist.pop(), n * n)
+        u, v = divmod(rest, n)
+        found = []
+        # (variable, u, v) (right, v, w) -> (head, u, w)
+        if outgoing[v] is not None:
+            for head, right in grammar.by_left.get(variable, ()):
+                for w in outgoing[v].get(right, ()):
+                    found.append((head, u, w))
+        # (left, w, u) (variable, u, v) -> (head, w, v)
+        if incoming[u] is not None:
+            for head, left in grammar.by_right.get(variable, ()):
+                for w in incoming[u].get(left, ()):
+                    found.append((head, w, v))
+        for triple in found:
+            add(*triple)
+    stats.count("triples", len(derived))
+    if answers:
+        yield pending()
@@ -0,0 +1,230 @@
+from typing import Literal
+
+import networkx as nx
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import Symbol
+from scipy import sparse
+
+from project.answers import Answers, matrix_blocks
+from project.bool_decomposition import SparseFormat
+from project.cfpq_pruning import prune_graph
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_stats import QueryStats, stats_or_disabled
+from project.spgemm import bool_matmul
+from project.task3 import graph_to_matrix_fa
+from project.task6 import WeakNormalFormIndex
+
+FixpointMethod = Literal["naive", "semi-naive"]
+FIXPOINT_METHODS: tuple[str, ...] = ("naive", "semi-naive")
+
+
+def dependency_order(grammar: WeakNormalFormIndex) -> list[list[int]]:
+    """
+    strongly connected components of the variable dependency graph
+    :param grammar: indexed wCNF grammar
+    :return: components in topological order, the body variables of a
+        production come in the same or an earlier component than its head
+    """
+    dependencies = nx.DiGraph()
+    dependencies.add_nodes_from(range(len(grammar.variables)))
+    for head, left, right in grammar.binary:
+        dependencies.add_edge(left, head)
+        dependencies.add_edge(right, head)
+    condensed = nx.condensation(dependencies)
+    return [
+        sorted(condensed.nodes[component]["members"])
+        for component in nx.topological_sort(condensed)
+    ]
+
+
+def _naive_fixpoint(
+    grammar: WeakNormalFormIndex,
+    matrices: list[sparse.csr_matrix],
+    stats: QueryStats,
+) -> None:
+    changed = True
+    while changed:
+        changed = False
+        found = 0
+        for head, left, right in grammar.binary:
+            product = matrices[head] + bool_matmul(matrices[left], matrices[right])
+            if product.nnz != matrices[head].nnz:
+                found += product.nnz - matrices[head].nnz
+                matrices[head] = product
+                changed = True
+        stats.count("rounds")
+        stats.record("delta_nnz", found)
+
+
+def _semi_naive_fixpoint(
+    grammar: WeakNormalFormIndex,
+    matrices: list[sparse.csr_matrix],
+    stats: QueryStats,
+) -> None:
+    for component in dependency_order(grammar):
+        saturate_component(grammar, set(component), matrices, stats)
+
+
+def saturate_component(
+    grammar: WeakNormalFormIndex,
+    members: set[int],
+    matrices: list[sparse.csr_matrix],
+    stats: QueryStats | None = None,
+) -> None:
+    """
+    semi-naive fixpoint of the productions with a head in members, the
+    matrices of all other variables are taken as final
+    :param grammar: indexed wCNF grammar
+    :param members: variables closed under dependency cycles
+    :param matrices: matrices by variable id, updated in place
+    :param stats: see propagate_delta
+    """
+    productions = [p for p in grammar.binary if p[0] in members]
+    if not productions:
+        return
+    size = matrices[0].shape[0]
+    empty = sparse.csr_matrix((size, size), dtype=np.bool_)
+
+    # variables of earlier components are final, so their products
+    # are taken once in full and never again
+    delta = {variable: empty for variable in members}
+    for head, left, right in productions:
+        new = bool_matmul(matrices[left], matrices[right]) > matrices[head]
+        delta[head] = delta[head] + new
+        matrices[head] = matrices[head] + new
+    propagate_delta(productions, matrices, delta, stats)
+
+
+def propagate_delta(
+    productions: list[tuple[int, int, int]],
+    matrices: list[sparse.csr_matrix],
+    delta: dict[int, sparse.csr_matrix],
+    stats: QueryStats | None = None,
+) -> None:
+    """
+    semi-naive rounds until no production derives a new pair
+    :param productions: binary productions (head, left, right) whose heads
+        are keys of delta
+    :param matrices: matrices by variable id, already holding the delta,
+        updated in place
+    :param delta: pairs found on the previous round by variable id, the
+        variables missing from it do not change
+    :param stats: gets the rounds and the pairs found on every round
+    """
+    stats = stats_or_disabled(stats)
+    size = matrices[0].shape[0] if matrices else 0
+    empty = sparse.csr_matrix((size, size), dtype=np.bool_)
+    # (B + dB)(C + dC) = BC + dB (C + dC) + B dC
+    while any(changed.nnz for changed in delta.values()):
+        new_delta = {variable: empty for variable in delta}
+        for head, left, right in productions:
+            left_delta, right_delta = delta.get(left), delta.get(right)
+            product = empty
+            if left_delta is not None and left_delta.nnz:
+                product = product + bool_matmul(left_delta, matrices[right])
+            if right_delta is not None and right_delta.nnz:
+                old_left = matrices[left]
+                if left_delta is not None:
+                    old_left = old_left > left_delta
+                product = product + bool_matmul(old_left, right_delta)
+            if product.nnz:
+                new_delta[head] = new_delta[head] + product
+        for variable in new_delta:
+            new_delta[variable] = new_delta[variable] > matrices[variable]
+            matrices[variable] = matrices[variable] + new_delta[variable]
+        delta = new_delta
+        stats.count("rounds")
+        stats.record("delta_nnz", sum(changed.nnz for changed in delta.values()))
+
+
+def matrix_based_cfpq(
+    cfg: CFG,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    format: SparseFormat = "csr",
+    method: FixpointMethod = "semi-naive",
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    context-free path query by Boolean matrix multiplication
+    :param cfg: query grammar
+    :param graph: labelled graph
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :param format: sparse format of the graph matrices
+    :param method: "naive" multiplies the full matrices of every production
+        until nothing changes, "semi-naive" processes the grammar by
+        dependency components and multiplies only the pairs found on the
+        previous round
+    :param prune: run on the part of the graph the query can use,
+        see cfpq_pruning.prune_graph
+    :param stats: measurements of the run are added to it
+    :return: pairs of vertices connected by a path whose word is derived
+        from the start symbol
+    """
+    return matrix_based_cfpq_stream(
+        cfg, graph, start_nodes, final_nodes, format, method, prune, stats
+    ).to_set()
+
+
+def matrix_based_cfpq_stream(
+    cfg: CFG,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    format: SparseFormat = "csr",
+    method: FixpointMethod = "semi-naive",
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    matrix_based_cfpq answers read off the start symbol matrix in row batches
+    """
+    if method not in FIXPOINT_METHODS:
+        raise ValueError(
+            f"Unknown fixpoint method {method!r}, "
+            f"expected one of {', '.join(FIXPOINT_METHODS)}"
+        )
+    stats = stats_or_disabled(stats)
+    with stats.phase("grammar"):
+        grammar = WeakNormalFormIndex(cfg)
+    with stats.phase("graph"):
+        if prune:
+            graph = prune_graph(graph, grammar.footprint(), start_nodes, final_nodes)
+        graph_fa = graph_to_matrix_fa(
+            graph, start_nodes or set(), final_nodes or set(), format
+        )
+    size = graph_fa.states_count
+    stats.count("vertices", size)
+
+    matrices = [
+        sparse.csr_matrix((size, size), dtype=np.bool_) for _ in grammar.variables
+    ]
+    for terminal, heads in grammar.by_terminal.items():
+        symbol = Symbol(terminal)
+        if symbol not in graph_fa.matrices:
+            continue
+        adjacency = graph_fa.matrices.get(symbol, "csr")
+        for head in heads:
+            matrices[head] = matrices[head] + adjacency
+    identity = sparse.identity(size, dtype=np.bool_, format="csr")
+    for head in grammar.nullable:
+        matrices[head] = matrices[head] + identity
+
+    with stats.phase("fixpoint"):
+        if method == "naive":
+            _naive_fixpoint(grammar, matrices, stats)
+        else:
+            _semi_naive_fixpoint(grammar, matrices, stats)
+
+    blocks = matrix_blocks(
+        matrices[grammar.start],
+        sorted(graph_fa.start_states),
+        sorted(graph_fa.final_states),
+    )
+    return Answers(graph_fa.states, stats.timed("answers", blocks))
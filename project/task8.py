@@ -0,0 +1,321 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Hashable
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import Symbol
+from pyformlang.rsa import RecursiveAutomaton
+from scipy import sparse
+
+from project.answers import Answers, matrix_blocks
+from project.bool_decomposition import BoolDecomposition, SparseFormat
+from project.cfpq_pruning import prune_graph, rsm_footprint
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_stats import QueryStats, stats_or_disabled
+from project.rsm_optimizer import optimize_rsm
+from project.shared_sparse import (
+    SharedCSR,
+    publish_csr,
+    release,
+    share_csr,
+    take_csr,
+    view_csr,
+)
+from project.task3 import AdjacencyMatrixFA, graph_to_matrix_fa, intersect_automata
+
+
+def cfg_to_rsm(cfg: CFG, optimize: bool = False) -> RecursiveAutomaton:
+    """
+    recursive automaton with a box per variable accepting its bodies
+    :param cfg: grammar
+    :param optimize: inline, minimize and merge the boxes, see optimize_rsm
+    :return: automaton whose initial box is the start symbol
+    """
+    rsm = RecursiveAutomaton.from_text(
+        cfg.to_text(), start_symbol=Symbol(cfg.start_symbol.value)
+    )
+    return optimize_rsm(rsm) if optimize else rsm
+
+
+def ebnf_to_rsm(ebnf: str, optimize: bool = False) -> RecursiveAutomaton:
+    """
+    recursive automaton from productions with regular expression bodies
+    :param ebnf: lines "A -> regex", the first head is not necessarily the
+        start symbol, S is
+    :param optimize: inline, minimize and merge the boxes, see optimize_rsm
+    """
+    rsm = RecursiveAutomaton.from_text(ebnf)
+    return optimize_rsm(rsm) if optimize else rsm
+
+
+def rsm_to_matrix_fa(
+    rsm: RecursiveAutomaton, format: SparseFormat = "csr"
+) -> tuple[AdjacencyMatrixFA, dict[Symbol, tuple[list[int], list[int]]]]:
+    """
+    all boxes of a recursive automaton as one matrix automaton
+    :param rsm: recursive automaton
+    :param format: sparse format of the per-label matrices
+    :return: automaton with states (box label, box state) and transitions
+        labelled by terminals and box labels, and for each box label the
+        indices of its start and final states
+    """
+    states: list[tuple[Hashable, Hashable]] = []
+    boxes: dict[Symbol, tuple[list[int], list[int]]] = {}
+    for label, box in rsm.boxes.items():
+        first = len(states)
+        dfa = box.dfa
+        states.extend((label, state.value) for state in dfa.states)
+        index = {states[i][1]: i for i in range(first, len(states))}
+        starts = [index[state.value] for state in dfa.start_states]
+        finals = [index[state.value] for state in dfa.final_states]
+        boxes[Symbol(label.value)] = (starts, finals)
+
+    state_index = {state: i for i, state in enumerate(states)}
+    edges: dict[Symbol, tuple[list[int], list[int]]] = {}
+    for label, box in rsm.boxes.items():
+        for u, transitions in box.dfa.to_dict().items():
+            for symbol, v in transitions.items():
+                rows, cols = edges.setdefault(Symbol(symbol.value), ([], []))
+                rows.append(state_index[(label, u.value)])
+                cols.append(state_index[(label, v.value)])
+
+    fa = AdjacencyMatrixFA(None, format)
+    fa.states = states
+    fa.state_index = state_index
+    fa.start_states = {i for starts, _ in boxes.values() for i in starts}
+    fa.final_states = {i for _, finals in boxes.values() for i in finals}
+    fa.matrices = BoolDecomposition.from_edges(len(states), edges, format)
+    return fa, boxes
+
+
+def _kron_sum(pairs: list[tuple[SharedCSR, SharedCSR]]) -> SharedCSR:
+    segments = [SharedMemory(handle.name) for pair in pairs for handle in pair]
+    try:
+        result = _kron_sum_views(pairs, segments)
+        return publish_csr(result)
+    finally:
+        for segment in segments:
+            segment.close()
+
+
+def _kron_sum_views(pairs, segments) -> sparse.csr_matrix:
+    # the views into the segments must be gone before the segments close
+    result = None
+    for (left, right), (left_segment, right_segment) in zip(
+        pairs, zip(segments[::2], segments[1::2])
+    ):
+        product = sparse.kron(
+            view_csr(left_segment, left), view_csr(right_segment, right), format="csr"
+        )
+        result = product if result is None else result + product
+    return result
+
+
+def _multiply_rows(left: SharedCSR, right: SharedCSR, lo: int, hi: int) -> SharedCSR:
+    segments = [SharedMemory(left.name), SharedMemory(right.name)]
+    try:
+        block = view_csr(segments[0], left)[lo:hi] @ view_csr(segments[1], right)
+        return publish_csr(block)
+    finally:
+        for segment in segments:
+            segment.close()
+
+
+def _row_blocks(matrix: sparse.csr_matrix, count: int) -> list[tuple[int, int]]:
+    # split the rows into ranges with about the same number of non-zeros
+    targets = np.linspace(0, matrix.nnz, count + 1)[1:-1]
+    cuts = np.searchsorted(matrix.indptr, targets).tolist()
+    bounds = [0, *cuts, matrix.shape[0]]
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+
+def _parallel_closure(
+    adjacency: sparse.csr_matrix, pool: Executor, workers: int, stats: QueryStats
+) -> sparse.csr_matrix:
+    """
+    semi-naive reflexive transitive closure with the rows of every
+    delta @ adjacency product split between the pool workers
+    """
+    closure = sparse.identity(adjacency.shape[0], dtype=np.bool_, format="csr")
+    delta = closure
+    adjacency_segment, adjacency_handle = share_csr(adjacency)
+    try:
+        while delta.nnz > 0:
+            delta_segment, delta_handle = share_csr(delta)
+            try:
+                # the blocks are consecutive and cover all rows
+                futures = [
+                    pool.submit(_multiply_rows, delta_handle, adjacency_handle, lo, hi)
+                    for lo, hi in _row_blocks(delta, workers)
+                ]
+                blocks = [take_csr(future.result()) for future in futures]
+            finally:
+                release(delta_segment)
+            step = sparse.vstack(blocks, format="csr")
+            delta = step > closure
+            closure = closure + delta
+            stats.count("closure_rounds")
+            stats.record("closure_nnz", closure.nnz)
+    finally:
+        release(adjacency_segment)
+    return closure
+
+
+def _parallel_intersection(
+    rsm_fa: AdjacencyMatrixFA,
+    rsm_handles: dict[Symbol, SharedCSR],
+    graph_matrices: BoolDecomposition,
+    pool: Executor,
+    workers: int,
+) -> sparse.csr_matrix:
+    """
+    union over the common labels of the Kronecker products of the RSM and
+    graph matrices, the labels are dealt to the workers round robin
+    """
+    labels = sorted(rsm_handles.keys() & graph_matrices.labels(), key=str)
+    size = rsm_fa.states_count * graph_matrices.size
+    if not labels:
+        return sparse.csr_matrix((size, size), dtype=np.bool_)
+
+    segments = []
+    try:
+        shards: list[list[tuple[SharedCSR, SharedCSR]]] = [[] for _ in range(workers)]
+        for i, label in enumerate(labels):
+            segment, handle = share_csr(graph_matrices.get(label, "csr"))
+            segments.append(segment)
+            shards[i % workers].append((rsm_handles[label], handle))
+        futures = [pool.submit(_kron_sum, shard) for shard in shards if shard]
+        results = [take_csr(future.result()) for future in futures]
+    finally:
+        for segment in segments:
+            release(segment)
+    return sum(results[1:], results[0])
+
+
+def tensor_based_cfpq(
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    format: SparseFormat = "csr",
+    workers: int = 1,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    context-free path query by repeated intersection with the RSM
+    :param rsm: query recursive automaton
+    :param graph: labelled graph
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :param format: sparse format of the per-label matrices
+    :param workers: number of processes computing the Kronecker products and
+        the closure, matrices are passed to them through shared memory
+    :param prune: run on the part of the graph the query can use,
+        see cfpq_pruning.prune_graph
+    :param stats: measurements of the run are added to it
+    :return: pairs of vertices connected by a path whose word is derived
+        from the initial box
+    """
+    return tensor_based_cfpq_stream(
+        rsm, graph, start_nodes, final_nodes, format, workers, prune, stats
+    ).to_set()
+
+
+def tensor_based_cfpq_stream(
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    format: SparseFormat = "csr",
+    workers: int = 1,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    tensor_based_cfpq answers read off the initial box matrix in row batches
+    """
+    if workers < 1:
+        raise ValueError(f"Number of workers must be positive, got {workers}")
+    stats = stats_or_disabled(stats)
+    with stats.phase("rsm"):
+        rsm_fa, boxes = rsm_to_matrix_fa(rsm, format)
+    with stats.phase("graph"):
+        if prune:
+            graph = prune_graph(graph, rsm_footprint(rsm), start_nodes, final_nodes)
+        graph_fa = graph_to_matrix_fa(
+            graph, start_nodes or set(), final_nodes or set(), format
+        )
+    size = graph_fa.states_count
+    stats.count("vertices", size)
+
+    # the graph automaton is shared through the cache, extend a copy
+    graph_matrices = BoolDecomposition(size, format)
+    for label, matrix in graph_fa.matrices.items():
+        graph_matrices[label] = matrix
+    for label in boxes:
+        if label not in graph_matrices:
+            graph_matrices[label] = sparse.csr_matrix((size, size), dtype=np.bool_)
+    extended = AdjacencyMatrixFA.from_matrices(
+        graph_fa.states, graph_matrices, set(), set()
+    )
+
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    rsm_segments: list[SharedMemory] = []
+    try:
+        rsm_handles = {}
+        if pool is not None:
+            for label, matrix in rsm_fa.matrices.items("csr"):
+                segment, rsm_handles[label] = share_csr(matrix)
+                rsm_segments.append(segment)
+
+        changed = True
+        while changed:
+            stats.count("iterations")
+            if pool is None:
+                with stats.phase("intersection"):
+                    intersection = intersect_automata(rsm_fa, extended)
+                with stats.phase("closure"):
+                    reachable = intersection.transitive_closure(stats=stats)
+            else:
+                with stats.phase("intersection"):
+                    adjacency = _parallel_intersection(
+                        rsm_fa, rsm_handles, graph_matrices, pool, workers
+                    )
+                with stats.phase("closure"):
+                    reachable = _parallel_closure(adjacency, pool, workers, stats)
+
+            changed = False
+            found = 0
+            with stats.phase("boxes"):
+                for label, (starts, finals) in boxes.items():
+                    derived = graph_matrices.get(label, "csr")
+                    for start in starts:
+                        rows = reachable[start * size : (start + 1) * size]
+                        for final in finals:
+                            block = rows[:, final * size : (final + 1) * size]
+                            new = block > derived
+                            if new.nnz:
+                                found += new.nnz
+                                derived = derived + new
+                                changed = True
+                    graph_matrices[label] = derived
+            stats.record("delta_nnz", found)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        for segment in rsm_segments:
+            release(segment)
+
+    initial = Symbol(rsm.initial_label.value)
+    if initial not in graph_matrices:
+        return Answers(graph_fa.states, iter(()))
+    blocks = matrix_blocks(
+        graph_matrices.get(initial, "csr"),
+        sorted(graph_fa.start_states),
+        sorted(graph_fa.final_states),
+    )
+    return Answers(graph_fa.states, stats.timed("answers", blocks))
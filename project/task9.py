@@ -0,0 +1,366 @@
+from array import array
+from typing import Hashable, Iterator
+
+import numpy as np
+
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import Symbol
+from pyformlang.rsa import RecursiveAutomaton
+
+from project.answers import Answers
+from project.cfpq_pruning import prune_graph, rsm_footprint
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.query_stats import QueryStats, stats_or_disabled
+from project.task6 import compact_graph, vertex_indices
+
+
+class RsmTables:
+    """
+    Transitions of a recursive automaton over integer state ids.
+
+    State ids are global across boxes. For every state the tables keep its
+    terminal moves, its calls as (start state of the callee, return state)
+    and whether it is final in its box.
+    """
+
+    __slots__ = (
+        "boxes",
+        "box_of",
+        "box_start",
+        "final",
+        "terminal",
+        "calls",
+        "initial",
+    )
+
+    def __init__(self, rsm: RecursiveAutomaton):
+        state_ids: dict[tuple[Symbol, Hashable], int] = {}
+        self.box_of: list[int] = []
+        self.box_start: dict[Symbol, int] = {}
+        boxes = {Symbol(label.value): i for i, label in enumerate(rsm.boxes)}
+        self.boxes = len(boxes)
+        for label, box in rsm.boxes.items():
+            for state in box.dfa.states:
+                state_ids[(Symbol(label.value), state.value)] = len(self.box_of)
+                self.box_of.append(boxes[Symbol(label.value)])
+            if box.dfa.start_state is not None:
+                self.box_start[Symbol(label.value)] = state_ids[
+                    (Symbol(label.value), box.dfa.start_state.value)
+                ]
+
+        self.final = [False] * len(self.box_of)
+        self.terminal: list[dict[Hashable, int]] = [{} for _ in self.box_of]
+        self.calls: list[list[tuple[int, int]]] = [[] for _ in self.box_of]
+        for label, box in rsm.boxes.items():
+            label = Symbol(label.value)
+            for state in box.dfa.final_states:
+                self.final[state_ids[(label, state.value)]] = True
+            for u, transitions in box.dfa.to_dict().items():
+                source = state_ids[(label, u.value)]
+                for symbol, v in transitions.items():
+                    target = state_ids[(label, v.value)]
+                    callee = self.box_start.get(Symbol(symbol.value))
+                    if callee is None:
+                        self.terminal[source][symbol.value] = target
+                    else:
+                        self.calls[source].append((callee, target))
+        self.initial = Symbol(rsm.initial_label.value)
+
+    def __len__(self) -> int:
+        return len(self.box_of)
+
+
+class GSS:
+    """
+    Graph-structured stack with integer node ids.
+
+    Node i is a call of box `box[i]` at vertex `vertex[i]`. Its outgoing
+    edges `edges[i]` are packed (caller node, return state) integers and
+    `popped[i]` holds the vertices at which the call has returned.
+    """
+
+    __slots__ = (
+        "vertices",
+        "capacity",
+        "index",
+        "box",
+        "vertex",
+        "edges",
+        "popped",
+        "_edge_set",
+    )
+
+    def __init__(self, vertices: int, boxes: int):
+        self.vertices = vertices
+        self.capacity = vertices * boxes
+        self.index: dict[int, int] = {}
+        self.box = array("l")
+        self.vertex = array("l")
+        self.edges: list[list[int]] = []
+        self.popped: list[set[int]] = []
+        self._edge_set: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.box)
+
+    def node(self, box: int, vertex: int) -> tuple[int, bool]:
+        """
+        :return: id of the node of the call and whether it was created
+        """
+        key = box * self.vertices + vertex
+        node = self.index.get(key)
+        if node is not None:
+            return node, False
+        node = self.index[key] = len(self.box)
+        self.box.append(box)
+        self.vertex.append(vertex)
+        self.edges.append([])
+        self.popped.append(set())
+        return node, True
+
+    def add_edge(self, node: int, return_state: int, caller: int, states: int) -> bool:
+        """
+        :return: whether the edge is new
+        """
+        edge = caller * states + return_state
+        key = edge * self.capacity + node
+        if key in self._edge_set:
+            return False
+        self._edge_set.add(key)
+        self.edges[node].append(edge)
+        return True
+
+
+class GllSolver:
+    """
+    Descriptor-driven GLL over a compact graph.
+
+    A descriptor (RSM state, vertex, GSS node) is the integer
+    (node * vertices + vertex) * states + state. It fits in 64 bits while
+    boxes * states * vertices^2 does, so the set of handled descriptors is
+    a plain set of machine-sized ints rather than of tuples.
+    """
+
+    __slots__ = (
+        "rsm",
+        "adjacency",
+        "vertices",
+        "gss",
+        "visited",
+        "worklist",
+        "roots",
+        "is_final",
+        "returned",
+    )
+
+    def __init__(self, rsm: RsmTables, adjacency: list[dict[Hashable, list[int]]]):
+        self.rsm = rsm
+        self.adjacency = adjacency
+        self.vertices = len(adjacency)
+        self.gss = GSS(self.vertices, rsm.boxes)
+        self.visited: set[int] = set()
+        self.worklist: list[int] = []
+        # nodes below roots are the calls of the initial box at the starts,
+        # returned collects (start, vertex) whenever one of them returns at
+        # a final vertex
+        self.roots = 0
+        self.is_final = bytearray([True]) * self.vertices
+        self.returned: list[tuple[int, int]] = []
+
+    def add(self, state: int, vertex: int, node: int) -> None:
+        key = (node * self.vertices + vertex) * len(self.rsm) + state
+        if key not in self.visited:
+            self.visited.add(key)
+            self.worklist.append(key)
+
+    def unpack(self, key: int) -> tuple[int, int, int]:
+        rest, state = divmod(key, len(self.rsm))
+        node, vertex = divmod(rest, self.vertices)
+        return state, vertex, node
+
+    def run(self, starts: list[int]) -> None:
+        for _ in self.stream(starts):
+            pass
+
+    def stream(
+        self, starts: list[int], finals: set[int] | None = None, flush: int = 256
+    ) -> Iterator[list[tuple[int, int]]]:
+        """
+        process descriptors, handing over the answers found so far every
+        time at least flush of them are pending
+        :param starts: distinct start vertices
+        :param finals: final vertices, all vertices if None
+        :return: lists of (start, vertex) pairs, stopping the generator
+            stops the processing
+        """
+        if finals is not None:
+            self.is_final = bytearray(self.vertices)
+            for vertex in finals:
+                self.is_final[vertex] = True
+        initial = self.rsm.box_start[self.rsm.initial]
+        box = self.rsm.box_of[initial]
+        for vertex in starts:
+            node, _ = self.gss.node(box, vertex)
+            self.add(initial, vertex, node)
+        self.roots = len(self.gss)
+        while self.worklist:
+            self.step(*self.unpack(self.worklist.pop()))
+            if len(self.returned) >= flush:
+                yield self.returned
+                self.returned = []
+        if self.returned:
+            yield self.returned
+            self.returned = []
+
+    def step(self, state: int, vertex: int, node: int) -> None:
+        rsm, gss = self.rsm, self.gss
+        if rsm.final[state]:
+            popped = gss.popped[node]
+            if vertex not in popped:
+                popped.add(vertex)
+                if node < self.roots and self.is_final[vertex]:
+                    self.returned.append((gss.vertex[node], vertex))
+                for edge in gss.edges[node]:
+                    caller, return_state = divmod(edge, len(rsm))
+                    self.add(return_state, vertex, caller)
+
+        moves = self.adjacency[vertex]
+        for label, target in rsm.terminal[state].items():
+            for next_vertex in moves.get(label, ()):
+                self.add(target, next_vertex, node)
+
+        for callee, return_state in rsm.calls[state]:
+            called, created = gss.node(rsm.box_of[callee], vertex)
+            if gss.add_edge(called, return_state, node, len(rsm)):
+                for returned in gss.popped[called]:
+                    self.add(return_state, returned, node)
+            if created:
+                self.add(callee, vertex, called)
+
+
+def adjacency_lists(
+    graph: EdgeListGraph | MatrixIndex,
+) -> list[dict[Hashable, list[int]]]:
+    """
+    :return: for every vertex index the targets of its outgoing edges by label
+    """
+    adjacency: list[dict[Hashable, list[int]]] = [
+        {} for _ in range(graph.number_of_nodes())
+    ]
+    for label, sources, targets in graph.edges_by_label():
+        for u, v in zip(sources.tolist(), targets.tolist()):
+            adjacency[u].setdefault(label, []).append(v)
+    return adjacency
+
+
+def gll_based_cfpq(
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    limit: int | None = None,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> set[tuple[int, int]]:
+    """
+    context-free path query by generalized LL parsing of the graph
+    :param rsm: query recursive automaton
+    :param graph: labelled graph
+    :param start_nodes: path sources, all vertices if empty
+    :param final_nodes: path targets, all vertices if empty
+    :param limit: stop processing descriptors as soon as this many pairs
+        have been found and return only them
+    :param prune: run on the part of the graph the query can use,
+        see cfpq_pruning.prune_graph
+    :param stats: measurements of the run are added to it
+    :return: pairs of vertices connected by a path whose word is derived
+        from the initial box
+    """
+    if limit is None:
+        return gll_based_cfpq_stream(
+            rsm, graph, start_nodes, final_nodes, prune=prune, stats=stats
+        ).to_set()
+    answers = gll_based_cfpq_stream(
+        rsm, graph, start_nodes, final_nodes, max(1, min(limit, 256)), prune, stats
+    )
+    return set(answers.first(limit))
+
+
+def gll_based_cfpq_exists(
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> bool:
+    """
+    whether gll_based_cfpq has any answer, descriptor processing stops at
+    the first return of the initial box at a final vertex
+
+    Library API only, like ms_bfs_based_rpq_exists.
+    """
+    answers = gll_based_cfpq_stream(
+        rsm, graph, start_nodes, final_nodes, 1, prune, stats
+    )
+    return bool(answers.first(1))
+
+
+def gll_based_cfpq_stream(
+    rsm: RecursiveAutomaton,
+    graph: MultiDiGraph | EdgeListGraph | MatrixIndex,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    flush: int = 256,
+    prune: bool = True,
+    stats: QueryStats | None = None,
+) -> Answers:
+    """
+    gll_based_cfpq answers yielded as the calls of the initial box return
+    :param flush: number of answers collected before they are handed over
+    :param prune: run on the part of the graph the query can use,
+        see cfpq_pruning.prune_graph
+    :param stats: measurements of the run are added to it
+    """
+    stats = stats_or_disabled(stats)
+    with stats.phase("rsm"):
+        tables = RsmTables(rsm)
+    with stats.phase("graph"):
+        graph = (
+            prune_graph(graph, rsm_footprint(rsm), start_nodes, final_nodes)
+            if prune
+            else compact_graph(graph)
+        )
+        nodes = (
+            graph.nodes.tolist()
+            if isinstance(graph, EdgeListGraph)
+            else list(graph.nodes)
+        )
+    stats.count("vertices", len(nodes))
+    if tables.initial not in tables.box_start:
+        return Answers(nodes, iter(()))
+    starts = vertex_indices(nodes, start_nodes)
+    starts = sorted(starts) if starts is not None else list(range(len(nodes)))
+    finals = vertex_indices(nodes, final_nodes)
+    with stats.phase("graph"):
+        adjacency = adjacency_lists(graph)
+    solver = GllSolver(tables, adjacency)
+    returns = stats.timed("gll", solver.stream(starts, finals, flush))
+    return Answers(nodes, _gll_answers(returns, solver, stats))
+
+
+def _gll_answers(
+    returns: Iterator[list[tuple[int, int]]], solver: GllSolver, stats: QueryStats
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    try:
+        for returned in returns:
+            pairs = np.array(returned, dtype=np.int64).reshape(-1, 2)
+            yield pairs[:, 0], pairs[:, 1]
+    finally:
+        if stats.enabled:
+            gss = solver.gss
+            stats.count("descriptors", len(solver.visited))
+            stats.count("gss_nodes", len(gss))
+            stats.count("gss_edges", sum(len(edges) for edges in gss.edges))
+            stats.count("popped", sum(len(popped) for popped in gss.popped))
@@ -0,0 +1,74 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+import shared
+
+
+def measure(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+    import cfpq_data
+    from pyformlang.cfg import CFG
+
+    from project.task6 import compact_graph
+    from project.task8 import cfg_to_rsm
+    from project.task9 import GllSolver, RsmTables, adjacency_lists
+
+    parser = argparse.ArgumentParser(
+        description="memory of the GLL descriptor set and GSS, packed ints "
+        "against the tuples they replace"
+    )
+    parser.add_argument("--vertices", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--grammar", default="S -> a S b S | $")
+    args = parser.parse_args()
+
+    graph = compact_graph(
+        cfpq_data.labeled_scale_free_graph(
+            args.vertices, labels=["a", "b"], seed=args.seed
+        )
+    )
+    adjacency = adjacency_lists(graph)
+    tables = RsmTables(cfg_to_rsm(CFG.from_text(args.grammar)))
+
+    start = time.perf_counter()
+    solver = GllSolver(tables, adjacency)
+    solver.run(list(range(len(adjacency))))
+    elapsed = time.perf_counter() - start
+
+    descriptors = list(solver.visited)
+    _, packed = measure(lambda: set(descriptors))
+    _, tuples = measure(lambda: {solver.unpack(key) for key in descriptors})
+
+    gss = solver.gss
+    states = len(tables)
+    _, packed_edges = measure(lambda: [list(edges) for edges in gss.edges])
+    _, tuple_edges = measure(
+        lambda: [[divmod(edge, states) for edge in edges] for edges in gss.edges]
+    )
+
+    print(
+        f"vertices: {len(adjacency)}, descriptors: {len(descriptors)}, "
+        f"GSS nodes: {len(gss)}, run: {elapsed:.2f} s"
+    )
+    for name, compact, loose in [
+        ("descriptor set", packed, tuples),
+        ("GSS edges", packed_edges, tuple_edges),
+    ]:
+        print(
+            f"{name}: {compact / 2**20:.1f} MiB packed, "
+            f"{loose / 2**20:.1f} MiB as tuples ({loose / compact:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
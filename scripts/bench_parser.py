@@ -0,0 +1,109 @@
+import argparse
+import io
+import pickle
+import sys
+import time
+
+import shared
+
+EXAMPLES = shared.TESTS / "autotests" / "program_examples"
+
+
+class _Node:
+    pass
+
+
+class _TreeUnpickler(pickle.Unpickler):
+    """
+    Loads grammarinator trees without grammarinator, the pickled example
+    trees predate its slotted node classes
+    """
+
+    def find_class(self, module, name):
+        if module.startswith("grammarinator."):
+            return type(name, (_Node,), {})
+        return super().find_class(module, name)
+
+
+def _tokens(node):
+    children = getattr(node, "children", None)
+    if children is None:
+        if node.src != "<EOF>":
+            yield node.src
+        return
+    for child in children:
+        yield from _tokens(child)
+
+
+def load_example(path) -> list[str]:
+    """
+    :return: lines of an example program, a statement per line
+    """
+    root, _ = _TreeUnpickler(io.BytesIO(path.read_bytes())).load()
+    return [
+        " ".join(_tokens(child))
+        for child in root.children
+        if getattr(child, "name", None) == "stmt"
+    ]
+
+
+def graph_program(edges: int, seed: int) -> list[str]:
+    """
+    lines of a program in the shape of GraphProgram of the autotests
+    """
+    import random
+
+    rng = random.Random(seed)
+    vertices = max(2, edges // 4)
+    return ["let g is graph"] + [
+        f'add edge ({rng.randrange(vertices)}, "{rng.choice("abc")}", '
+        f"{rng.randrange(vertices)}) to g"
+        for _ in range(edges)
+    ]
+
+
+def measure(parse, programs: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for program in programs:
+            parse(program)
+    return time.perf_counter() - start
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+    from project.task11 import ProgramParser
+
+    parser = argparse.ArgumentParser(
+        description="lines per second of the program parser on the example "
+        "corpus and on a large graph program, SLL-first against plain LL"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--edges", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = [load_example(path) for path in sorted(EXAMPLES.glob("*.grtp"))]
+    workloads = [
+        ("examples", ["\n".join(lines) for lines in corpus], args.repeat),
+        ("graph", ["\n".join(graph_program(args.edges, args.seed))], 1),
+    ]
+    parsers = [
+        ("LL, fresh parser", lambda text: ProgramParser(sll_first=False).parse(text)),
+        ("LL, reused parser", ProgramParser(sll_first=False).parse),
+        ("SLL first, reused", ProgramParser().parse),
+    ]
+    for workload, programs, repeat in workloads:
+        lines = repeat * sum(program.count("\n") + 1 for program in programs)
+        # warm the shared DFA caches so every parser is measured alike
+        measure(ProgramParser().parse, programs, 1)
+        for name, parse in parsers:
+            elapsed = measure(parse, programs, repeat)
+            print(
+                f"{workload}: {len(programs)} programs, {lines} lines, "
+                f"{name}: {lines / elapsed:,.0f} lines/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
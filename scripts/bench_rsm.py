@@ -0,0 +1,64 @@
+import argparse
+import sys
+import time
+
+import shared
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+    sys.path.insert(0, str(shared.TESTS / "autotests"))
+    import cfpq_data
+    from constants import CFG, EBNF
+    from grammars_constants import GRAMMARS_TABLE
+
+    from project.rsm_optimizer import optimize_rsm, rsm_size
+    from project.task8 import cfg_to_rsm, ebnf_to_rsm, tensor_based_cfpq
+    from project.task9 import gll_based_cfpq
+
+    parser = argparse.ArgumentParser(
+        description="sizes of the recursive automata of the test grammars and "
+        "the tensor and GLL query times before and after optimize_rsm"
+    )
+    parser.add_argument("--vertices", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    graph = cfpq_data.labeled_binomial_graph(
+        args.vertices, 0.02, labels=list("abcdef"), seed=args.seed
+    )
+    grammars = [
+        (str(cfg.to_text()).replace("\n", "; "), cfg_to_rsm(cfg))
+        for dataset in GRAMMARS_TABLE
+        for cfg in dataset[CFG]
+    ] + [
+        (ebnf.replace("\n", "; "), ebnf_to_rsm(ebnf))
+        for dataset in GRAMMARS_TABLE
+        for ebnf in dataset[EBNF]
+    ]
+
+    totals = {"before": [0, 0.0, 0.0], "after": [0, 0.0, 0.0]}
+    for text, rsm in grammars:
+        optimized = optimize_rsm(rsm)
+        sizes = []
+        for name, automaton in (("before", rsm), ("after", optimized)):
+            size = rsm_size(automaton)
+            timings = []
+            for engine in (tensor_based_cfpq, gll_based_cfpq):
+                start = time.perf_counter()
+                engine(automaton, graph, set(), set())
+                timings.append(time.perf_counter() - start)
+            totals[name][0] += size.states
+            totals[name][1] += timings[0]
+            totals[name][2] += timings[1]
+            sizes.append(f"{size.boxes} boxes / {size.states} states")
+        print(f"{sizes[0]:>22} -> {sizes[1]:<22} {text[:60]}")
+    for name, (states, tensor, gll) in totals.items():
+        print(
+            f"{name}: {states} states, tensor {tensor:.2f} s, GLL {gll:.2f} s "
+            f"over {len(grammars)} grammars"
+        )
+
+
+if __name__ == "__main__":
+    main()
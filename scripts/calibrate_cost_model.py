@@ -0,0 +1,174 @@
+import argparse
+import json
+import statistics
+import sys
+
+import run_benchmarks
+import shared
+
+
+def measure_rpq(matrix: dict, args) -> list[tuple]:
+    """
+    time both RPQ engines on the graphs and regexes of the matrix
+    :return: (features, engine, direction, seconds) of every run
+    """
+    import cfpq_data
+
+    from project.edge_list_graph import EdgeListGraph
+    from project.rpq_planner import rpq_features
+    from project.task3 import tensor_based_rpq
+    from project.task4 import ms_bfs_based_rpq
+
+    measurements = []
+    for spec in matrix["graphs"]:
+        if args.graph and spec["name"] not in args.graph:
+            continue
+        graph = run_benchmarks.load_graph(spec, args.download)
+        if graph is None:
+            print(f"{spec['name']}: not in the CFPQ_Data cache, skipped")
+            continue
+        compact = EdgeListGraph.from_networkx(graph)
+        labels = run_benchmarks.query_labels(graph)
+        for template in matrix.get("regexes", []):
+            regex = run_benchmarks.fill(template, labels)
+            if regex is None:
+                continue
+            for size in args.sources:
+                starts = cfpq_data.generate_multiple_source(
+                    graph, min(size, graph.number_of_nodes()), seed=args.seed
+                )
+                features = rpq_features(regex, compact, starts, set())
+                for engine, run in [
+                    ("tensor", lambda: tensor_based_rpq(regex, compact, starts, set())),
+                    ("ms_bfs", lambda: ms_bfs_based_rpq(regex, compact, starts, set())),
+                ]:
+                    _, times = run_benchmarks.measure(
+                        run, args.warmup, args.repeat, cold=False
+                    )
+                    seconds = statistics.fmean(times)
+                    measurements.append((features, engine, "forward", seconds))
+                    print(
+                        f"{spec['name']}/{regex}/{len(starts)}/{engine}: "
+                        f"{seconds * 1e3:.1f} ms"
+                    )
+    return measurements
+
+
+def measure_cfpq(matrix: dict, args) -> list[tuple]:
+    """
+    time the CFPQ engines on the graphs and grammars of the matrix
+    :return: (features, engine, seconds) of every run
+    """
+    import cfpq_data
+    from pyformlang.cfg import CFG
+
+    from project.cfpq_planner import cfg_to_boxes, cfpq_features
+    from project.edge_list_graph import EdgeListGraph
+
+    available = run_benchmarks.engines("cfpq")
+    measurements = []
+    for spec in matrix["graphs"]:
+        if args.graph and spec["name"] not in args.graph:
+            continue
+        graph = run_benchmarks.load_graph(spec, args.download)
+        if graph is None:
+            print(f"{spec['name']}: not in the CFPQ_Data cache, skipped")
+            continue
+        compact = EdgeListGraph.from_networkx(graph)
+        labels = run_benchmarks.query_labels(graph)
+        for template in matrix.get("grammars", []):
+            text = run_benchmarks.fill(template, labels)
+            if text is None:
+                continue
+            cfg = CFG.from_text(text)
+            rsm = cfg_to_boxes(cfg)
+            for size in args.sources:
+                starts = cfpq_data.generate_multiple_source(
+                    graph, min(size, graph.number_of_nodes()), seed=args.seed
+                )
+                features = cfpq_features(cfg, rsm, compact, starts, set())
+                for engine in matrix["engines"]["cfpq"]:
+                    build, run = available[engine]
+                    query = build(text)
+                    _, times = run_benchmarks.measure(
+                        lambda: run(query, compact, starts, set()),
+                        args.warmup,
+                        args.repeat,
+                        cold=False,
+                    )
+                    seconds = statistics.fmean(times)
+                    measurements.append((features, engine, seconds))
+                    print(
+                        f"{spec['name']}/{text.replace(chr(10), '; ')}/"
+                        f"{len(starts)}/{engine}: {seconds * 1e3:.1f} ms"
+                    )
+    return measurements
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+    from project.cfpq_planner import fit_cfpq_model
+    from project.cost_model import COST_MODEL_PATH, save_cost_model
+    from project.rpq_planner import fit_rpq_model
+
+    parser = argparse.ArgumentParser(
+        description="time the query engines on the graphs and queries of the "
+        "benchmark matrix, fit the coefficients of the query planner cost "
+        "models to the times and store them"
+    )
+    parser.add_argument(
+        "--matrix", default=str(run_benchmarks.MATRIX), help="benchmark matrix"
+    )
+    parser.add_argument(
+        "--output", default=str(COST_MODEL_PATH), help="JSON file for the models"
+    )
+    parser.add_argument(
+        "--sources",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 1000],
+        help="start set sizes",
+    )
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1, help="start set seed")
+    parser.add_argument("--graph", action="append", help="only these graphs")
+    parser.add_argument(
+        "--planner",
+        action="append",
+        choices=["rpq", "cfpq"],
+        help="only these cost models",
+    )
+    parser.add_argument(
+        "--download",
+        action="store_true",
+        help="download dataset graphs missing from the CFPQ_Data cache",
+    )
+    args = parser.parse_args()
+    if args.repeat < 1:
+        raise ValueError(f"Number of repetitions must be positive, got {args.repeat}")
+
+    with open(args.matrix) as file:
+        matrix = json.load(file)
+    planners = {
+        "rpq": (measure_rpq, fit_rpq_model),
+        "cfpq": (measure_cfpq, fit_cfpq_model),
+    }
+    fitted = False
+    for section in args.planner or planners:
+        measure, fit = planners[section]
+        measurements = measure(matrix, args)
+        if not measurements:
+            print(f"nothing was measured, the {section} cost model is left as it is")
+            continue
+        model = fit(measurements)
+        path = save_cost_model(section, model, args.output)
+        print(f"{section} cost model written to {path}:")
+        for name, value in model._asdict().items():
+            print(f"  {name} = {value:.3e}")
+        fitted = True
+    sys.exit(0 if fitted else 1)
+
+
+if __name__ == "__main__":
+    main()
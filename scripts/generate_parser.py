@@ -0,0 +1,35 @@
+import argparse
+import shlex
+import subprocess
+
+import shared
+
+GRAMMAR = shared.ROOT / "project" / "GraphQuery.g4"
+OUTPUT = shared.ROOT / "project" / "graph_query"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="generate the Python parser of the query language"
+    )
+    parser.add_argument(
+        "--antlr",
+        default="antlr4 -v 4.13.1",
+        help="command running the ANTLR tool, antlr4-tools by default",
+    )
+    args = parser.parse_args()
+    subprocess.check_call(
+        [
+            *shlex.split(args.antlr),
+            "-Dlanguage=Python3",
+            "-visitor",
+            "-o",
+            str(OUTPUT),
+            "-Xexact-output-dir",
+            str(GRAMMAR),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import shared
+
+MATRIX = shared.ROOT / "scripts" / "benchmarks.json"
+
+
+def load_graph(spec: dict, download: bool):
+    """
+    networkx graph of a matrix entry, a dataset graph is read from the
+    CFPQ_Data cache and downloaded only if asked to
+    :return: the graph, or None if a dataset graph is not cached
+    """
+    import cfpq_data
+    from cfpq_data.dataset.data import GRAPHS_DIR
+
+    if "dataset" in spec:
+        name = spec["dataset"]
+        path = GRAPHS_DIR / name / f"{name}.csv"
+        if not path.exists():
+            if not download:
+                return None
+            path = cfpq_data.download(name)
+        return cfpq_data.graph_from_csv(path)
+    generators = {
+        "labeled_scale_free_graph": cfpq_data.labeled_scale_free_graph,
+        "labeled_two_cycles_graph": cfpq_data.labeled_two_cycles_graph,
+        "labeled_binomial_graph": cfpq_data.labeled_binomial_graph,
+    }
+    generator = generators.get(spec.get("generator"))
+    if generator is None:
+        raise ValueError(
+            f"Unknown graph generator {spec.get('generator')!r}, "
+            f"expected one of {', '.join(generators)}"
+        )
+    args = dict(spec.get("args", {}))
+    positional = [args.pop(name) for name in ("n", "m", "p") if name in args]
+    if "labels" in args:
+        args["labels"] = tuple(args["labels"])
+    return generator(*positional, **args)
+
+
+def query_labels(graph) -> list[str]:
+    """
+    labels of a graph by frequency, those that read as terminals in both
+    the regex and the grammar syntax
+    """
+    counts = Counter(label for _, _, label in graph.edges(data="label"))
+    return [
+        label
+        for label, _ in counts.most_common()
+        if isinstance(label, str) and label.isidentifier() and label[0].islower()
+    ]
+
+
+def fill(template: str, labels: list[str]) -> str | None:
+    """
+    template with {i} replaced by the i-th label, None if there are too few
+    """
+    try:
+        return template.format(*labels)
+    except IndexError:
+        return None
+
+
+def engines(kind: str):
+    from pyformlang.cfg import CFG
+
+    from project.task3 import tensor_based_rpq
+    from project.task4 import ms_bfs_based_rpq
+    from project.task6 import hellings_based_cfpq
+    from project.task7 import matrix_based_cfpq
+    from project.task8 import cfg_to_rsm, tensor_based_cfpq
+    from project.task9 import gll_based_cfpq
+
+    # query objects are built before timing, the engines see them prepared
+    if kind == "rpq":
+        return {
+            "tensor": (str, tensor_based_rpq),
+            "ms_bfs": (str, ms_bfs_based_rpq),
+        }
+    return {
+        "hellings": (CFG.from_text, hellings_based_cfpq),
+        "matrix": (CFG.from_text, matrix_based_cfpq),
+        "tensor": (lambda text: cfg_to_rsm(CFG.from_text(text)), tensor_based_cfpq),
+        "gll": (lambda text: cfg_to_rsm(CFG.from_text(text)), gll_based_cfpq),
+    }
+
+
+def clear_caches() -> None:
+    from project.cfpq_pruning import PRUNED_CACHE
+    from project.task2 import DFA_CACHE, NFA_CACHE
+    from project.task3 import MATRIX_FA_CACHE
+
+    for cache in (DFA_CACHE, NFA_CACHE, MATRIX_FA_CACHE, PRUNED_CACHE):
+        cache.clear()
+
+
+def summary(times: list[float]) -> dict:
+    """
+    mean, standard deviation and the half-width of the 95% confidence
+    interval of the mean by the Student t distribution
+    """
+    from scipy import stats
+
+    mean = statistics.fmean(times)
+    if len(times) < 2:
+        return {"mean": mean, "stdev": 0.0, "ci95": 0.0}
+    stdev = statistics.stdev(times)
+    quantile = stats.t.ppf(0.975, len(times) - 1)
+    return {
+        "mean": mean,
+        "stdev": stdev,
+        "ci95": float(quantile * stdev / math.sqrt(len(times))),
+    }
+
+
+def measure(run, warmup: int, repeat: int, cold: bool) -> tuple[object, list[float]]:
+    result = None
+    for _ in range(warmup):
+        if cold:
+            clear_caches()
+        result = run()
+    times = []
+    for _ in range(repeat):
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def run_matrix(matrix: dict, args) -> tuple[list[dict], list[str]]:
+    """
+    run every engine on every case of the matrix
+    :return: results and the cases whose engines disagree
+    """
+    import cfpq_data
+
+    from project.edge_list_graph import EdgeListGraph
+
+    warmup = args.warmup if args.warmup is not None else matrix.get("warmup", 1)
+    repeat = args.repeat if args.repeat is not None else matrix.get("repeat", 5)
+    if repeat < 1:
+        raise ValueError(f"Number of repetitions must be positive, got {repeat}")
+    results, mismatches = [], []
+    for spec in matrix["graphs"]:
+        if args.graph and spec["name"] not in args.graph:
+            continue
+        graph = load_graph(spec, args.download)
+        if graph is None:
+            print(f"{spec['name']}: not in the CFPQ_Data cache, skipped")
+            continue
+        compact = EdgeListGraph.from_networkx(graph)
+        labels = query_labels(graph)
+        queries = [("rpq", text) for text in matrix.get("regexes", [])] + [
+            ("cfpq", text) for text in matrix.get("grammars", [])
+        ]
+        for kind, template in queries:
+            text = fill(template, labels)
+            if text is None:
+                continue
+            available = engines(kind)
+            names = [
+                name
+                for name in matrix["engines"][kind]
+                if not args.engine or name in args.engine
+            ]
+            for size in matrix.get("sources", [1]):
+                starts = cfpq_data.generate_multiple_source(
+                    graph, min(size, graph.number_of_nodes()), seed=args.seed
+                )
+                expected = None
+                for name in names:
+                    if name not in available:
+                        raise ValueError(
+                            f"Unknown {kind} engine {name!r}, "
+                            f"expected one of {', '.join(available)}"
+                        )
+                    build, engine = available[name]
+                    query = build(text)
+                    answers, times = measure(
+                        lambda: engine(query, compact, starts, set()),
+                        warmup,
+                        repeat,
+                        args.cold,
+                    )
+                    case = "/".join(
+                        [spec["name"], kind, text.replace("\n", "; "), str(size), name]
+                    )
+                    if expected is None:
+                        expected = answers
+                    elif answers != expected:
+                        mismatches.append(case)
+                    result = {
+                        "id": case,
+                        "graph": spec["name"],
+                        "kind": kind,
+                        "query": text,
+                        "sources": size,
+                        "engine": name,
+                        "answers": len(answers),
+                        "times": times,
+                        **summary(times),
+                    }
+                    results.append(result)
+                    print(
+                        f"{case}: {result['mean'] * 1e3:.1f} "
+                        f"± {result['ci95'] * 1e3:.1f} ms, {len(answers)} answers"
+                    )
+    return results, mismatches
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    cases slower than the baseline
+    :param threshold: relative slowdown below which a case is not reported
+    :return: a line per case whose mean is above the baseline mean by more
+        than the threshold and whose confidence interval lies above the
+        baseline one
+    """
+    previous = {result["id"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result["id"])
+        if base is None:
+            continue
+        slower = result["mean"] > base["mean"] * (1 + threshold)
+        separated = result["mean"] - result["ci95"] > base["mean"] + base["ci95"]
+        if slower and separated:
+            regressions.append(
+                f"{result['id']}: {base['mean'] * 1e3:.1f} -> "
+                f"{result['mean'] * 1e3:.1f} ms "
+                f"({result['mean'] / base['mean']:.2f}x)"
+            )
+    return regressions
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=shared.ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+
+    parser = argparse.ArgumentParser(
+        description="time the RPQ and CFPQ engines over a matrix of graphs, "
+        "queries and start sets, write the results as JSON and compare them "
+        "with a baseline"
+    )
+    parser.add_argument("--matrix", default=str(MATRIX), help="benchmark matrix")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--baseline", help="results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown reported as a regression",
+    )
+    parser.add_argument("--warmup", type=int, help="overrides the matrix")
+    parser.add_argument("--repeat", type=int, help="overrides the matrix")
+    parser.add_argument("--seed", type=int, default=1, help="start set seed")
+    parser.add_argument("--graph", action="append", help="only these graphs")
+    parser.add_argument("--engine", action="append", help="only these engines")
+    parser.add_argument(
+        "--cold", action="store_true", help="clear the query caches before each run"
+    )
+    parser.add_argument(
+        "--download",
+        action="store_true",
+        help="download dataset graphs missing from the CFPQ_Data cache",
+    )
+    args = parser.parse_args()
+
+    with open(args.matrix) as file:
+        matrix = json.load(file)
+    results, mismatches = run_matrix(matrix, args)
+    report = {
+        "environment": environment(),
+        "settings": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failed = False
+    for case in mismatches:
+        print(f"answers differ from the first engine: {case}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for line in regressions:
+            print(f"regression: {line}")
+        failed = failed or bool(regressions)
+        if not regressions:
+            print("no regressions against the baseline")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import cfpq_data
+import numpy as np
+import pytest
+from pyformlang.cfg import CFG
+
+from project.answers import Answers
+from project.task3 import tensor_based_rpq, tensor_based_rpq_stream
+from project.task4 import (
+    ms_bfs_based_rpq,
+    ms_bfs_based_rpq_exists,
+    ms_bfs_based_rpq_stream,
+)
+from project.task6 import hellings_based_cfpq, hellings_based_cfpq_stream
+from project.task7 import matrix_based_cfpq, matrix_based_cfpq_stream
+from project.task8 import cfg_to_rsm, tensor_based_cfpq, tensor_based_cfpq_stream
+from project.task9 import gll_based_cfpq, gll_based_cfpq_exists, gll_based_cfpq_stream
+
+REGEX = "a* b (a | b)*"
+GRAMMAR = "S -> a S b S | a b"
+
+ENGINES = [
+    (tensor_based_rpq, tensor_based_rpq_stream, REGEX),
+    (ms_bfs_based_rpq, ms_bfs_based_rpq_stream, REGEX),
+    (hellings_based_cfpq, hellings_based_cfpq_stream, CFG.from_text(GRAMMAR)),
+    (matrix_based_cfpq, matrix_based_cfpq_stream, CFG.from_text(GRAMMAR)),
+    (tensor_based_cfpq, tensor_based_cfpq_stream, cfg_to_rsm(CFG.from_text(GRAMMAR))),
+    (gll_based_cfpq, gll_based_cfpq_stream, cfg_to_rsm(CFG.from_text(GRAMMAR))),
+]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(70, labels=["a", "b"], seed=19)
+
+
+@pytest.mark.parametrize("engine, stream, query", ENGINES)
+def test_stream_matches_set(graph, engine, stream, query):
+    start_nodes, final_nodes = set(range(0, 70, 2)), set(range(35))
+    expected = engine(query, graph, start_nodes, final_nodes)
+    answers = list(stream(query, graph, start_nodes, final_nodes))
+    assert len(answers) == len(expected)
+    assert set(answers) == expected
+
+
+@pytest.mark.parametrize("engine, stream, query", ENGINES)
+def test_chunks(graph, engine, stream, query):
+    expected = engine(query, graph, set(), set())
+    chunks = list(stream(query, graph, set(), set()).chunks(7))
+    assert all(chunk.shape[1] == 2 and 0 < len(chunk) <= 7 for chunk in chunks)
+    assert all(len(chunk) == 7 for chunk in chunks[:-1])
+    pairs = np.concatenate(chunks) if chunks else np.empty((0, 2))
+    assert {tuple(pair) for pair in pairs.tolist()} == expected
+
+
+def test_first_stops_early():
+    produced = []
+
+    def blocks():
+        for i in range(10):
+            produced.append(i)
+            yield np.array([i]), np.array([i])
+
+    answers = Answers(["x", "y", "z"] * 4, blocks())
+    assert answers.first(2) == [("x", "x"), ("y", "y")]
+    assert produced == [0, 1]
+
+
+LIMITED = [
+    (ms_bfs_based_rpq, ms_bfs_based_rpq_exists, REGEX, "c"),
+    (
+        gll_based_cfpq,
+        gll_based_cfpq_exists,
+        ENGINES[-1][2],
+        cfg_to_rsm(CFG.from_text("S -> c")),
+    ),
+]
+
+
+@pytest.mark.parametrize("engine, exists, query, unmatched", LIMITED)
+def test_exists(graph, engine, exists, query, unmatched):
+    assert exists(query, graph, {0, 1, 2}, set()) == bool(
+        engine(query, graph, {0, 1, 2}, set())
+    )
+    assert not exists(unmatched, graph, set(), set())
+
+
+@pytest.mark.parametrize("engine, exists, query, unmatched", LIMITED)
+@pytest.mark.parametrize("limit", [0, 1, 5, 10**6])
+def test_limit(graph, engine, exists, query, unmatched, limit):
+    everything = engine(query, graph, set(), set())
+    limited = engine(query, graph, set(), set(), limit=limit)
+    assert len(limited) == min(limit, len(everything))
+    assert limited <= everything
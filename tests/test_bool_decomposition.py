@@ -0,0 +1,49 @@
+import cfpq_data
+import pytest
+from scipy import sparse
+
+from project.bool_decomposition import FORMATS, BoolDecomposition
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+
+
+def test_conversion_is_cached():
+    decomposition = BoolDecomposition.from_edges(3, {"a": ([0, 1], [1, 2])})
+    csc = decomposition.get("a", "csc")
+    assert csc.format == "csc"
+    assert decomposition.get("a", "csc") is csc
+    assert set(decomposition.memory_usage()) == {"csr", "csc"}
+
+
+def test_backward_is_transpose():
+    decomposition = BoolDecomposition.from_edges(3, {"a": ([0, 1], [1, 2])})
+    backward = decomposition.backward("a")
+    assert backward.format == "csr"
+    assert (backward != decomposition["a"].T).nnz == 0
+
+
+def test_memory_usage_grows_with_copies():
+    decomposition = BoolDecomposition(4)
+    decomposition["a"] = sparse.identity(4, dtype=bool)
+    before = decomposition.nbytes()
+    for format in FORMATS:
+        decomposition.get("a", format)
+    assert decomposition.nbytes() > before
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        BoolDecomposition(1, "bsr")
+
+
+@pytest.mark.parametrize("format", FORMATS)
+def test_rpq_formats_agree(graph, format):
+    regex = "a* b (a | b)*"
+    expected = tensor_based_rpq(regex, graph, {0, 5}, set())
+    assert tensor_based_rpq(regex, graph, {0, 5}, set(), format=format) == expected
+    assert ms_bfs_based_rpq(regex, graph, {0, 5}, set(), format=format) == expected
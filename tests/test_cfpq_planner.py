@@ -0,0 +1,159 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG, Production, Terminal, Variable
+
+from project.cfpq_planner import (
+    CFPQ_ENGINES,
+    CfpqCostModel,
+    CfpqFeatures,
+    cfg_to_boxes,
+    cfpq,
+    fit_cfpq_model,
+    plan_cfpq,
+)
+from project.query_stats import QueryStats
+from project.task6 import hellings_based_cfpq
+from project.task8 import cfg_to_rsm
+from project.task12 import exec_program
+
+GRAMMARS = [
+    "S -> a S b S | $",
+    "S -> A B\nA -> a A | a\nB -> b",
+    "S -> a S b | a b",
+    "S -> S S | a | c b",
+]
+
+FILTERS = [
+    (set(), set()),
+    ({0, 4, 9}, set()),
+    (set(), set(range(20, 40))),
+    ({1}, {2, 3}),
+]
+
+
+def only(engine: str) -> CfpqCostModel:
+    """
+    model under which the given engine is the cheapest for any query
+    """
+    model = CfpqCostModel()
+    fixed = {name: 1.0 for name in model._fields if name.endswith("_fixed")}
+    fixed[f"{engine}_fixed"] = 0.0
+    return CfpqCostModel(**{name: 0.0 for name in model._fields} | fixed)
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(40, labels=["a", "b", "c"], seed=7)
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+@pytest.mark.parametrize("start_nodes, final_nodes", FILTERS)
+def test_same_answers(graph, grammar, start_nodes, final_nodes):
+    cfg = CFG.from_text(grammar)
+    expected = hellings_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    for engine in CFPQ_ENGINES:
+        stats = QueryStats()
+        actual = cfpq(cfg, graph, start_nodes, final_nodes, only(engine), stats)
+        assert actual == expected
+        assert stats.decisions[0]["engine"] == engine
+    rsm = cfg_to_rsm(cfg)
+    for engine in ("tensor", "gll"):
+        assert cfpq(rsm, graph, start_nodes, final_nodes, only(engine)) == expected
+
+
+@pytest.mark.parametrize("engine", ["tensor", "gll"])
+def test_nullable_variable(graph, engine):
+    cfg = CFG.from_text(GRAMMARS[0])
+    boxes = cfg_to_boxes(cfg).boxes.values()
+    assert {symbol.value for box in boxes for symbol in box.dfa.symbols} == {
+        "a",
+        "b",
+        "S",
+    }
+    actual = cfpq(cfg, graph, model=only(engine))
+    assert {(v, v) for v in graph.nodes} <= actual
+    assert actual == hellings_based_cfpq(cfg, graph)
+
+
+def test_rsm_query_runs_on_rsm_engines(graph):
+    stats = QueryStats()
+    rsm = cfg_to_rsm(CFG.from_text(GRAMMARS[0]))
+    cfpq(rsm, graph, model=only("matrix"), stats=stats)
+    (decision,) = stats.decisions
+    assert decision["planner"] == "cfpq"
+    assert set(decision["costs"]) == {"tensor", "gll"}
+    assert stats.counts[f"plan_{decision['engine']}"] == 1
+
+
+def test_boxes_keep_symbol_values(graph):
+    # variables that the text form of a grammar cannot hold
+    a, b = Terminal("a"), Terminal("b")
+    start, inner = Variable(("S", 0)), Variable(("S", 1))
+    cfg = CFG(
+        start_symbol=start,
+        productions={
+            Production(start, [a, inner, b]),
+            Production(start, [a, b]),
+            Production(inner, [start]),
+        },
+    )
+    expected = hellings_based_cfpq(cfg, graph)
+    assert cfpq(cfg_to_boxes(cfg), graph, model=only("gll")) == expected
+
+
+def test_name_clash_keeps_grammar_engines(graph):
+    # S -> a A | b, A -> c with the variable A named a
+    start, clash = Variable("S"), Variable("a")
+    cfg = CFG(
+        start_symbol=start,
+        productions={
+            Production(start, [Terminal("a"), clash]),
+            Production(start, [Terminal("b")]),
+            Production(clash, [Terminal("c")]),
+        },
+    )
+    stats = QueryStats()
+    cfpq(cfg, graph, model=only("gll"), stats=stats)
+    assert set(stats.decisions[0]["costs"]) == {"hellings", "matrix"}
+
+
+def test_plan():
+    model = CfpqCostModel()
+    one_source = CfpqFeatures(1_000, 3_000, 4, 6, 6, 1, 1_000)
+    assert plan_cfpq(one_source, model).engine == "gll"
+    all_pairs = one_source._replace(sources=1_000)
+    plan = plan_cfpq(all_pairs, model)
+    assert plan.engine == "matrix"
+    assert plan.costs["matrix"] == min(plan.costs.values())
+    with pytest.raises(ValueError):
+        plan_cfpq(all_pairs, model, ["cyk"])
+
+
+def test_fit():
+    truth = CfpqCostModel(*[(i + 1) * 1e-8 for i in range(len(CfpqCostModel._fields))])
+    measurements = []
+    for vertices in (100, 1_000, 10_000):
+        for sources in (1, 10, 100):
+            for productions in (2, 5, 9):
+                features = CfpqFeatures(
+                    vertices, 3 * vertices, productions, 7, 9, sources, vertices
+                )
+                plan = plan_cfpq(features, truth)
+                measurements.extend(
+                    (features, engine, cost) for engine, cost in plan.costs.items()
+                )
+    assert fit_cfpq_model(measurements) == pytest.approx(truth, rel=1e-3)
+
+
+def test_program_select():
+    program = """
+let g is graph
+add edge (1, "a", 2) to g
+add edge (2, "b", 3) to g
+let q = "a" . q . "b" | "a" . "b"
+let r = for v in [1] return u where u reachable from v in g by q
+"""
+    stats = {}
+    assert exec_program(program, stats) == {"r": {3}}
+    decisions = [decision for value in stats.values() for decision in value.decisions]
+    assert [decision["planner"] for decision in decisions] == ["cfpq"]
@@ -0,0 +1,103 @@
+import cfpq_data
+import networkx as nx
+import pytest
+from pyformlang.cfg import CFG
+
+from project.cfpq_pruning import (
+    Footprint,
+    cfg_footprint,
+    prune_graph,
+    rsm_footprint,
+)
+from project.edge_list_graph import EdgeListGraph
+from project.task6 import hellings_based_cfpq
+from project.task7 import matrix_based_cfpq
+from project.task8 import cfg_to_rsm, ebnf_to_rsm, tensor_based_cfpq
+from project.task9 import gll_based_cfpq
+
+GRAMMARS = [
+    "S -> a S b S | $",
+    "S -> A B\nA -> a A | a\nB -> b",
+    "S -> a S b | a b",
+    "S -> A c\nA -> a | A a\nB -> d",
+]
+
+FILTERS = [
+    (set(), set()),
+    (set(range(5)), set()),
+    (set(), set(range(50, 70))),
+    ({3, 7}, set(range(30, 70))),
+    ({"absent"}, set()),
+]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(70, labels=["a", "b", "c", "d"], seed=3)
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+@pytest.mark.parametrize("start_nodes, final_nodes", FILTERS)
+def test_same_answers(graph, grammar, start_nodes, final_nodes):
+    cfg = CFG.from_text(grammar)
+    rsm = cfg_to_rsm(cfg)
+    for engine, query in [
+        (hellings_based_cfpq, cfg),
+        (matrix_based_cfpq, cfg),
+        (tensor_based_cfpq, rsm),
+        (gll_based_cfpq, rsm),
+    ]:
+        expected = engine(query, graph, start_nodes, final_nodes, prune=False)
+        assert engine(query, graph, start_nodes, final_nodes) == expected
+
+
+@pytest.mark.parametrize(
+    "grammar, footprint",
+    [
+        ("S -> a S b S | $", Footprint(frozenset("ab"), True)),
+        ("S -> A c\nA -> a | A a\nB -> d", Footprint(frozenset("ac"), False)),
+        ("S -> A c | d\nA -> A a", Footprint(frozenset("d"), False)),
+        ("S -> A A\nA -> a | $", Footprint(frozenset("a"), True)),
+    ],
+)
+def test_footprint(grammar, footprint):
+    cfg = CFG.from_text(grammar)
+    assert cfg_footprint(cfg) == footprint
+    assert rsm_footprint(cfg_to_rsm(cfg)) == footprint
+
+
+def test_footprint_of_nullable_call():
+    rsm = ebnf_to_rsm("S -> A B\nA -> a*\nB -> b | $")
+    assert rsm_footprint(rsm) == Footprint(frozenset("ab"), True)
+
+
+def test_cone():
+    # 0 -a-> 1 -b-> 2 -a-> 3, 4 -a-> 1, 2 -c-> 5
+    graph = EdgeListGraph.from_edges(
+        [(0, 1, "a"), (1, 2, "b"), (2, 3, "a"), (4, 1, "a"), (2, 5, "c"), (6, 6, "a")]
+    )
+    footprint = Footprint(frozenset("ab"), False)
+    assert sorted(prune_graph(graph, footprint, {0}, {2}).nodes) == [0, 1, 2]
+    assert sorted(prune_graph(graph, footprint, {0}, set()).nodes) == [0, 1, 2, 3]
+    assert sorted(prune_graph(graph, footprint, set(), {2}).nodes) == [0, 1, 2, 4]
+    assert sorted(prune_graph(graph, footprint, {5}, set()).nodes) == []
+    nullable = Footprint(frozenset("ab"), True)
+    assert sorted(prune_graph(graph, nullable, {5}, set()).nodes) == [5]
+
+
+def test_unchanged_graph_is_kept():
+    graph = EdgeListGraph.from_edges([(0, 1, "a"), (1, 0, "b")])
+    assert prune_graph(graph, Footprint(frozenset("ab"), False)) is graph
+    pruned = prune_graph(graph, Footprint(frozenset("a"), False))
+    assert pruned.number_of_edges() == 1
+    assert prune_graph(graph, Footprint(frozenset("a"), False)) is pruned
+
+
+def test_isolated_vertices_of_nullable_grammar():
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(range(4))
+    graph.add_edge(0, 1, label="a")
+    cfg = CFG.from_text("S -> a | $")
+    expected = {(0, 0), (1, 1), (2, 2), (3, 3), (0, 1)}
+    assert matrix_based_cfpq(cfg, graph) == expected
+    assert gll_based_cfpq(cfg_to_rsm(cfg), graph, {2, 3}, {3}) == {(3, 3)}
@@ -0,0 +1,64 @@
+import cfpq_data
+import numpy as np
+import pytest
+
+from project.edge_list_graph import EdgeListGraph
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b", "c"], seed=3)
+
+
+def test_networkx_roundtrip(graph):
+    compact = EdgeListGraph.from_networkx(graph)
+    assert compact.number_of_nodes() == graph.number_of_nodes()
+    assert compact.number_of_edges() == graph.number_of_edges()
+    assert sorted(compact.edges()) == sorted(graph.edges(data="label"))
+
+
+def test_csv_and_mmap(graph, tmp_path):
+    csv = tmp_path / "graph.csv"
+    csv.write_text(
+        "".join(f"{u} {v} {label}\n" for u, v, label in graph.edges(data="label"))
+    )
+    compact = EdgeListGraph.from_csv(csv)
+    assert sorted(compact.edges()) == sorted(graph.edges(data="label"))
+
+    compact.save(tmp_path / "index")
+    opened = EdgeListGraph.open(tmp_path / "index")
+    assert isinstance(opened.src, np.memmap)
+    assert sorted(opened.edges()) == sorted(compact.edges())
+
+
+def test_csv_layout(tmp_path):
+    csv = tmp_path / "graph.csv"
+    csv.write_bytes(b"0,1,a\r\n\n 1 , 20 , bc \r\n2,3\n20,0,a,extra")
+    compact = EdgeListGraph.from_csv(csv, sep=",")
+    assert sorted(compact.edges()) == [(0, 1, "a"), (1, 20, "bc"), (20, 0, "a")]
+    assert compact.number_of_nodes() == 3
+    with pytest.raises(ValueError):
+        EdgeListGraph.from_csv(csv, sep=", ")
+
+
+def test_unknown_endpoint():
+    edges = [(0, 1, "a"), (1, 5, "b")]
+    assert EdgeListGraph.from_edges(edges, [0, 1, 5, 7]).number_of_nodes() == 4
+    with pytest.raises(ValueError, match=r"\[5\]"):
+        EdgeListGraph.from_edges(edges, [0, 1, 2])
+    with pytest.raises(ValueError, match=r"\[9\]"):
+        EdgeListGraph.from_edges([(9, 0, "a")], [0, 1])
+    with pytest.raises(ValueError):
+        EdgeListGraph.from_edges(edges, [])
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | c)* b c*"])
+@pytest.mark.parametrize("rpq", [tensor_based_rpq, ms_bfs_based_rpq])
+def test_engines_accept_compact_graph(graph, regex, rpq):
+    compact = EdgeListGraph.from_networkx(graph)
+    start_nodes, final_nodes = {0, 1, 2, 10}, {3, 4, 5, 6, 7}
+    assert rpq(regex, compact, start_nodes, final_nodes) == rpq(
+        regex, graph, start_nodes, final_nodes
+    )
@@ -0,0 +1,114 @@
+import random
+
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.incremental import (
+    IncrementalMatrixCfpq,
+    IncrementalQuery,
+    IncrementalTensorRpq,
+)
+from project.task3 import tensor_based_rpq
+from project.task7 import matrix_based_cfpq
+
+LABELS = ["a", "b", "c"]
+REGEXES = ["a* b", "(a | b)* c*", "a b* a"]
+GRAMMARS = [
+    "S -> a S b S | $",
+    "S -> A B\nA -> a A | a\nB -> B b | b",
+    "S -> S S | a | b c",
+]
+
+
+def mutations(graph, seed, count=40):
+    """
+    random edits of the graph applied in place, yields each one as
+    (method name, arguments)
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        nodes = list(graph.nodes)
+        kind = rng.random()
+        if kind < 0.55 or not graph.number_of_edges():
+            u, v = rng.choice(nodes), rng.choice(nodes + [len(nodes) + 100])
+            label = rng.choice(LABELS)
+            graph.add_edge(u, v, label=label)
+            yield "add_edge", (u, label, v)
+        elif kind < 0.9:
+            u, v, label = rng.choice(list(graph.edges(data="label")))
+            key = next(k for k, d in graph[u][v].items() if d["label"] == label)
+            graph.remove_edge(u, v, key)
+            yield "remove_edge", (u, label, v)
+        else:
+            node = rng.choice(nodes)
+            graph.remove_node(node)
+            yield "remove_vertex", (node,)
+
+
+@pytest.fixture
+def graph():
+    return cfpq_data.labeled_scale_free_graph(40, labels=LABELS, seed=5)
+
+
+@pytest.mark.parametrize("regex", REGEXES)
+@pytest.mark.parametrize("endpoints", [(None, None), ({0, 1, 2, 3}, {4, 5, 6, 7})])
+def test_rpq_follows_mutations(graph, regex, endpoints):
+    start_nodes, final_nodes = endpoints
+    index = IncrementalTensorRpq(regex, graph, start_nodes, final_nodes)
+    assert index.answers() == tensor_based_rpq(
+        regex, graph, start_nodes or set(), final_nodes or set()
+    )
+    for method, args in mutations(graph, seed=len(regex)):
+        getattr(index, method)(*args)
+        expected = tensor_based_rpq(
+            regex, graph, start_nodes or set(), final_nodes or set()
+        )
+        assert index.answers() == expected, (method, args)
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+@pytest.mark.parametrize("endpoints", [(None, None), ({0, 1, 2, 3}, {4, 5, 6, 7})])
+def test_cfpq_follows_mutations(graph, grammar, endpoints):
+    cfg = CFG.from_text(grammar)
+    start_nodes, final_nodes = endpoints
+    index = IncrementalMatrixCfpq(cfg, graph, start_nodes, final_nodes)
+    assert index.answers() == matrix_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    for method, args in mutations(graph, seed=len(grammar)):
+        getattr(index, method)(*args)
+        expected = matrix_based_cfpq(cfg, graph, start_nodes, final_nodes)
+        assert index.answers() == expected, (method, args)
+
+
+def test_parallel_edges_are_counted(graph):
+    index = IncrementalTensorRpq("a", graph, set(), set())
+    index.add_edge(1000, "a", 1001)
+    index.add_edge(1000, "a", 1001)
+    index.remove_edge(1000, "a", 1001)
+    assert (1000, 1001) in index.answers()
+    index.remove_edge(1000, "a", 1001)
+    assert (1000, 1001) not in index.answers()
+
+
+def test_removed_vertex_comes_back(graph):
+    index = IncrementalMatrixCfpq(CFG.from_text("S -> a"), graph)
+    index.add_edge(1000, "a", 1001)
+    index.remove_vertex(1001)
+    assert all(1001 not in pair for pair in index.answers())
+    index.add_edge(1000, "a", 1001)
+    assert (1000, 1001) in index.answers()
+
+
+def test_incomplete_subclass_is_rejected(graph):
+    class NoDelete(IncrementalQuery):
+        def _grow(self, first):
+            pass
+
+        def _insert(self, u, label, v):
+            pass
+
+        def _pairs(self, starts, finals):
+            return starts, finals
+
+    with pytest.raises(TypeError):
+        NoDelete(graph, None, None)
@@ -0,0 +1,60 @@
+import json
+
+import cfpq_data
+import pytest
+
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MANIFEST, MatrixIndex, graph_digest
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b", "c"], seed=5)
+
+
+@pytest.fixture
+def index_dir(graph, tmp_path):
+    MatrixIndex.build(graph, tmp_path / "index")
+    return tmp_path / "index"
+
+
+def test_roundtrip(graph, index_dir):
+    index = MatrixIndex.open(index_dir, source=graph)
+    assert index.number_of_nodes() == graph.number_of_nodes()
+    assert index.number_of_edges() == len(set(graph.edges(data="label")))
+    for _, matrix in index.matrices.items("csr"):
+        # read-only views of the memory-mapped files, nothing was copied
+        assert not matrix.indices.flags.writeable
+        assert not matrix.indptr.flags.writeable
+
+
+def test_digest_is_representation_independent(graph):
+    assert graph_digest(graph) == graph_digest(EdgeListGraph.from_networkx(graph))
+
+
+def test_other_graph_is_rejected(graph, index_dir):
+    other = graph.copy()
+    other.add_edge(0, 1, label="d")
+    with pytest.raises(ValueError):
+        MatrixIndex.open(index_dir, source=other)
+
+
+def test_old_version_is_rejected(index_dir):
+    manifest = json.loads((index_dir / MANIFEST).read_text())
+    manifest["version"] = 0
+    (index_dir / MANIFEST).write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        MatrixIndex.open(index_dir)
+
+
+@pytest.mark.parametrize("regex", ["a* b", "(a | c)* b c*"])
+@pytest.mark.parametrize("rpq", [tensor_based_rpq, ms_bfs_based_rpq])
+def test_engines_accept_index(graph, index_dir, regex, rpq):
+    index = MatrixIndex.open(index_dir)
+    start_nodes, final_nodes = {0, 1, 2, 10}, {3, 4, 5, 6, 7}
+    assert rpq(regex, index, start_nodes, final_nodes) == rpq(
+        regex, graph, start_nodes, final_nodes
+    )
+    assert rpq(regex, index, set(), set()) == rpq(regex, graph, set(), set())
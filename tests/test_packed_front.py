@@ -0,0 +1,42 @@
+import random
+
+import cfpq_data
+import pytest
+from scipy import sparse
+
+from project.task3 import tensor_based_rpq
+from project.task4 import FRONT_MODES, _pack, _unpack, ms_bfs_based_rpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(200, labels=["a", "b", "c"], seed=7)
+
+
+def test_pack_roundtrip():
+    random.seed(1)
+    n, sources, vertices = 3, 130, 20
+    rows = [random.randrange(n * sources) for _ in range(300)]
+    cols = [random.randrange(vertices) for _ in range(300)]
+    matrix = sparse.csr_matrix(
+        ([True] * len(rows), (rows, cols)), shape=(n * sources, vertices), dtype=bool
+    )
+    packed = _pack(matrix, n, sources)
+    assert packed.shape == (n, vertices, 3)
+    assert (_unpack(packed, n, sources) != matrix).nnz == 0
+
+
+@pytest.mark.parametrize("front", FRONT_MODES)
+@pytest.mark.parametrize("regex", ["a* b", "(a | b)* c", "(a b)*"])
+def test_front_modes_agree(graph, front, regex):
+    random.seed(2)
+    start_nodes = set(random.sample(list(graph.nodes), 100))
+    final_nodes = set(random.sample(list(graph.nodes), 50))
+    expected = tensor_based_rpq(regex, graph, start_nodes, final_nodes)
+    actual = ms_bfs_based_rpq(regex, graph, start_nodes, final_nodes, front=front)
+    assert actual == expected
+
+
+def test_unknown_front_mode(graph):
+    with pytest.raises(ValueError):
+        ms_bfs_based_rpq("a", graph, {0}, {1}, front="dense")
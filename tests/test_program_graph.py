@@ -0,0 +1,66 @@
+import random
+
+import pytest
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+
+from project.program_graph import ProgramGraph, edge_batch
+from project.task2 import LABEL
+from project.task3 import tensor_based_rpq
+from project.task7 import matrix_based_cfpq
+
+
+def apply(graph: MultiDiGraph, program_graph: ProgramGraph, rng: random.Random):
+    operation = rng.random()
+    if operation < 0.6:
+        edges = [
+            (rng.randrange(12), rng.choice("ab"), rng.randrange(12))
+            for _ in range(rng.randrange(1, 6))
+        ]
+        vertices = [rng.randrange(14) for _ in range(rng.randrange(2))]
+        for u, label, v in edges:
+            graph.add_edge(u, v, **{LABEL: label})
+        graph.add_nodes_from(vertices)
+        program_graph.add(edge_batch(vertices, edges))
+    elif operation < 0.9 and graph.number_of_edges():
+        u, v, label = rng.choice(list(graph.edges(data=LABEL)))
+        key = next(
+            key
+            for key, data in graph.get_edge_data(u, v).items()
+            if data[LABEL] == label
+        )
+        graph.remove_edge(u, v, key)
+        program_graph.remove_edge(u, label, v)
+    else:
+        vertices = {rng.randrange(14) for _ in range(2)}
+        graph.remove_nodes_from([vertex for vertex in vertices if vertex in graph])
+        program_graph.remove_vertices(vertices)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_networkx(seed):
+    rng = random.Random(seed)
+    graph, program_graph = MultiDiGraph(), ProgramGraph()
+    cfg = CFG.from_text("S -> a S b | a b")
+    for _ in range(40):
+        apply(graph, program_graph, rng)
+        assert set(program_graph.nodes) == set(graph.nodes)
+        assert program_graph.number_of_edges() == graph.number_of_edges()
+        snapshot = program_graph.snapshot()
+        assert tensor_based_rpq("a b*", snapshot, set(), set()) == tensor_based_rpq(
+            "a b*", graph, set(), set()
+        )
+        assert matrix_based_cfpq(cfg, snapshot) == matrix_based_cfpq(cfg, graph)
+
+
+def test_snapshot_is_cached():
+    program_graph = ProgramGraph()
+    program_graph.add(edge_batch([], [(1, "a", 2)]))
+    snapshot = program_graph.snapshot()
+    assert program_graph.snapshot() is snapshot
+    assert program_graph.snapshot([1, 2]) is snapshot
+    assert program_graph.snapshot([3]).nodes == [1, 2, 3]
+    program_graph.remove_edge(1, "b", 2)
+    assert program_graph.snapshot() is snapshot
+    program_graph.remove_edge(1, "a", 2)
+    assert program_graph.snapshot() is not snapshot
@@ -0,0 +1,288 @@
+import functools
+
+import pytest
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+
+from project import program_plan
+from project.cfpq_planner import CFPQ_ENGINES, CfpqCostModel, cfpq
+from project.task3 import tensor_based_rpq
+from project.task6 import hellings_based_cfpq
+from project.task7 import matrix_based_cfpq
+from project.task12 import (
+    PLAN_CACHE,
+    ProgramTypeError,
+    compile_program,
+    exec_program,
+    typing_program,
+)
+
+GRAPH = """
+let g is graph
+add edge (1, "a", 2) to g
+add edge (2, "a", 3) to g
+add edge (3, "a", 1) to g
+add edge (1, "c", 5) to g
+add edge (5, "b", 4) to g
+add edge (4, "b", 5) to g
+"""
+
+
+def test_example():
+    program = (
+        GRAPH
+        + """
+let q = "a"^[1..3] . q . "b"^[2..3] | "c"
+let r1 = for v in [2] return u where u reachable from v in g by q
+add edge (5, "d", 6) to g
+let r2 = for v in [2,3] return u,v where u reachable from v in g by (q . "d")
+"""
+    )
+    assert exec_program(program) == {"r1": {4, 5}, "r2": {(2, 6), (3, 6)}}
+
+
+def test_intersections():
+    program = (
+        GRAPH
+        + """
+let q = "a"^[1..3] . q . "b"^[2..3] | "c"
+let fa = return u, v where u reachable from v in g by ("a"^[1..] & "a" . "a")
+let rsm = return u, v where u reachable from v in g by (q & "a" . "c" . "b"^[2..])
+"""
+    )
+    result = exec_program(program)
+    assert result["fa"] == {(1, 3), (2, 1), (3, 2)}
+    assert result["rsm"] == {(3, 4), (3, 5)}
+
+
+def test_forward_nonterminals():
+    program = (
+        GRAPH
+        + """
+let s = "a" . t
+let t = "a" . s | "c"
+let r = for v in [2] return u where u reachable from v in g by s
+"""
+    )
+    assert exec_program(program) == {"r": {5}}
+
+
+def test_mutations_between_selects():
+    program = (
+        GRAPH
+        + """
+let r1 = return u, v where u reachable from v in g by "b"
+remove edge (5, "b", 4) from g
+let r2 = return u, v where u reachable from v in g by "b"
+remove vertices for v in [1, 2, 3] return v where u reachable from v in g by "a" from g
+let r3 = return v where u reachable from v in g by "c" ^ [0..]
+"""
+    )
+    result = exec_program(program)
+    assert result["r1"] == {(5, 4), (4, 5)}
+    assert result["r2"] == {(4, 5)}
+    assert result["r3"] == {4, 5}
+
+
+def test_add_runs_are_batched():
+    plan = compile_program(
+        GRAPH
+        + """
+add vertex 7 to g
+let h is graph
+add edge (1, "a", 2) to h
+add vertex 8 to g
+add vertex 9 to g
+let r = return v where u reachable from v in g by "a"
+"""
+    )
+    assert [node.op for node in plan.nodes].count("add") == 3
+    assert plan.run()["r"] == {1, 2, 3}
+
+
+def test_parallel_edges():
+    program = """
+let g is graph
+add edge (1, "a", 2) to g
+add edge (1, "a", 2) to g
+remove edge (1, "a", 2) from g
+let r1 = return u, v where u reachable from v in g by "a"
+remove edge (1, "a", 2) from g
+let r2 = return u, v where u reachable from v in g by "a"
+"""
+    result = exec_program(program)
+    assert result["r1"] == {(1, 2)}
+    assert result["r2"] == set()
+
+
+def test_selects_share_evaluation(monkeypatch):
+    calls = []
+
+    def counted(query, graph, starts, finals, **options):
+        calls.append((set(starts), set(finals)))
+        return tensor_based_rpq(query, graph, starts, finals, **options)
+
+    monkeypatch.setattr(program_plan, "tensor_based_rpq", counted)
+    program = (
+        GRAPH
+        + """
+let q = "a" . "a"
+let r1 = for v in [1] return u where u reachable from v in g by q
+let r2 = for v in [2, 3] return u, v where u reachable from v in g by q
+let r3 = for v in [1, 2] for u in [3] return v where u reachable from v in g by q
+remove edge (3, "a", 1) from g
+let r4 = for v in r1 return u where u reachable from v in g by q
+"""
+    )
+    result = exec_program(program)
+    assert result == {
+        "r1": {3},
+        "r2": {(2, 1), (3, 2)},
+        "r3": {1},
+        "r4": set(),
+    }
+    assert calls == [({1, 2, 3}, set()), ({3}, set())]
+
+
+def test_repeated_subexpressions_are_shared():
+    plan = compile_program('let p = ("a" . "b") | ("a" . "b") ^ [2]\nlet q = "a" . "b"')
+    assert [node.op for node in plan.nodes].count("concat") == 1
+
+
+def test_bounded_repeat_is_not_unrolled():
+    chain = "\n".join(f'add edge ({i}, "a", {i + 1}) to g' for i in range(250))
+    program = f"""
+let g is graph
+{chain}
+let r = for v in [0] return u where u reachable from v in g by "a" ^ [1..200]
+"""
+    assert exec_program(program)["r"] == set(range(1, 201))
+
+
+def test_regexp_rewrites():
+    plan = compile_program(
+        """
+let p = "a" | ("b" | "c") | "a" . "b" . "c" | "d"
+let q = ("a" ^ [0..]) ^ [2..5]
+"""
+    )
+    ops = [node.op for node in plan.nodes]
+    assert ops.count("union") == 1
+    assert ops.count("concat") == 1
+    assert ops.count("repeat") == 1
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ('("a" ^ [1..]) ^ [2..3]', {3}),
+        ('("a" ^ [1..]) ^ [0..2]', {1, 2, 3}),
+        ('("a" ^ [0..]) ^ [2..3]', {1, 2, 3}),
+        ('("a" ^ [1..]) ^ [3..]', set()),
+    ],
+)
+def test_repeated_closure(query, expected):
+    program = f"""
+let g is graph
+add edge (1, "a", 2) to g
+add edge (2, "a", 3) to g
+let r = for v in [1] return u where u reachable from v in g by {query}
+"""
+    assert exec_program(program)["r"] == expected
+
+
+@pytest.mark.parametrize(
+    "query, grammar, regex",
+    [
+        ("p ^ [2..3]", "S -> P P | P P P", None),
+        ("p ^ [1..]", "S -> P S | P", None),
+        ('p . "a" . "a" | "b"', "S -> P a a | b", None),
+        ('p & ("a" | "c") ^ [0..]', "S -> P", "(a | c)*"),
+        (
+            '(p | "b" . "b") & ("a" | "b" | "c") ^ [0..4]',
+            "S -> P | b b",
+            "($ | a | b | c) ($ | a | b | c) ($ | a | b | c) ($ | a | b | c)",
+        ),
+    ],
+)
+def test_grammar_queries(query, grammar, regex):
+    edges = [(1, "a", 2), (2, "a", 3), (3, "a", 1), (1, "c", 5), (5, "b", 4)]
+    edges += [(4, "b", 5), (4, "a", 1), (2, "b", 2)]
+    graph = MultiDiGraph()
+    for u, label, v in edges:
+        graph.add_edge(u, v, label=label)
+    program = "let g is graph\n"
+    program += "".join(
+        f'add edge ({u}, "{label}", {v}) to g\n' for u, label, v in edges
+    )
+    program += f"""
+let p = "a" . p . "b" | "c"
+let r = return u, v where u reachable from v in g by {query}
+"""
+    expected = CFG.from_text(grammar + "\nP -> a P b | c")
+    if regex is not None:
+        expected = expected.intersection(Regex(regex))
+    assert exec_program(program)["r"] == matrix_based_cfpq(expected, graph)
+
+
+@pytest.mark.parametrize("engine", CFPQ_ENGINES)
+def test_nullable_grammar(monkeypatch, engine):
+    edges = [(1, "a", 2), (2, "b", 3), (3, "a", 4), (4, "b", 1), (2, "c", 2)]
+    graph = MultiDiGraph()
+    for u, label, v in edges:
+        graph.add_edge(u, v, label=label)
+    program = "let g is graph\n"
+    program += "".join(
+        f'add edge ({u}, "{label}", {v}) to g\n' for u, label, v in edges
+    )
+    program += """
+let q = "a" . q . "b" . q | "c" ^ [0..1]
+let r = return u, v where u reachable from v in g by q
+"""
+    # the costs of every other engine are too high to be chosen
+    costs = {name: 0.0 for name in CfpqCostModel._fields}
+    costs |= {f"{other}_fixed": 1.0 for other in CFPQ_ENGINES if other != engine}
+    monkeypatch.setattr(
+        program_plan, "cfpq", functools.partial(cfpq, model=CfpqCostModel(**costs))
+    )
+    expected = hellings_based_cfpq(CFG.from_text("S -> a S b S | c | $"), graph)
+    assert {(v, v) for v in graph.nodes} <= expected
+    assert exec_program(program)["r"] == expected
+
+
+def test_plan_is_reused(monkeypatch):
+    program = GRAPH + 'let r = return u, v where u reachable from v in g by "a"'
+    PLAN_CACHE.clear()
+    first = exec_program(program)
+
+    def fail(_):
+        raise AssertionError("the program is parsed again")
+
+    monkeypatch.setattr(program_plan, "parse_program", fail)
+    assert exec_program(program) == first
+    assert PLAN_CACHE.stats()["hits"] == 1
+
+
+def test_pure_nodes_evaluated_once():
+    plan = compile_program(
+        GRAPH + 'let r = return u where u reachable from v in g by "a"^[2]'
+    )
+    plan.run()
+    constants = dict(plan._constants)
+    plan.run()
+    assert all(plan._constants[slot] is value for slot, value in constants.items())
+
+
+@pytest.mark.parametrize(
+    "program, message",
+    [
+        ('let p = "a" . p\nlet q = "b" . q\nlet r = p & q', "line 3:8"),
+        ('let g is graph\nremove vertex (1, "a", 2) from g', "expected int"),
+        ('let x = return v where u reachable from v in g by "a"', "g is not bound"),
+    ],
+)
+def test_type_errors(program, message):
+    assert not typing_program(program)
+    with pytest.raises(ProgramTypeError, match=message):
+        compile_program(program)
@@ -0,0 +1,72 @@
+import pytest
+
+from project.task11 import (
+    ProgramParser,
+    nodes_count,
+    program_to_tree,
+    tree_to_program,
+)
+
+PROGRAM = """
+let g is graph
+add edge (1, "a", 2) to g
+let q = "a"^[1..3] . q . "b"^[2..] | "c" ^ [0]
+let r = for v in [2, 3] return u, v where u reachable from v in g by (q & "a")
+remove vertices [1, 2] from g
+"""
+
+
+def test_round_trip():
+    tree, is_valid = program_to_tree(PROGRAM)
+    assert is_valid
+    program = tree_to_program(tree)
+    again, is_valid = program_to_tree(program)
+    assert is_valid
+    assert tree_to_program(again) == program
+    assert nodes_count(again) == nodes_count(tree)
+
+
+def test_precedence():
+    tree, _ = program_to_tree('let p = "a" . p ^ [2] | "b" & "c"')
+    regexp = tree.stmt(0).bind().expr().regexp()
+    assert regexp.getChild(1).getText() == "|"
+    assert regexp.regexp(0).getChild(1).getText() == "."
+    assert regexp.regexp(1).getChild(1).getText() == "&"
+
+
+@pytest.mark.parametrize(
+    "program",
+    [
+        "let g graph",
+        "let x 1",
+        "add edge (1, 2) to g",
+        'let q = "ab"',
+        "let r = return u where u reachable v in g by q",
+    ],
+)
+def test_invalid(program):
+    _, is_valid = program_to_tree(program)
+    assert not is_valid
+
+
+@pytest.mark.parametrize(
+    "program",
+    [PROGRAM, "let g graph", "let x = 1 $", "add edge (1, 2) to g\nlet x 1"],
+)
+def test_sll_first_as_ll(program):
+    sll_tree, sll_errors = ProgramParser().parse(program)
+    ll_tree, ll_errors = ProgramParser(sll_first=False).parse(program)
+    assert sll_errors == ll_errors
+    assert sll_tree.toStringTree() == ll_tree.toStringTree()
+
+
+def test_parser_reuse():
+    parser = ProgramParser()
+    first, errors = parser.parse(PROGRAM)
+    assert not errors
+    _, errors = parser.parse("let g graph")
+    assert errors
+    again, errors = parser.parse(PROGRAM)
+    assert not errors
+    assert tree_to_program(again) == tree_to_program(first)
+    assert parser.fallbacks == 1
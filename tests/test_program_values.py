@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+
+from project.program_values import (
+    Grammar,
+    epsilon_fa,
+    intersect_grammar,
+    repeat_fa,
+    repeat_grammar,
+)
+
+
+def unrolled(fa, low, high):
+    result = epsilon_fa()
+    for _ in range(low):
+        result = result.concatenate(fa)
+    if high is None:
+        return result.concatenate(fa.kleene_star()).minimize()
+    optional = fa.union(epsilon_fa())
+    for _ in range(high - low):
+        result = result.concatenate(optional)
+    return result.minimize()
+
+
+def words(alphabet: str, length: int):
+    for size in range(length + 1):
+        yield from itertools.product(alphabet, repeat=size)
+
+
+@pytest.mark.parametrize("regex", ["a", "a b", "a*", "a | b c", "(a | $) b", "$"])
+@pytest.mark.parametrize(
+    "low, high", [(0, 0), (0, 1), (1, 1), (0, 2), (2, 3), (3, 3), (0, None), (2, None)]
+)
+def test_repeat_fa(regex, low, high):
+    fa = Regex(regex).to_epsilon_nfa()
+    assert repeat_fa(fa, low, high).is_equivalent_to(unrolled(fa, low, high))
+
+
+@pytest.mark.parametrize("low, high", [(0, 0), (1, 1), (0, 5), (2, 7), (3, None)])
+def test_repeat_grammar(low, high):
+    cfg = CFG.from_text("S -> a S b | c")
+    grammar = Grammar(cfg.start_symbol, frozenset(cfg.productions), frozenset())
+    repeated = repeat_grammar(grammar, low, high, "R")
+    result = CFG(start_symbol=repeated.start, productions=repeated.productions)
+    for count in range(9):
+        word = ["c"] * count
+        assert result.contains(word) == (
+            low <= count and (high is None or count <= high)
+        )
+
+
+@pytest.mark.parametrize(
+    "grammar, regex",
+    [
+        ("S -> a S b | c", "(a | b | c)*"),
+        ("S -> a S b S | $", "a* b*"),
+        ("S -> A B\nA -> a A | a\nB -> b B | $", "a a b*"),
+        ("S -> a S b | c", "d"),
+        ("S -> S S | a | $", "a a a"),
+    ],
+)
+def test_intersect_grammar(grammar, regex):
+    cfg, fa = CFG.from_text(grammar), Regex(regex).to_epsilon_nfa()
+    intersection = intersect_grammar(cfg, fa, "I")
+    result = CFG(start_symbol=intersection.start, productions=intersection.productions)
+    expected = cfg.intersection(fa)
+    for word in words("abcd", 6):
+        assert result.contains(list(word)) == expected.contains(list(word))
+    assert len(intersection.productions) <= len(expected.productions)
@@ -0,0 +1,134 @@
+import networkx as nx
+import pytest
+
+from project.query_cache import (
+    LRUCache,
+    graph_version,
+    normalize_regex,
+    pinned_graph_versions,
+    touch_graph,
+)
+from project.rpq_planner import rpq
+from project.task2 import graph_to_nfa
+from project.task3 import (
+    MATRIX_FA_CACHE,
+    graph_to_matrix_fa,
+    regex_to_matrix_fa,
+    tensor_based_rpq,
+)
+from project.task4 import ms_bfs_based_rpq
+
+
+@pytest.mark.parametrize(
+    "regex1, regex2",
+    [
+        ("a | b", "b | a"),
+        ("(a | b) | c", "a | (b | c)"),
+        ("a (b c)", "(a b) c"),
+        ("a $", "a"),
+        ("(a*)*", "a*"),
+        ("a | a", "a"),
+    ],
+)
+def test_equivalent_regexes_share_key(regex1, regex2):
+    assert normalize_regex(regex1) == normalize_regex(regex2)
+
+
+def test_different_regexes_differ():
+    assert normalize_regex("a b") != normalize_regex("b a")
+
+
+def test_lru_evicts_by_entries():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_evicts_by_bytes():
+    cache = LRUCache(max_entries=None, max_bytes=10, sizeof=len)
+    cache.put("a", "123456")
+    cache.put("b", "1234")
+    assert len(cache) == 2
+    cache.put("c", "1")
+    assert "a" not in cache
+    assert cache.bytes == 5
+
+
+def test_counters():
+    cache = LRUCache()
+    assert cache.get_or_create("k", lambda: 1) == 1
+    assert cache.get_or_create("k", lambda: 2) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_regex_matrix_fa_is_shared():
+    assert regex_to_matrix_fa("x | y z") is regex_to_matrix_fa("(y z) | x")
+
+
+def test_graph_stamp_invalidates():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    touch_graph(graph)
+    before = graph_to_matrix_fa(graph, set(), set())
+    assert graph_to_matrix_fa(graph, set(), set()) is before
+
+    graph.add_edge(1, 2, label="a")
+    touch_graph(graph)
+    after = graph_to_matrix_fa(graph, set(), set())
+    assert after is not before
+    assert after.states_count == 3
+
+
+def test_unstamped_graph_uses_content():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    version = graph_version(graph)
+    assert graph_version(graph.copy()) == version
+    graph.add_edge(1, 0, label="b")
+    assert graph_version(graph) != version
+
+
+def test_unstamped_graph_changes_are_seen():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    assert tensor_based_rpq("a a", graph, {0}, set()) == set()
+    assert rpq("a a", graph, {0}, set()) == set()
+    graph.add_edge(1, 2, label="a")
+    assert tensor_based_rpq("a a", graph, {0}, set()) == {(0, 2)}
+    assert ms_bfs_based_rpq("a a", graph, {0}, set()) == {(0, 2)}
+    assert rpq("a a", graph, {0}, set()) == {(0, 2)}
+    copy = graph.copy()
+    copy.add_edge(2, 3, label="a")
+    assert tensor_based_rpq("a a", copy, {0}, set()) == {(0, 2)}
+    assert tensor_based_rpq("a a a", copy, {0}, set()) == {(0, 3)}
+    assert graph.graph == {} and copy.graph == {}
+
+
+def test_graph_nfa_is_cached():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    shared = graph_to_nfa(graph, {0}, set(), copy=False)
+    assert graph_to_nfa(graph, {0}, set(), copy=False) is shared
+    copy = graph_to_nfa(graph, {0}, set())
+    assert copy is not shared and copy.accepts("a")
+    graph.add_edge(1, 2, label="a")
+    assert graph_to_nfa(graph, {0}, set()).accepts("aa")
+
+
+def test_pinned_versions_hash_once():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    with pinned_graph_versions():
+        version = graph_version(graph)
+        graph.add_edge(1, 0, label="b")
+        assert graph_version(graph) == version
+    assert graph_version(graph) != version
+
+
+def test_matrix_fa_cache_counts_bytes():
+    regex_to_matrix_fa("q w e r t y")
+    assert MATRIX_FA_CACHE.bytes > 0
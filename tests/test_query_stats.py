@@ -0,0 +1,128 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.query_stats import NO_STATS, QueryStats
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+from project.task6 import hellings_based_cfpq
+from project.task7 import matrix_based_cfpq
+from project.task8 import cfg_to_rsm, tensor_based_cfpq
+from project.task9 import gll_based_cfpq
+from project.task12 import exec_program
+
+GRAMMAR = "S -> a S b S | $"
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b"], seed=5)
+
+
+def test_phases_add_up():
+    stats = QueryStats()
+    for _ in range(2):
+        with stats.phase("outer"):
+            with stats.phase("inner"):
+                pass
+    stats.count("rounds", 2)
+    stats.count("rounds")
+    stats.record("nnz", 4)
+    assert set(stats.seconds) == {"outer", "inner"}
+    assert stats.seconds["outer"] >= stats.seconds["inner"] >= 0
+    assert stats.counts == {"rounds": 3}
+
+    total = QueryStats()
+    total.add(stats)
+    total.add(stats)
+    assert total.counts == {"rounds": 6}
+    assert total.series == {"nnz": [4, 4]}
+    assert total.seconds["outer"] == pytest.approx(2 * stats.seconds["outer"])
+
+
+def test_timed_excludes_the_consumer():
+    stats = QueryStats()
+    assert list(stats.timed("items", iter(range(3)))) == [0, 1, 2]
+    assert "items" in stats.seconds
+
+
+def test_disabled_records_nothing():
+    with NO_STATS.phase("phase"):
+        NO_STATS.count("rounds")
+        NO_STATS.record("nnz", 1)
+    items = iter([1])
+    assert NO_STATS.timed("items", items) is items
+    assert NO_STATS.to_dict() == QueryStats().to_dict()
+
+
+def test_peak_memory():
+    stats = QueryStats(memory=True)
+    with stats.phase("allocate"):
+        data = bytearray(1 << 20)
+    del data
+    assert stats.peak_memory >= 1 << 20
+
+
+@pytest.mark.parametrize(
+    "engine, query, phases, counts",
+    [
+        (
+            tensor_based_rpq,
+            "a* b",
+            {"graph", "query", "intersection", "closure", "answers"},
+            {"closure_rounds"},
+        ),
+        (ms_bfs_based_rpq, "a* b", {"graph", "query", "bfs"}, {"levels"}),
+        (
+            hellings_based_cfpq,
+            CFG.from_text(GRAMMAR),
+            {"grammar", "graph", "worklist"},
+            {"triples"},
+        ),
+        (
+            matrix_based_cfpq,
+            CFG.from_text(GRAMMAR),
+            {"grammar", "graph", "fixpoint", "answers"},
+            {"rounds"},
+        ),
+        (
+            tensor_based_cfpq,
+            cfg_to_rsm(CFG.from_text(GRAMMAR)),
+            {"rsm", "graph", "intersection", "closure", "boxes", "answers"},
+            {"iterations", "closure_rounds"},
+        ),
+        (
+            gll_based_cfpq,
+            cfg_to_rsm(CFG.from_text(GRAMMAR)),
+            {"rsm", "graph", "gll"},
+            {"descriptors", "gss_nodes", "gss_edges", "popped"},
+        ),
+    ],
+)
+def test_engine_stats(graph, engine, query, phases, counts):
+    start_nodes, final_nodes = set(range(20)), set()
+    stats = QueryStats()
+    answer = engine(query, graph, start_nodes, final_nodes, stats=stats)
+    assert answer == engine(query, graph, start_nodes, final_nodes)
+    assert phases <= set(stats.seconds)
+    assert counts <= set(stats.counts)
+
+
+def test_program_stats():
+    program = """
+    let g is graph
+    add edge (1, "a", 2) to g
+    add edge (2, "b", 3) to g
+    let q = "a" . "b"
+    let r = for v in [1] return u where u reachable from v in g by q
+    let s = for v in [2] return u where u reachable from v in g by q
+    """
+    stats = {}
+    result = exec_program(program, stats)
+    assert result == {"r": {3}, "s": set()}
+    # the declaration and the batched adds, the selects share one call
+    assert set(stats) == {0, 1, 4, 5}
+    assert "add" in stats[1].seconds
+    assert {"select", "closure"} <= set(stats[4].seconds)
+    assert stats[4].counts["selects"] == stats[5].counts["selects"] == 1
+    assert "select" not in stats[5].seconds
@@ -0,0 +1,110 @@
+import cfpq_data
+import pytest
+
+from project.cost_model import fit_costs, load_cost_model, save_cost_model
+from project.edge_list_graph import EdgeListGraph
+from project.query_stats import QueryStats
+from project.rpq_planner import (
+    RpqCostModel,
+    RpqFeatures,
+    fit_rpq_model,
+    plan_rpq,
+    rpq,
+    rpq_features,
+)
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+
+REGEXES = ["a*", "a* b", "(a | b)* c", "a b* c*", "d"]
+
+FILTERS = [
+    (set(), set()),
+    ({0, 3, 7}, set()),
+    (set(), {1, 2}),
+    (set(range(40)), {5}),
+]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b", "c"], seed=5)
+
+
+@pytest.mark.parametrize("regex", REGEXES)
+@pytest.mark.parametrize("start_nodes, final_nodes", FILTERS)
+def test_backward_search(graph, regex, start_nodes, final_nodes):
+    expected = tensor_based_rpq(regex, graph, start_nodes, final_nodes)
+    for front in ("sparse", "packed"):
+        actual = ms_bfs_based_rpq(
+            regex, graph, start_nodes, final_nodes, front=front, direction="backward"
+        )
+        assert actual == expected
+
+
+@pytest.mark.parametrize("regex", REGEXES)
+@pytest.mark.parametrize("start_nodes, final_nodes", FILTERS)
+def test_same_answers(graph, regex, start_nodes, final_nodes):
+    expected = tensor_based_rpq(regex, graph, start_nodes, final_nodes)
+    for model in [
+        RpqCostModel(),
+        RpqCostModel(tensor_fixed=1.0),
+        RpqCostModel(ms_bfs_fixed=1.0),
+    ]:
+        assert rpq(regex, graph, start_nodes, final_nodes, model) == expected
+
+
+def test_features():
+    graph = EdgeListGraph.from_edges(
+        [(0, 1, "a"), (1, 2, "a"), (2, 0, "b"), (2, 3, "c"), (3, 3, "c")]
+    )
+    features = rpq_features("a* b", graph, {0}, set())
+    # the minimal DFA has a loop on a and a b transition, c is not read
+    assert features == RpqFeatures(4, 2, 3, 1, 4)
+
+
+def test_plan():
+    model = RpqCostModel()
+    few = plan_rpq(RpqFeatures(10_000, 3, 50_000, 2, 10_000), model)
+    assert (few.engine, few.direction, few.format) == ("ms_bfs", "forward", "csr")
+    few_finals = plan_rpq(RpqFeatures(10_000, 3, 50_000, 10_000, 2), model)
+    assert (few_finals.engine, few_finals.direction, few_finals.format) == (
+        "ms_bfs",
+        "backward",
+        "csc",
+    )
+    all_pairs = plan_rpq(RpqFeatures(10_000, 3, 50_000, 10_000, 10_000), model)
+    assert all_pairs.engine == "tensor"
+    assert all_pairs.tensor_cost < all_pairs.ms_bfs_cost
+
+
+def test_plan_stats(graph):
+    stats = QueryStats()
+    rpq("a* b", graph, {0}, set(), RpqCostModel(tensor_fixed=1.0), stats=stats)
+    assert stats.counts["plan_ms_bfs"] == 1
+    assert stats.counts["plan_forward"] == 1
+    assert "plan" in stats.seconds and "bfs" in stats.seconds
+
+
+def test_fit():
+    features = [[1, n, n * n] for n in range(1, 20)]
+    seconds = [0.5 + 2 * n + 0.25 * n * n for n in range(1, 20)]
+    assert fit_costs(features, seconds) == pytest.approx([0.5, 2, 0.25], rel=1e-6)
+
+    truth = RpqCostModel(1e-3, 1e-6, 1e-9, 2e-3, 2e-6, 3e-8)
+    measurements = []
+    for vertices in (100, 1_000, 10_000):
+        for sources in (1, 10, 100):
+            features = RpqFeatures(vertices, 3, 5 * vertices, sources, vertices)
+            plan = plan_rpq(features, truth)
+            measurements.append((features, "tensor", "forward", plan.tensor_cost))
+            measurements.append((features, "ms_bfs", "forward", plan.ms_bfs_cost))
+    assert fit_rpq_model(measurements) == pytest.approx(truth, rel=1e-3)
+
+
+def test_stored_model(tmp_path):
+    path = tmp_path / "cost_model.json"
+    assert load_cost_model("rpq", RpqCostModel(), path) == RpqCostModel()
+    model = RpqCostModel(tensor_closure=1.0)
+    save_cost_model("rpq", model, path)
+    save_cost_model("other", RpqCostModel(ms_bfs_fixed=2.0), path)
+    assert load_cost_model("rpq", RpqCostModel(), path) == model
@@ -0,0 +1,55 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.rsm_optimizer import RsmSize, optimize_rsm, rsm_size
+from project.task7 import matrix_based_cfpq
+from project.task8 import cfg_to_rsm, ebnf_to_rsm, tensor_based_cfpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b", "c"], seed=7)
+
+
+@pytest.mark.parametrize(
+    "grammar",
+    [
+        "S -> a S b S | $",
+        "S -> A B\nA -> a A | a\nB -> b",
+        "S -> S a | b S | c",
+        "S -> A S A | c\nA -> B\nB -> a | b",
+        "S -> A B\nA -> a A b | c\nB -> a B b | c",
+        "S -> A\nA -> S a | $\nB -> b",
+    ],
+)
+def test_same_answers(graph, grammar):
+    cfg = CFG.from_text(grammar)
+    rsm = cfg_to_rsm(cfg, optimize=True)
+    assert tensor_based_cfpq(rsm, graph) == matrix_based_cfpq(cfg, graph)
+    assert rsm.initial_label == cfg_to_rsm(cfg).initial_label
+
+
+@pytest.mark.parametrize(
+    "grammar, size",
+    [
+        # non-recursive boxes are inlined
+        ("S -> N B\nB -> $\nN -> a", RsmSize(1, 2, 1)),
+        # a self call at the end or the start of a box is a loop
+        ("S -> a S | $", RsmSize(1, 1, 1)),
+        ("S -> S b | a", RsmSize(1, 2, 2)),
+        # equivalent recursive boxes are merged
+        ("S -> A B\nA -> a A b | c\nB -> a B b | c", RsmSize(2, 7, 6)),
+    ],
+)
+def test_size(grammar, size):
+    assert rsm_size(cfg_to_rsm(CFG.from_text(grammar), optimize=True)) == size
+
+
+def test_ebnf():
+    rsm = ebnf_to_rsm("S -> A S b | $\nA -> a*", optimize=True)
+    assert rsm_size(rsm).boxes == 1
+    assert (
+        rsm_size(rsm).states < rsm_size(ebnf_to_rsm("S -> A S b | $\nA -> a*")).states
+    )
+    assert optimize_rsm(rsm).boxes.keys() == rsm.boxes.keys()
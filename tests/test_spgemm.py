@@ -0,0 +1,86 @@
+import cfpq_data
+import numpy as np
+import pytest
+from pyformlang.cfg import CFG
+from scipy import sparse
+
+from project import spgemm
+from project.spgemm import get_backend, set_backend, threaded_bool_matmul, use_backend
+from project.task3 import tensor_based_rpq
+from project.task4 import ms_bfs_based_rpq
+from project.task7 import matrix_based_cfpq
+
+
+def random_bool(rows: int, cols: int, density: float, seed: int) -> sparse.csr_matrix:
+    return sparse.random(
+        rows, cols, density, format="csr", dtype=np.bool_, random_state=seed
+    )
+
+
+def assert_same(a: sparse.spmatrix, b: sparse.spmatrix):
+    product = threaded_bool_matmul(a, b, workers=3)
+    expected = sparse.csr_matrix(a @ b)
+    expected.eliminate_zeros()
+    assert product.shape == expected.shape
+    assert (product != expected).nnz == 0
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("density", [0.0, 0.01, 0.2, 0.9])
+def test_same_as_scipy(seed, density):
+    assert_same(random_bool(50, 40, density, seed), random_bool(40, 60, density, seed))
+
+
+def test_parallel_blocks(monkeypatch):
+    # small enough blocks to split even this product between the threads
+    monkeypatch.setattr(spgemm, "MIN_PARALLEL_WORK", 1)
+    monkeypatch.setattr(spgemm, "MAX_BLOCK_WORK", 64)
+    assert_same(random_bool(200, 150, 0.05, 1), random_bool(150, 100, 0.05, 2))
+
+
+def test_saturated_rows():
+    a = random_bool(30, 30, 0.3, 5).tolil()
+    a[3, :] = True
+    b = random_bool(30, 20, 0.1, 6).tolil()
+    b[7, :] = True
+    assert_same(a.tocsr(), b.tocsr())
+
+
+def test_other_formats():
+    a, b = random_bool(20, 30, 0.2, 7), random_bool(30, 10, 0.2, 8)
+    assert_same(a.tocsc(), b.tolil())
+
+
+def test_shape_mismatch():
+    with pytest.raises(ValueError):
+        threaded_bool_matmul(random_bool(3, 4, 0.5, 0), random_bool(3, 4, 0.5, 0))
+
+
+def test_backend_setting():
+    previous = get_backend()
+    with use_backend("threads", 2):
+        assert get_backend() == ("threads", 2)
+    assert get_backend() == previous
+    with pytest.raises(ValueError):
+        set_backend("gpu")
+    with pytest.raises(ValueError):
+        set_backend("threads", 0)
+    assert get_backend() == previous
+
+
+def test_engines_agree():
+    graph = cfpq_data.labeled_two_cycles_graph(8, 5, labels=("a", "b"))
+    regex = "a* b (a | b)*"
+    cfg = CFG.from_text("S -> a S b | a b")
+    expected = (
+        tensor_based_rpq(regex, graph, set(), set()),
+        ms_bfs_based_rpq(regex, graph, {0, 3}, set()),
+        matrix_based_cfpq(cfg, graph),
+    )
+    with use_backend("threads", 2):
+        actual = (
+            tensor_based_rpq(regex, graph, set(), set()),
+            ms_bfs_based_rpq(regex, graph, {0, 3}, set()),
+            matrix_based_cfpq(cfg, graph),
+        )
+    assert actual == expected
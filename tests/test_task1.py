@@ -0,0 +1,18 @@
+import cfpq_data
+import networkx as nx
+
+from project.task1 import GraphInfo, graph_info, save_two_cycles_graph
+
+
+def test_graph_info():
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("x", "y"))
+    assert graph_info(graph) == GraphInfo(6, 7, {"x", "y"})
+
+
+def test_save_two_cycles_graph(tmp_path):
+    path = tmp_path / "cycles.dot"
+    save_two_cycles_graph(3, 2, ("x", "y"), path)
+    graph = nx.drawing.nx_pydot.read_dot(path)
+    assert graph.number_of_nodes() == 6
+    assert graph.number_of_edges() == 7
+    assert {label for _, _, label in graph.edges(data="label")} == {"x", "y"}
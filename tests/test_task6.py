@@ -0,0 +1,42 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.edge_list_graph import EdgeListGraph
+from project.matrix_index import MatrixIndex
+from project.task6 import cfg_to_weak_normal_form, hellings_based_cfpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(80, labels=["a", "b"], seed=7)
+
+
+@pytest.mark.parametrize(
+    "text", ["S -> a S b S | $", "S -> A B\nA -> a | $\nB -> b B | b", "S -> $"]
+)
+def test_weak_normal_form(text):
+    cfg = CFG.from_text(text)
+    wcnf = cfg_to_weak_normal_form(cfg)
+    for production in wcnf.productions:
+        assert len(production.body) <= 2
+    for word in ["", "ab", "aabb", "abb"]:
+        assert wcnf.contains(word) == cfg.contains(word)
+    assert wcnf.generate_epsilon() == cfg.generate_epsilon()
+
+
+def test_dyck_on_two_cycles():
+    graph = cfpq_data.labeled_two_cycles_graph(2, 1, labels=("a", "b"))
+    answer = hellings_based_cfpq(CFG.from_text("S -> a S b | a b"), graph)
+    assert answer == {(0, 0), (0, 3), (1, 0), (1, 3), (2, 0), (2, 3)}
+
+
+@pytest.mark.parametrize("grammar", ["S -> a S b S | $", "S -> S S | a | b b"])
+def test_graph_representations_agree(graph, grammar, tmp_path):
+    cfg = CFG.from_text(grammar)
+    start_nodes, final_nodes = {0, 1, 2, 3}, set(range(10, 60))
+    expected = hellings_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    compact = EdgeListGraph.from_networkx(graph)
+    assert hellings_based_cfpq(cfg, compact, start_nodes, final_nodes) == expected
+    index = MatrixIndex.build(graph, tmp_path / "index")
+    assert hellings_based_cfpq(cfg, index, start_nodes, final_nodes) == expected
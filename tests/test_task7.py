@@ -0,0 +1,45 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.task6 import WeakNormalFormIndex, hellings_based_cfpq
+from project.task7 import dependency_order, matrix_based_cfpq
+
+GRAMMARS = [
+    "S -> a S b S | $",
+    "S -> A B\nA -> a A | a\nB -> B b | b",
+    "S -> S S | a | b b",
+    "S -> A S B | c\nA -> a\nB -> B b | $",
+]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(100, labels=["a", "b", "c"], seed=11)
+
+
+@pytest.mark.parametrize("grammar", GRAMMARS)
+def test_methods_agree(graph, grammar):
+    cfg = CFG.from_text(grammar)
+    start_nodes, final_nodes = set(range(30)), set(range(20, 100))
+    expected = hellings_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    for method in ["naive", "semi-naive"]:
+        answer = matrix_based_cfpq(cfg, graph, start_nodes, final_nodes, method=method)
+        assert answer == expected
+
+
+def test_dependency_order():
+    grammar = WeakNormalFormIndex(CFG.from_text(GRAMMARS[1]))
+    position = {
+        variable: i
+        for i, component in enumerate(dependency_order(grammar))
+        for variable in component
+    }
+    for head, left, right in grammar.binary:
+        assert position[left] <= position[head]
+        assert position[right] <= position[head]
+
+
+def test_unknown_method(graph):
+    with pytest.raises(ValueError):
+        matrix_based_cfpq(CFG.from_text("S -> a"), graph, method="squaring")
@@ -0,0 +1,40 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import Symbol
+
+from project.task7 import matrix_based_cfpq
+from project.task8 import cfg_to_rsm, ebnf_to_rsm, rsm_to_matrix_fa, tensor_based_cfpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(60, labels=["a", "b"], seed=13)
+
+
+def test_rsm_boxes():
+    rsm = ebnf_to_rsm("S -> A S b | $\nA -> a*")
+    fa, boxes = rsm_to_matrix_fa(rsm)
+    assert set(boxes) == {Symbol("S"), Symbol("A")}
+    assert fa.states_count == sum(len(box.dfa.states) for box in rsm.boxes.values())
+    for starts, finals in boxes.values():
+        assert len(starts) == 1 and finals
+
+
+@pytest.mark.parametrize(
+    "grammar", ["S -> a S b S | $", "S -> A B\nA -> a A | a\nB -> b"]
+)
+@pytest.mark.parametrize("workers", [1, 3])
+def test_matches_matrix_cfpq(graph, grammar, workers):
+    cfg = CFG.from_text(grammar)
+    start_nodes, final_nodes = set(range(20)), set(range(10, 60))
+    expected = matrix_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    answer = tensor_based_cfpq(
+        cfg_to_rsm(cfg), graph, start_nodes, final_nodes, workers=workers
+    )
+    assert answer == expected
+
+
+def test_invalid_workers(graph):
+    with pytest.raises(ValueError):
+        tensor_based_cfpq(ebnf_to_rsm("S -> a"), graph, workers=0)
@@ -0,0 +1,34 @@
+import cfpq_data
+import pytest
+from pyformlang.cfg import CFG
+
+from project.task7 import matrix_based_cfpq
+from project.task8 import cfg_to_rsm, ebnf_to_rsm
+from project.task9 import GllSolver, RsmTables, gll_based_cfpq
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return cfpq_data.labeled_scale_free_graph(80, labels=["a", "b"], seed=17)
+
+
+@pytest.mark.parametrize(
+    "grammar", ["S -> a S b S | $", "S -> A B\nA -> a A | a\nB -> S b | b"]
+)
+def test_matches_matrix_cfpq(graph, grammar):
+    cfg = CFG.from_text(grammar)
+    start_nodes, final_nodes = set(range(25)), set(range(10, 80))
+    expected = matrix_based_cfpq(cfg, graph, start_nodes, final_nodes)
+    assert gll_based_cfpq(cfg_to_rsm(cfg), graph, start_nodes, final_nodes) == expected
+
+
+def test_descriptor_packing():
+    tables = RsmTables(ebnf_to_rsm("S -> a S b | $"))
+    solver = GllSolver(tables, [{} for _ in range(7)])
+    for node in range(3):
+        for vertex in range(7):
+            for state in range(len(tables)):
+                solver.add(state, vertex, node)
+                key = solver.worklist[-1]
+                assert solver.unpack(key) == (state, vertex, node)
+    assert len(solver.visited) == 3 * 7 * len(tables)
@@ -0,0 +1,33 @@
+import cfpq_data
+import networkx as nx
+import pytest
+
+from project.task2 import graph_to_nfa
+from project.task3 import CLOSURE_METHODS, AdjacencyMatrixFA, tensor_based_rpq
+
+
+def chain_graph(length: int) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from((i, i + 1, {"label": "a"}) for i in range(length))
+    return graph
+
+
+@pytest.mark.parametrize("method", CLOSURE_METHODS)
+def test_chain_closure(method):
+    fa = AdjacencyMatrixFA(graph_to_nfa(chain_graph(20), set(), set()))
+    closure = fa.transitive_closure(method)
+    assert closure.nnz == 21 * 22 // 2
+
+
+@pytest.mark.parametrize("method", CLOSURE_METHODS)
+def test_methods_agree(method):
+    graph = cfpq_data.labeled_two_cycles_graph(5, 7, labels=("a", "b"))
+    regex = "a (a | b)* b"
+    expected = tensor_based_rpq(regex, graph, set(), set(), closure="naive")
+    assert tensor_based_rpq(regex, graph, set(), set(), closure=method) == expected
+
+
+def test_unknown_method():
+    fa = AdjacencyMatrixFA(graph_to_nfa(chain_graph(1), set(), set()))
+    with pytest.raises(ValueError):
+        fa.transitive_closure("magic")